@@ -0,0 +1,87 @@
+#  CC-0 2023.
+#  David Strahl, University of Potsdam
+#  Forester: Interactive human-in-the-loop web-based visualization of machine learning trees
+
+"""
+    Benchmark of the rpart node extraction.
+
+    Compares the column based extraction in :mod:`parser.rpart` with the per-node loop
+    that was used before. The rpart frame is generated synthetically, so no R runtime
+    is needed. Run from the repository root with
+
+    .. code-block:: bash
+
+        python -m benchmarks.bench_rpart
+"""
+
+import time
+import numpy as np
+
+from src.parser.rpart import _rpart_columns, _rpart_tree
+from src.parser.utils import _build_tree
+
+from .generators import synthetic_rpart
+
+
+def loop_nodes(frame, splits, features):
+    """ The per-node extraction as it was implemented before the column based one. """
+    n_nodes = len(frame['var'])
+
+    split_index = [0]
+    for i in range(n_nodes):
+        j = frame['ncompete'][i] + frame['nsurrogate'][i] + (frame['var'][i] != '<leaf>')
+        split_index.append(split_index[len(split_index) - 1] + j)
+    split_index.pop()
+
+    class_dist = np.array(frame['yval2'])
+    class_dist = np.split(class_dist, int(len(class_dist) / n_nodes))
+    class_dist = np.transpose(class_dist)
+    n_classes = int((class_dist.shape[1] - 2) / 2)
+
+    nodes = []
+    for i in range(n_nodes):
+        node = {
+            'children': [],
+            'type': 'root' if i == 0 else ('leaf' if frame['var'][i] == '<leaf>' else 'node'),
+            'samples': int(frame['n'][i]),
+            'distribution': [int(s) for s in list(class_dist[i, 1:(n_classes + 1)])],
+            'vote': int(class_dist[i, 0]) - 1
+        }
+
+        if not node['type'] == 'leaf':
+            split = splits[split_index[i]]
+            node['split'] = {
+                'feature': features.index(frame['var'][i]),
+                'operator': '<' if split[1] < 0 else '>',
+                'location': split[3]
+            }
+
+        nodes.append(node)
+
+    return _build_tree(nodes)
+
+
+def column_nodes(frame, splits, features):
+    return _rpart_tree(_rpart_columns(frame, len(frame['var'])), splits, features, []).to_json()['tree']
+
+
+def timeit(function, *args, repeat=3):
+    best = np.inf
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+if __name__ == "__main__":
+    print(f"{'nodes':>10} | {'loop [s]':>10} | {'columns [s]':>11} | {'speedup':>7}")
+    for depth in [6, 10, 14, 16]:
+        frame, splits, features = synthetic_rpart(2 ** (depth + 1) - 1)
+
+        t_loop, expected = timeit(loop_nodes, frame, splits, features)
+        t_cols, result = timeit(column_nodes, frame, splits, features)
+
+        assert result == expected, "column based extraction differs from the loop"
+
+        print(f"{len(frame['var']):>10} | {t_loop:>10.4f} | {t_cols:>11.4f} | {t_loop / t_cols:>6.1f}x")
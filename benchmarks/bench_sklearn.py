@@ -0,0 +1,71 @@
+#  CC-0 2023.
+#  David Strahl, University of Potsdam
+#  Forester: Interactive human-in-the-loop web-based visualization of machine learning trees
+
+"""
+    Benchmark of the scikit-learn importer.
+
+    Writes the arrays of complete binary trees into ``.npz`` files and measures the
+    conversion into the columnar tree and the binary format. scikit-learn is not
+    needed. Run from the repository root with
+
+    .. code-block:: bash
+
+        python -m benchmarks.bench_sklearn
+"""
+
+import os
+import time
+import tempfile
+import numpy as np
+
+from src.parser.Python import _parse_sklearn
+from src.parser.binary import write_tree
+
+
+def synthetic_sklearn(depth, n_classes=3, n_features=10, seed=0):
+    """
+    Creates the arrays of a complete scikit-learn tree with the given depth. The nodes
+    are numbered level by level, which the importer handles like any other order.
+    """
+    rng = np.random.default_rng(seed)
+    n_nodes = 2 ** (depth + 1) - 1
+    n_branches = 2 ** depth - 1
+
+    index = np.arange(n_nodes)
+    is_leaf = index >= n_branches
+
+    value = rng.random((n_nodes, 1, n_classes))
+    value /= value.sum(axis=2, keepdims=True)
+
+    return {
+        'children_left': np.where(is_leaf, -1, 2 * index + 1),
+        'children_right': np.where(is_leaf, -1, 2 * index + 2),
+        'feature': np.where(is_leaf, -2, rng.integers(0, n_features, n_nodes)),
+        'threshold': np.where(is_leaf, -2.0, rng.random(n_nodes)),
+        'value': value,
+        'n_node_samples': rng.integers(1, 1000, n_nodes)
+    }
+
+
+def timeit(function, *args, repeat=3):
+    best = np.inf
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+if __name__ == "__main__":
+    print(f"{'nodes':>10} | {'parse [s]':>10} | {'binary [s]':>10} | {'json [s]':>10}")
+    with tempfile.TemporaryDirectory() as directory:
+        for depth in [10, 15, 19]:
+            path = os.path.join(directory, "tree.npz")
+            np.savez(path, **synthetic_sklearn(depth))
+
+            t_parse, tree = timeit(_parse_sklearn, path)
+            t_binary, _ = timeit(write_tree, tree, os.path.join(directory, "tree.bin"))
+            t_json, _ = timeit(tree.to_json, repeat=1)
+
+            print(f"{len(tree):>10} | {t_parse:>10.4f} | {t_binary:>10.4f} | {t_json:>10.4f}")
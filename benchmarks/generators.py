@@ -0,0 +1,200 @@
+#  CC-0 2023.
+#  David Strahl, University of Potsdam
+#  Forester: Interactive human-in-the-loop web-based visualization of machine learning trees
+
+"""
+    Generators of synthetic trees for the benchmarks.
+
+    All generators create full binary trees with a given number of nodes and one of
+    the following shapes:
+
+    * ``balanced`` - both subtrees of each node have the same size (depth ``log2(n)``)
+    * ``random`` - the size of the left subtree is drawn uniformly (depth ``O(log n)``)
+    * ``chain`` - every split has a leaf as first child (depth ``n / 2``)
+
+    The trees are returned in the form in which the parsers receive them, so no
+    Matlab or R runtime is needed.
+"""
+
+import numpy as np
+
+from src.parser.tree import TreeArrays
+
+SHAPES = ('balanced', 'random', 'chain')
+
+
+def tree_shape(n_nodes, shape="balanced", seed=0):
+    """
+    Creates the structure of a full binary tree in pre-order.
+
+    Parameters
+    ----------
+    n_nodes: int
+        Number of nodes, rounded up to the next odd number.
+    shape: str
+        One of :data:`SHAPES`.
+    seed: int
+        Seed of the random shape.
+
+    Returns
+    -------
+    tuple:
+        Whether each node is a branch and the depth of each node, both in pre-order.
+    """
+    if shape not in SHAPES:
+        raise ValueError(f"Unknown shape {shape}, use one of {', '.join(SHAPES)}")
+
+    rng = np.random.default_rng(seed)
+    n_branches = max(n_nodes, 1) // 2
+
+    # number of branches in the left subtree of a node with m branches
+    if shape == 'balanced':
+        split = lambda m: (m - 1) // 2
+    elif shape == 'random':
+        split = lambda m: int(rng.integers(0, m))
+    else:
+        split = lambda m: 0
+
+    is_branch, depths = [], []
+    stack = [(n_branches, 0)]
+    while stack:
+        m, depth = stack.pop()
+        is_branch.append(m > 0)
+        depths.append(depth)
+        if m > 0:
+            k = split(m)
+            stack.append((m - 1 - k, depth + 1))
+            stack.append((k, depth + 1))
+
+    return np.asarray(is_branch), np.asarray(depths)
+
+
+def synthetic_fitctree(n_nodes, n_classes=3, n_features=10, shape="balanced", n_observations=0, seed=0):
+    """
+    Creates the ``jsonencode`` document of a ``fitctree`` object.
+
+    The nodes are numbered level by level as in Matlab. With `n_observations`, the
+    document also holds training data (``X``, ``Y`` and ``W``), which the parser skips.
+
+    Returns
+    -------
+    dict:
+        The document, which can be written with ``json.dump``.
+    """
+    rng = np.random.default_rng(seed)
+    is_branch, depths = tree_shape(n_nodes, shape, seed)
+    parent, left, right = TreeArrays.links_from_preorder(is_branch)
+    n_nodes = len(is_branch)
+
+    # number of each node in level order, starting at one
+    order = np.lexsort((np.arange(n_nodes), depths))
+    number = np.empty(n_nodes, dtype=np.int64)
+    number[order] = np.arange(1, n_nodes + 1)
+
+    def level_order(values):
+        return np.asarray(values)[order]
+
+    children = np.where(is_branch[:, None], np.column_stack([number[left], number[right]]), 0)
+    counts = rng.integers(0, 100, (n_nodes, n_classes))
+    probability = counts / np.maximum(counts.sum(axis=1, keepdims=True), 1)
+    predictor = np.where(is_branch, rng.integers(1, n_features + 1, n_nodes), 0)
+    cut_point = np.where(is_branch, rng.random(n_nodes), np.nan)
+
+    document = {}
+    if n_observations > 0:
+        document['Y'] = rng.integers(0, n_classes, n_observations).tolist()
+        document['X'] = rng.random((n_observations, n_features)).tolist()
+        document['W'] = np.full(n_observations, 1 / n_observations).tolist()
+
+    document.update({
+        'NumObservations': int(counts[0].sum()),
+        'PredictorNames': [f"x{i}" for i in range(n_features)],
+        'ClassNames': [f"class {i}" for i in range(n_classes)],
+        'Children': level_order(children).tolist(),
+        'ClassCount': level_order(counts).tolist(),
+        'ClassProbability': level_order(probability).tolist(),
+        'CutPoint': [None if np.isnan(c) else c for c in level_order(cut_point).tolist()],
+        'CutPredictorIndex': level_order(predictor).tolist(),
+        'NodeSize': level_order(counts.sum(axis=1)).tolist(),
+        'NumNodes': n_nodes,
+        'Parent': level_order(np.where(parent >= 0, number[parent], 0)).tolist()
+    })
+
+    return document
+
+
+def synthetic_rpart(n_nodes, n_classes=3, n_features=10, shape="balanced", seed=0):
+    """
+    Creates the frame and split matrix of an rpart tree.
+
+    The frame is given in the same form as it is extracted from R, i.e. as a dictionary
+    of lists with ``yval2`` flattened in column-major order.
+
+    Returns
+    -------
+    tuple:
+        The frame, the split matrix and the names of the features.
+    """
+    rng = np.random.default_rng(seed)
+    features = [f"x{i}" for i in range(n_features)]
+
+    is_split, _ = tree_shape(n_nodes, shape, seed)
+    n_nodes = len(is_split)
+
+    var = np.where(is_split, np.array(features)[rng.integers(0, n_features, n_nodes)], '<leaf>')
+    ncompete = np.where(is_split, rng.integers(0, 4, n_nodes), 0)
+    nsurrogate = np.where(is_split, rng.integers(0, 5, n_nodes), 0)
+
+    counts = rng.integers(0, 100, (n_nodes, n_classes))
+    yval2 = np.hstack([
+        counts.argmax(axis=1)[:, None] + 1,
+        counts,
+        counts / np.maximum(counts.sum(axis=1, keepdims=True), 1),
+        np.full((n_nodes, 1), 0.5)
+    ])
+
+    n_splits = int((ncompete + nsurrogate + is_split).sum())
+    splits = np.column_stack([
+        rng.integers(1, 100, n_splits),
+        rng.choice([-1, 1], n_splits),
+        rng.random(n_splits),
+        rng.random(n_splits) * 10,
+        np.zeros(n_splits)
+    ]).astype(float)
+
+    frame = {
+        'var': var.tolist(),
+        'n': counts.sum(axis=1).tolist(),
+        'ncompete': ncompete.tolist(),
+        'nsurrogate': nsurrogate.tolist(),
+        'yval2': yval2.T.flatten().tolist()
+    }
+
+    return frame, splits, features
+
+
+def synthetic_nodes(n_nodes, n_classes=3, n_features=10, shape="balanced", seed=0):
+    """
+    Creates the node dictionaries of a tree in pre-order, as they are passed to
+    :func:`parser.utils._build_tree`.
+    """
+    rng = np.random.default_rng(seed)
+    is_branch, _ = tree_shape(n_nodes, shape, seed)
+
+    counts = rng.integers(0, 100, (len(is_branch), n_classes))
+    features = rng.integers(0, n_features, len(is_branch))
+
+    nodes = []
+    for i, (branch, distribution, feature) in enumerate(zip(is_branch.tolist(), counts.tolist(), features.tolist())):
+        node = {
+            'children': [],
+            'type': 'root' if i == 0 else ('node' if branch else 'leaf'),
+            'samples': sum(distribution),
+            'distribution': distribution,
+            'vote': int(np.argmax(distribution))
+        }
+        if branch:
+            node['split'] = {'feature': feature, 'operator': '<', 'location': 0.5}
+        nodes.append(node)
+
+    return nodes
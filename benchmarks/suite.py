@@ -0,0 +1,356 @@
+#  CC-0 2023.
+#  David Strahl, University of Potsdam
+#  Forester: Interactive human-in-the-loop web-based visualization of machine learning trees
+
+"""
+    Benchmark suite of the parsers.
+
+    Each case is measured on synthetic trees of several sizes and shapes, see
+    :mod:`benchmarks.generators`. Wall time is the best of several runs, peak memory is
+    the high-water mark of the resident set size while the case runs. Every case runs
+    in its own process, so that the memory of one case does not affect the next one.
+
+    Results are written as JSON and can be compared against a stored baseline. Run
+    from the repository root with
+
+    .. code-block:: bash
+
+        # measure and store a baseline
+        python -m benchmarks.suite --save benchmarks/baselines/local.json
+
+        # compare against the baseline, fails when a case got slower
+        python -m benchmarks.suite --compare benchmarks/baselines/local.json
+
+    Input files of the cases are written to a temporary directory before the case starts.
+"""
+
+import os
+import gc
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+import multiprocessing
+import numpy as np
+
+from datetime import datetime
+
+from . import generators
+
+# sizes of the trees in number of nodes
+SIZES = (1_000, 100_000, 1_000_000)
+
+# version of the format of the result files
+VERSION = 1
+
+
+def _setup_parse_fitctree(directory, n_nodes, shape):
+    """ Parses a Matlab ``jsonencode`` document with :func:`parser.parse`. """
+    path = os.path.join(directory, f"fitctree-{shape}-{n_nodes}.json")
+    if not os.path.isfile(path):
+        with open(path, "w") as file:
+            json.dump(generators.synthetic_fitctree(n_nodes, shape=shape), file)
+
+    def run():
+        from src.parser import parse
+        return parse(path, shape="arrays", type="json", vendor="matlab", origin="fitctree")
+
+    return run
+
+
+def _setup_rpart_frame(directory, n_nodes, shape):
+    """ Creates the tree from the columns of an rpart frame. """
+    from src.parser.rpart import _rpart_columns, _rpart_tree
+
+    frame, splits, features = generators.synthetic_rpart(n_nodes, shape=shape)
+
+    def run():
+        return _rpart_tree(_rpart_columns(frame, len(frame['var'])), splits, features, [])
+
+    return run
+
+
+def _setup_build_tree(directory, n_nodes, shape):
+    """ Links the node dictionaries of a tree in pre-order with :func:`parser.utils._build_tree`. """
+    from src.parser.utils import _build_tree
+
+    nodes = generators.synthetic_nodes(n_nodes, shape=shape)
+
+    def run():
+        # the children are linked into the dictionaries, they are reset for each run
+        for node in nodes:
+            node['children'] = []
+        return _build_tree(nodes)
+
+    return run
+
+
+def _tree(directory, n_nodes, shape):
+    from src.parser.rpart import _rpart_columns, _rpart_tree
+
+    frame, splits, features = generators.synthetic_rpart(n_nodes, shape=shape)
+    return _rpart_tree(_rpart_columns(frame, len(frame['var'])), splits, features, [])
+
+
+def _setup_json_dump(directory, n_nodes, shape):
+    """ Writes a tree in the flat shape with :func:`parser.dump`. """
+    from src.parser.tree import dump
+
+    tree = _tree(directory, n_nodes, shape)
+    path = os.path.join(directory, f"dump-{os.getpid()}.json")
+
+    def run():
+        with open(path, "w") as file:
+            dump(tree, file, shape="flat")
+
+    return run
+
+
+def _setup_json_load(directory, n_nodes, shape):
+    """ Reads a tree in the flat shape and converts it into arrays. """
+    from src.parser.tree import dump, TreeArrays
+
+    path = os.path.join(directory, f"flat-{shape}-{n_nodes}.json")
+    if not os.path.isfile(path):
+        with open(path, "w") as file:
+            dump(_tree(directory, n_nodes, shape), file, shape="flat")
+
+    def run():
+        with open(path) as file:
+            return TreeArrays.from_json(json.load(file))
+
+    return run
+
+
+def _setup_json_nested(directory, n_nodes, shape):
+    """ Encodes a tree in the nested shape with :func:`parser.iterencode`. """
+    from src.parser.tree import iterencode
+
+    tree = _tree(directory, n_nodes, shape)
+
+    def run():
+        return sum(len(part) for part in iterencode(tree, "nested"))
+
+    return run
+
+
+# the cases of the suite, each creates its input and returns the function that is measured
+CASES = {
+    'parse.fitctree': _setup_parse_fitctree,
+    'rpart.frame': _setup_rpart_frame,
+    'build_tree': _setup_build_tree,
+    'json.dump': _setup_json_dump,
+    'json.load': _setup_json_load,
+    'json.nested': _setup_json_nested
+}
+
+
+def _reset_peak():
+    """ Resets the high-water mark of the resident set size, only possible on Linux. """
+    try:
+        with open("/proc/self/clear_refs", "w") as file:
+            file.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def _memory():
+    """
+    Returns the resident set size and its high-water mark in bytes. The resident set
+    size is `None` when it is not known.
+    """
+    try:
+        with open("/proc/self/status") as file:
+            status = dict(line.split(":", 1) for line in file if ":" in line)
+        return int(status["VmRSS"].split()[0]) * 1024, int(status["VmHWM"].split()[0]) * 1024
+    except (OSError, KeyError):
+        pass
+
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # the size is given in kilobytes on Linux and in bytes on macOS
+    return None, peak if sys.platform == "darwin" else peak * 1024
+
+
+def _measure(case, directory, n_nodes, shape, repeat, queue):
+    """ Runs a case within a new process and puts the result into the queue. """
+    try:
+        run = CASES[case](directory, n_nodes, shape)
+
+        # the first run also measures the memory, relative to the memory
+        # that is used before, e.g. by the input of the case
+        gc.collect()
+        exact = _reset_peak()
+        rss, before = _memory()
+        start = time.perf_counter()
+        result = run()
+        seconds = time.perf_counter() - start
+        _, after = _memory()
+        del result
+
+        peak = after - (rss if exact and rss is not None else before)
+
+        for _ in range(repeat - 1):
+            start = time.perf_counter()
+            run()
+            seconds = min(seconds, time.perf_counter() - start)
+
+        queue.put({'seconds': seconds, 'peak': peak, 'exact': exact})
+    except Exception as e:
+        queue.put({'error': f"{type(e).__name__}: {e}"})
+
+
+def measure(case, directory, n_nodes, shape="balanced", repeat=3):
+    """
+    Measures a case of the suite in a new process.
+
+    Parameters
+    ----------
+    case: str
+        The name of the case in :data:`CASES`.
+    directory: str
+        Directory for the input files.
+    n_nodes: int
+        Number of nodes of the tree.
+    shape: str
+        The shape of the tree, see :data:`generators.SHAPES`.
+    repeat: int
+        Number of runs, the time of the fastest run is reported.
+
+    Returns
+    -------
+    dict:
+        The result with the wall time in seconds, the time per node in microseconds and
+        the peak memory in bytes above the memory used before the case started. When the
+        high-water mark can not be reset, the peak only counts memory above the previous
+        high-water mark (`peak_exact` is false).
+    """
+    context = multiprocessing.get_context("spawn")
+    queue = context.Queue()
+    process = context.Process(target=_measure, args=(case, directory, n_nodes, shape, repeat, queue))
+    process.start()
+    result = queue.get()
+    process.join()
+
+    if 'error' in result:
+        raise RuntimeError(f"Case {case} failed for {n_nodes} nodes: {result['error']}")
+
+    # the trees have an odd number of nodes
+    n_nodes = max(n_nodes, 1) // 2 * 2 + 1
+
+    return {
+        'case': case,
+        'nodes': n_nodes,
+        'shape': shape,
+        'seconds': result['seconds'],
+        'per_node_us': result['seconds'] / n_nodes * 1e6,
+        'peak_bytes': int(result['peak']),
+        'peak_exact': result['exact']
+    }
+
+
+def run_suite(cases=None, sizes=SIZES, shapes=('balanced',), repeat=3, log=print):
+    """
+    Runs the cases of the suite for all sizes and shapes.
+
+    Returns
+    -------
+    dict:
+        The results with information on the machine, as stored by ``--save``.
+    """
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for case in cases or CASES:
+            for shape in shapes:
+                for n_nodes in sizes:
+                    result = measure(case, directory, n_nodes, shape, repeat)
+                    results.append(result)
+                    log(_format(result))
+
+    return {
+        'version': VERSION,
+        'created': datetime.now().isoformat(),
+        'machine': {
+            'platform': platform.platform(),
+            'processor': platform.processor(),
+            'python': platform.python_version(),
+            'numpy': np.__version__
+        },
+        'results': results
+    }
+
+
+def compare(results, baseline, tolerance=0.25, min_seconds=0.02, min_bytes=4 * 2 ** 20):
+    """
+    Compares results with a baseline.
+
+    A case is a regression when its time or its peak memory grew by more than the
+    `tolerance` (relative) and more than `min_seconds` or `min_bytes` (absolute).
+    The absolute limits keep small cases from failing due to noise.
+
+    Returns
+    -------
+    list:
+        The regressions as a list of messages, empty when there are none.
+    """
+    stored = {(r['case'], r['nodes'], r['shape']): r for r in baseline['results']}
+
+    regressions = []
+    for result in results['results']:
+        reference = stored.get((result['case'], result['nodes'], result['shape']))
+        if reference is None:
+            continue
+
+        name = f"{result['case']} ({result['nodes']} nodes, {result['shape']})"
+        for key, limit, unit in [('seconds', min_seconds, 's'), ('peak_bytes', min_bytes, ' bytes')]:
+            old, new = reference[key], result[key]
+            if new > old * (1 + tolerance) and new - old > limit:
+                regressions.append(f"{name}: {key} grew from {old:.4g}{unit} to {new:.4g}{unit}")
+
+    return regressions
+
+
+def _format(result):
+    return f"{result['case']:>15} | {result['shape']:>8} | {result['nodes']:>9} | " \
+           f"{result['seconds']:>9.4f} s | {result['per_node_us']:>8.3f} us/node | " \
+           f"{result['peak_bytes'] / 2 ** 20:>8.1f} MiB"
+
+
+def main(argv=None):
+    arguments = argparse.ArgumentParser(description="Benchmark suite of the Forester parsers.")
+    arguments.add_argument("--cases", nargs="+", choices=list(CASES), help="Cases to run (default all)")
+    arguments.add_argument("--sizes", nargs="+", type=int, default=SIZES, help="Number of nodes of the trees")
+    arguments.add_argument("--shapes", nargs="+", choices=generators.SHAPES, default=['balanced'])
+    arguments.add_argument("--repeat", type=int, default=3, help="Number of runs of each case")
+    arguments.add_argument("--save", help="Path of a JSON file to store the results")
+    arguments.add_argument("--compare", help="Path of a JSON file with baseline results")
+    arguments.add_argument("--tolerance", type=float, default=0.25, help="Allowed relative growth")
+    args = arguments.parse_args(argv)
+
+    print(f"{'case':>15} | {'shape':>8} | {'nodes':>9} | {'time':>11} | {'per node':>16} | {'peak':>12}")
+    results = run_suite(args.cases, args.sizes, args.shapes, args.repeat)
+
+    if args.save:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save)), exist_ok=True)
+        with open(args.save, "w") as file:
+            json.dump(results, file, indent=2)
+
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+
+        regressions = compare(results, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            return 1
+        print(f"No regressions against {args.compare}")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
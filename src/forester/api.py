@@ -4,21 +4,37 @@
 
 import os
 import json
-from flask import Blueprint, render_template, current_app, jsonify, request, Response, make_response, url_for
+import shutil
+import tempfile
+from flask import Blueprint, render_template, current_app, jsonify, request, Response, make_response, url_for, abort
 from datetime import datetime
 
 import parser
-from . import PACKAGE_PATH
+from . import PACKAGE_PATH, config
 from .database import *
+from .database.sqlite import SQLiteDatabase
 
 
 API = Blueprint("api", __name__, url_prefix="/api", template_folder="./api_templates", static_folder="./api_static")
 
+# shapes in which trees are sent, see parser.tree
+SHAPES = ("nested", "flat")
+
+
+def r_workers():
+    """ The number of R workers, the environment variable FORESTER_R_WORKERS takes precedence over the config. """
+    return int(os.environ.get("FORESTER_R_WORKERS", config.get("r_workers", parser.R_POOL.size)))
+
 
 def load_database():
     # start the database
     global database
-    database = Database(os.path.join(PACKAGE_PATH, "./instance"))
+    # projects are stored with TinyDB or, for many projects, with SQLite
+    backend = SQLiteDatabase if config.get("database", "tinydb") == "sqlite" else Database
+    database = backend(os.path.join(PACKAGE_PATH, "./instance"))
+
+    # number of worker processes that parse R files
+    parser.R_POOL.resize(r_workers())
 
     # purge the database when the app is in debug mode
     # TODO: comment this out for roll-out
@@ -60,20 +76,163 @@ def projects():
     return jsonify(database.get_projects())
 
 
+def _shape():
+    """ The shape of the tree requested with `?shape=`, nested by default. """
+    shape = request.args.get("shape", "nested")
+    if shape not in SHAPES:
+        abort(make_response(f"Unknown shape {shape}, use one of {', '.join(SHAPES)}", 400))
+    return shape
+
+
+def _encode_tree(tree, shape):
+    """ Encodes a tree in the given shape, nested trees are encoded without recursion. """
+    if shape == "flat":
+        return json.dumps(parser.flatten(tree))
+    return "".join(parser.iterencode(tree))
+
+
+def _tree_response(tree: parser.TreeArrays):
+    return Response(_encode_tree(tree.to_flat(), _shape()), status=200, mimetype="application/json")
+
+
 @API.route("/project/<uuid>", methods=["GET"])
 def project(uuid):
+    """ Returns the tree and the saved state of a project. With `?shape=flat`, the tree is sent as a list of nodes. """
+    shape = _shape()
 
     # retrieve the project for this uuid
     project = database.get_project(uuid)
 
-    # prepare the data to send to the editor
-    data = {
-        "tree": project.open_as_json("tree"),
-        "save": project.open_as_json("save")
-    }
+    # the stored files are already JSON, they are sent without decoding them,
+    # trees stored flat are encoded once in the nested shape and kept as a file
+    if shape == "nested":
+        tree = project.open_as_nested()
+    else:
+        tree = project.open_as_bytes("tree")
+        if tree is not None and parser.json_version(tree) < 2:
+            tree = _encode_tree(json.loads(tree), shape).encode()
+    save = project.open_as_bytes("save")
+
+    data = b'{"tree": ' + (tree or b'null') + b', "save": ' + (save or b'null') + b'}'
+
+    return Response(data, status=200, mimetype="application/json")
+
+
+@API.route("/project/<uuid>/stats", methods=["GET"])
+def project_stats(uuid):
+    """ Returns summary statistics of the tree of a project. """
+    project = database.get_project(uuid)
+    return jsonify(project.open_as_arrays().stats())
+
+
+@API.route("/project/<uuid>/subtree/<int:node>", methods=["GET"])
+def project_subtree(uuid, node):
+    """ Returns the subtree below a node, the nodes are numbered in pre-order starting with the root at zero. """
+    project = database.get_project(uuid)
+    tree = project.open_as_arrays()
+
+    if node >= len(tree):
+        return make_response(f"Node {node} is not in the tree", 404)
+
+    return _tree_response(tree.subtree(node))
+
+
+@API.route("/project/<uuid>/pruning", methods=["GET"])
+def project_pruning(uuid):
+    """ Returns the pruning sequence of a project, the complexity parameter and the number of nodes of each level. """
+    project = database.get_project(uuid)
+    tree = project.open_as_arrays()
+
+    if tree.prune is None:
+        return make_response(f"No pruning sequence recorded for project {project.name}", 404)
+
+    return jsonify(parser.pruning_sequence(tree))
+
+
+@API.route("/project/<uuid>/pruned", methods=["GET"])
+def project_pruned(uuid):
+    """
+        Returns the tree of a project pruned with the complexity parameter of its pruning sequence
+        (`?alpha=` for Matlab, `?cp=` for rpart) or to a `?level=` of the sequence. Each level is
+        only pruned once.
+    """
+    project = database.get_project(uuid)
+    tree = project.open_as_arrays()
+
+    if tree.prune is None:
+        return make_response(f"No pruning sequence recorded for project {project.name}", 404)
+
+    parameter = tree.meta['pruning']['parameter']
+    if 'level' in request.args:
+        level = request.args.get('level', type=int)
+    elif parameter in request.args:
+        value = request.args.get(parameter, type=float)
+        level = None if value is None else parser.pruning_level(tree, value)
+    else:
+        return make_response(f"Give the {parameter} or the level of pruning", 400)
+
+    n_levels = len(tree.meta['pruning']['values'])
+    if level is None or not 0 <= level < n_levels:
+        return make_response(f"The level of pruning must be an integer from 0 to {n_levels - 1}", 400)
+
+    return _tree_response(project.open_pruned(level))
 
-    # return json encoded data
-    return data, 200
+
+@API.route("/project/<uuid>/rows/<int:node>", methods=["GET"])
+def project_rows(uuid, node):
+    """
+        Returns the ids of the training rows that ended up in the subtree of a node, numbered
+        as the subtree. A range of the rows is selected with `?offset=` and `?limit=`.
+    """
+    project = database.get_project(uuid)
+    membership = project.open_membership()
+
+    if membership is None:
+        return make_response(f"No training rows recorded for project {project.name}", 404)
+    if node >= len(membership):
+        return make_response(f"Node {node} is not in the tree", 404)
+
+    rows = membership[node]
+    offset = request.args.get("offset", 0, type=int)
+    limit = request.args.get("limit", len(rows), type=int)
+
+    return jsonify({
+        'node': node,
+        'samples': len(rows),
+        'offset': offset,
+        'rows': rows[offset:offset + limit].tolist()
+    })
+
+
+@API.route("/project/<uuid>/timings", methods=["GET"])
+def project_timings(uuid):
+    """ Returns the duration, number of nodes and bytes of each stage of parsing the file of a project. """
+    project = database.get_project(uuid)
+    timings = project.open_as_json("timings")
+
+    if timings is None:
+        return make_response(f"No timings recorded for project {project.name}", 404)
+
+    return jsonify(timings)
+
+
+@API.route("/project/<uuid>/trees", methods=["GET"])
+def project_trees(uuid):
+    """ Returns the number and sizes of the trees of an ensemble project. """
+    project = database.get_project(uuid)
+    return jsonify(project.open_ensemble().stats())
+
+
+@API.route("/project/<uuid>/trees/<int:index>", methods=["GET"])
+def project_tree(uuid, index):
+    """ Returns a single tree of an ensemble project, without reading the other trees. """
+    project = database.get_project(uuid)
+    ensemble = project.open_ensemble()
+
+    if index >= len(ensemble):
+        return make_response(f"Tree {index} is not in the ensemble", 404)
+
+    return _tree_response(ensemble[index])
 
 
 @API.route("/projects", methods=["POST"])
@@ -84,11 +243,9 @@ def new_project():
 
     print(form)
 
-    # path where the file will be saved
-    file_path = os.path.join(database.temp_path, file.filename)
-
-    # path where the parsed tree will be saved
-    tree_path = os.path.join(database.temp_path, "tree.json")
+    # path where the file will be saved, each upload has its own directory
+    directory = tempfile.mkdtemp(dir=database.temp_path)
+    file_path = os.path.join(directory, os.path.basename(file.filename))
 
     try:
         # save the file
@@ -97,8 +254,13 @@ def new_project():
         file.save(file_path)
         file.close()
 
-        # create the project
-        database.create_project_from_vendor(name, file_path, **form)
+        # create the project, ensembles are stored with all their trees
+        if form.pop("ensemble", False):
+            database.create_ensemble_from_vendor(name, file_path, **form)
+        else:
+            project = database.create_project_from_vendor(name, file_path, **form)
+            if project is not None:
+                logger.info(f"Timings of project {name}: {json.dumps(project.open_as_json('timings'))}")
 
         return make_response("Success", 200)
 
@@ -106,8 +268,7 @@ def new_project():
         logger.error(e)
         return make_response(str(e), 500)
     finally:
-        if os.path.exists(file_path):
-            os.remove(file_path)
+        shutil.rmtree(directory, ignore_errors=True)
 
     return make_response("FAILED", 500)
 
@@ -160,11 +321,13 @@ def formats():
 
     for fmt in fmts:
         key = f"{fmt['type']}.{fmt['vendor']}.{fmt['origin']}".lower()
-        if key != "json.forester.export" and not parser.has(key):
+        ensemble = fmt.get("ensemble", False)
+        # only checks whether the parsing module can be imported, without importing it
+        if not parser.available(key, ensemble):
             logger.warning(f"No parsing module found for format {key}")
             fmt["deprecated"] = True
             fmt["note"] = f"Forester will be unable to parse them due to an internal error!" \
-                if parser.error_message(key) is None else parser.error_message(key)
+                if parser.error_message(key, ensemble) is None else parser.error_message(key, ensemble)
 
     return jsonify(fmts)
 
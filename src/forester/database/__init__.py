@@ -6,14 +6,31 @@ import os.path
 import shutil
 import uuid
 
+from contextlib import contextmanager
 from loguru import logger
-from tinydb import TinyDB, where, Query
+from tinydb import TinyDB
 
 from .project import Project
+from .index import ProjectIndex
+from .storage import AtomicJSONStorage, WriteBehindMiddleware
+from .cache import ParseCache
 from .errors import *
 
 
 class Database:
+	"""
+		Database of the projects, stored with TinyDB in *database.json*.
+
+		All access to the stored entries goes through a few private methods (`_open`, `_all`,
+		`_find`, `_insert`, ...), so that other backends only need to replace these, see
+		:class:`forester.database.sqlite.SQLiteDatabase`. Steps that belong together are
+		grouped with :meth:`transaction`. Projects are found by their uuid or name through
+		an in-memory index, see :class:`ProjectIndex`. Changes are written to the file
+		in groups and atomically, see :class:`WriteBehindMiddleware`.
+	"""
+
+	# name of the database file in the directory
+	file_name = "database.json"
 
 	# methods to validate the file system
 	from .validate import _cross_validate, _validate_directory
@@ -22,27 +39,43 @@ class Database:
 	from .examples import load_examples
 
 	# methods to create projects from files
-	from .projects import create_project_from_files, create_project_from_vendor
+	from .projects import create_project_from_files, create_project_from_vendor, create_ensemble_from_vendor
 
 	root_path = None
 	base_path = None
 	temp_path = None
 	data_path = None
+	cache_path = None
 
 	database = None
+	storage = None
+	index = None
+	cache = None
 
-	def __init__(self, directory, table_name="projects", delete_unlinked=True, clean=False) -> None:
+	def __init__(self, directory, table_name="projects", delete_unlinked=True, clean=False,
+	             cache_size=256 * 2 ** 20, write_delay=1.0, max_writes=64) -> None:
+
+		# changes of the database file are written together after `write_delay`
+		# seconds or `max_writes` changes, see WriteBehindMiddleware
+		self.write_delay = write_delay
+		self.max_writes = max_writes
 
 		# create the different paths
 		self.root_path = directory
-		self.base_path = os.path.normpath(os.path.join(directory, "database.json"))
+		self.base_path = os.path.normpath(os.path.join(directory, self.file_name))
 		self.temp_path = os.path.normpath(os.path.join(directory, "temp"))
 		self.data_path = os.path.normpath(os.path.join(directory, "data"))
+		self.cache_path = os.path.normpath(os.path.join(directory, "cache"))
 
-		for path in [self.base_path, self.temp_path, self.data_path]:
+		# the SQLite database keeps its write-ahead log next to the file
+		logs = [self.base_path + "-wal", self.base_path + "-shm"]
+		for path in [self.base_path, *logs, self.temp_path, self.data_path, self.cache_path]:
 			if os.path.exists(path) and clean:
 				logger.warning(f"Clean startup: Deleted {path}")
-				shutil.rmtree(path, ignore_errors=True)
+				if os.path.isdir(path):
+					shutil.rmtree(path, ignore_errors=True)
+				else:
+					os.remove(path)
 
 		# add the directories if they not already exists
 		for path in [self.root_path, self.temp_path, self.data_path]:
@@ -50,9 +83,11 @@ class Database:
 				logger.info(f"Created {path}")
 				os.mkdir(path)
 
-		# create the TinyDB database
-		database = TinyDB(self.base_path)
-		self.database = database.table(table_name)
+		# cache of parsed trees
+		self.cache = ParseCache(self.cache_path, max_size=cache_size)
+
+		# open the database
+		self._open(table_name)
 
 		# validate the directory
 		self._validate_directory(delete=delete_unlinked)
@@ -66,10 +101,10 @@ class Database:
 		"""
 
 		# number of entries
-		n = len(self.database.all())
+		n = self.size()
 
 		# clear the database
-		self.database.truncate()
+		self._truncate()
 
 		# remove all the folders in the project directory.
 		try:
@@ -82,7 +117,27 @@ class Database:
 		logger.warning(f"Purged {n} entries from the database.")
 
 	def size(self):
-		return len(self.database.all())
+		return self._count()
+
+	@contextmanager
+	def transaction(self):
+		"""
+			Groups several steps on the database, which are then stored together.
+
+			The changes of all steps are written to *database.json* together when the
+			transaction ends. Steps are not rolled back, only backends with transactions
+			do so. Transactions may be nested, only the outermost one is stored.
+		"""
+		with self.storage.group():
+			yield self
+
+	def flush(self):
+		""" Writes the changes that are not yet written to the database file. """
+		self.storage.flush()
+
+	def close(self):
+		""" Writes all changes and closes the database file. """
+		self.storage.close()
 
 	def has_project(self, name_or_uuid, uuid_version=4):
 		"""
@@ -104,9 +159,9 @@ class Database:
 		try:
 			# check if name_or_uuid is uuid
 			uuid.UUID(name_or_uuid, version=uuid_version)
-			return self.database.contains(where('uuid') == name_or_uuid)
+			return self._contains('uuid', name_or_uuid)
 		except ValueError:
-			return self.database.contains(where('name') == name_or_uuid)
+			return self._contains('name', name_or_uuid)
 
 	def get_project(self, name_or_uuid, uuid_version=4) -> Project:
 		"""
@@ -134,9 +189,9 @@ class Database:
 		try:
 			# check if name_or_uuid is uuid
 			uuid.UUID(name_or_uuid, version=uuid_version)
-			query_result = self.database.get(where('uuid') == name_or_uuid)
+			query_result = self._find('uuid', name_or_uuid)
 		except ValueError:
-			query_result = self.database.get(where('name') == name_or_uuid)
+			query_result = self._find('name', name_or_uuid)
 
 		# raise a database exception if there is no entry for this query
 		if query_result is not None:
@@ -163,7 +218,7 @@ class Database:
 			List of all projects in the database.
 
 		"""
-		return [Project.from_dict(project) for project in self.database.all()]
+		return [Project.from_dict(project) for project in self._all()]
 
 	def remove_project(self, name_or_uuid, uuid_version=4):
 		"""
@@ -180,12 +235,13 @@ class Database:
 		--------
 		:meth:`database.has_project`
 		"""
-		# get the project
-		# this raises a DatabaseException when the project is not available
-		project = self.get_project(name_or_uuid)
+		with self.transaction():
+			# get the project
+			# this raises a DatabaseException when the project is not available
+			project = self.get_project(name_or_uuid)
 
-		# remove an entry
-		self.database.remove(where('uuid') == project.uuid)
+			# remove an entry
+			self._remove(project.uuid)
 
 		# remove the folder from the underlying file structure, too
 		shutil.rmtree(os.path.join(self.data_path, project.name), ignore_errors=True)
@@ -209,23 +265,24 @@ class Database:
 			The added project.
 
 		"""
-		# check if project already exists
-		if self.has_project(project.uuid) or self.has_project(project.name):
-			raise ProjectAlreadyExistsException(
-				f"A project with id {project.uuid} or name {project.name} already exists.")
+		with self.transaction():
+			# check if project already exists
+			if self.has_project(project.uuid) or self.has_project(project.name):
+				raise ProjectAlreadyExistsException(
+					f"A project with id {project.uuid} or name {project.name} already exists.")
 
-		# check if project directory exists
-		if not os.path.isdir(project.path):
-			raise DatabaseCorruptionError(f"Project {project} does not have a directory yet.")
+			# check if project directory exists
+			if not os.path.isdir(project.path):
+				raise DatabaseCorruptionError(f"Project {project} does not have a directory yet.")
 
-		# check if all files exist
-		for filename in project.files.values():
-			path = os.path.join(project.path, filename)
-			if not os.path.isfile(path):
-				raise DatabaseCorruptionError(f"File {filename} missing in project directory.")
+			# check if all files exist
+			for filename in project.files.values():
+				path = os.path.join(project.path, filename)
+				if not os.path.isfile(path):
+					raise DatabaseCorruptionError(f"File {filename} missing in project directory.")
 
-		# add the project to the database
-		self.database.insert(project.to_dict())
+			# add the project to the database
+			self._insert(project.to_dict())
 
 		logger.info(f"{project} created")
 
@@ -233,7 +290,7 @@ class Database:
 		return project
 
 	def update(self, project: Project):
-		self.database.update(project.to_dict(), Query().uuid == project.uuid)
+		self._update(project.to_dict())
 
 	def add_file_to_project(self, path, project, **kwargs):
 
@@ -243,4 +300,54 @@ class Database:
 		# update the database
 		self.update(project)
 
-		logger.info(f"Added file {path} to {project}")
\ No newline at end of file
+		logger.info(f"Added file {path} to {project}")
+
+	# access to the stored entries, each entry is the dictionary of a project
+
+	def _open(self, table_name):
+		""" Opens the table of the projects and builds the index of their uuids and names. """
+		database = TinyDB(self.base_path, storage=WriteBehindMiddleware(AtomicJSONStorage, delay=self.write_delay,
+		                                                                 max_writes=self.max_writes))
+		self.storage = database.storage
+		self.database = database.table(table_name)
+		self.index = ProjectIndex(self.database, self.storage.changes)
+
+	def _count(self) -> int:
+		self.index.refresh()
+		return len(self.index.entries)
+
+	def _all(self) -> list:
+		return self.database.all()
+
+	def _find(self, key, value):
+		""" Returns the first entry whose `key` (``uuid`` or ``name``) has the given value, or `None`. """
+		doc_id = self.index.find(key, value)
+		return self.database.get(doc_id=doc_id) if doc_id is not None else None
+
+	def _contains(self, key, value) -> bool:
+		return self.index.find(key, value) is not None
+
+	def _insert(self, entry):
+		self.index.refresh()
+		self.index.add(self.database.insert(entry), entry)
+		self.index.written()
+
+	def _update(self, entry):
+		""" Replaces the entry with the same uuid. """
+		doc_id = self.index.find('uuid', entry['uuid'])
+		if doc_id is not None:
+			self.database.update(entry, doc_ids=[doc_id])
+			self.index.discard(doc_id)
+			self.index.add(doc_id, entry)
+			self.index.written()
+
+	def _remove(self, uuid):
+		doc_id = self.index.find('uuid', uuid)
+		if doc_id is not None:
+			self.database.remove(doc_ids=[doc_id])
+			self.index.discard(doc_id)
+			self.index.written()
+
+	def _truncate(self):
+		self.database.truncate()
+		self.index.build()
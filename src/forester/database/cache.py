@@ -0,0 +1,141 @@
+#  CC-0 2023.
+#  David Strahl, University of Potsdam
+#  Forester: Interactive human-in-the-loop web-based visualization of machine learning trees
+
+import os
+import json
+import shutil
+import hashlib
+
+from loguru import logger
+
+import parser
+
+
+class ParseCache:
+	"""
+		Content-addressed cache of parsed trees.
+
+		Each entry is a directory named after the hash of the input file, the format
+		of the file and the version of its parser. The directory holds the parsed tree
+		as *tree.json* and other files of the parse (e.g. the training rows of the nodes).
+		When the cache grows larger than `max_size`, the least recently used entries
+		are deleted.
+
+		Attributes
+		----------
+		path: str
+			The directory of the cache.
+		max_size: int
+			Maximum size of all entries in bytes.
+	"""
+
+	# keyword arguments of the parser that change its output,
+	# besides the format information in the format key
+	KEYS = ('name',)
+
+	def __init__(self, path, max_size=256 * 2 ** 20):
+		self.path = path
+		self.max_size = max_size
+
+		if not os.path.isdir(self.path):
+			os.mkdir(self.path)
+
+	def key(self, path, format, **kwargs):
+		"""
+		Computes the cache key for parsing a file.
+
+		Parameters
+		----------
+		path: str
+			The path to the file that should be parsed.
+		format: str
+			The format key of the file, as returned by :func:`parser.check`.
+		kwargs: dict
+			The arguments that are passed on to the parser.
+
+		Returns
+		-------
+		str:
+			Hexadecimal SHA-256 digest of the file content, the format, the arguments
+			and the version of the parser.
+		"""
+		kwargs = {key: kwargs[key] for key in self.KEYS if key in kwargs}
+		version = parser.FORMATS[format].version if parser.has(format) else 0
+
+		digest = hashlib.sha256()
+		with open(path, "rb") as file:
+			for chunk in iter(lambda: file.read(2 ** 20), b""):
+				digest.update(chunk)
+		digest.update(json.dumps(kwargs, sort_keys=True).encode())
+		digest.update(f"{format}:{version}".encode())
+
+		return digest.hexdigest()
+
+	def get(self, key, name="tree.json"):
+		"""
+			Returns the path of the cached file for a key or `None` when it is not cached.
+			A hit marks the entry as recently used.
+		"""
+		path = os.path.join(self.path, key, name)
+		if not os.path.isfile(path):
+			return None
+
+		os.utime(os.path.join(self.path, key))
+		logger.info(f"Found {name} of parsed tree {key[:12]} in cache")
+		return path
+
+	def put(self, key, path, name="tree.json"):
+		"""
+			Stores a file of a parsed tree for a key and returns the path of the cached file.
+
+			The file is linked into the cache, so that it is not written again. It is
+			copied when it can not be linked (e.g. on another file system).
+		"""
+		directory = os.path.join(self.path, key)
+		os.makedirs(directory, exist_ok=True)
+
+		cached_path = os.path.join(directory, name)
+		if os.path.exists(cached_path):
+			os.remove(cached_path)
+
+		try:
+			os.link(path, cached_path)
+		except OSError:
+			shutil.copy(path, cached_path)
+
+		self.evict(keep=key)
+		return cached_path
+
+	def size(self):
+		return sum(self._entries().values())
+
+	def _entries(self):
+		""" Returns the size of each entry in bytes. """
+		entries = {}
+		for key in os.listdir(self.path):
+			directory = os.path.join(self.path, key)
+			if os.path.isdir(directory):
+				entries[key] = sum(os.path.getsize(os.path.join(directory, file)) for file in os.listdir(directory))
+		return entries
+
+	def evict(self, keep=None):
+		"""
+			Deletes the least recently used entries until the cache is smaller than `max_size`.
+			The entry `keep` is never deleted.
+		"""
+		entries = self._entries()
+		total = sum(entries.values())
+
+		for key in sorted(entries, key=lambda key: os.path.getmtime(os.path.join(self.path, key))):
+			if total <= self.max_size:
+				break
+			if key == keep:
+				continue
+			shutil.rmtree(os.path.join(self.path, key), ignore_errors=True)
+			total -= entries[key]
+			logger.info(f"Evicted parsed tree {key[:12]} from cache")
+
+	def clear(self):
+		shutil.rmtree(self.path, ignore_errors=True)
+		os.mkdir(self.path)
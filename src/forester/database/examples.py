@@ -49,23 +49,24 @@ def load_examples(database, directory, reload=False):
 				path = os.path.join(root, file)
 
 				# when a project with this name already exists, overwrite it if
-				# the reload setting is given
-				if database.has_project(name) and reload:
-					database.remove_project(name)
+				# the reload setting is given, both steps are stored together
+				with database.transaction():
+					if database.has_project(name) and reload:
+						database.remove_project(name)
 
-				# load new project
-				if not database.has_project(name):
-					project = database.create_project_from_files(name, path,
-					                                   size=os.path.getsize(path),
-					                                   created=datetime.fromtimestamp(
-						                               os.path.getctime(path)).isoformat(),
-					                                   modified=datetime.fromtimestamp(
-						                               os.path.getmtime(path)).isoformat(),
-					                                   example=True,
-					                                   author="Forester Team")
+					# load new project
+					if not database.has_project(name):
+						project = database.create_project_from_files(name, path,
+						                                   size=os.path.getsize(path),
+						                                   created=datetime.fromtimestamp(
+							                               os.path.getctime(path)).isoformat(),
+						                                   modified=datetime.fromtimestamp(
+							                               os.path.getmtime(path)).isoformat(),
+						                                   example=True,
+						                                   author="Forester Team")
 
-					# keep track of the number of added projects
-					new_examples += (project is not None)
+						# keep track of the number of added projects
+						new_examples += (project is not None)
 
 	logger.info(f"{new_examples if new_examples > 0 else 'no'} new examples added")
 
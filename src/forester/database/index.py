@@ -0,0 +1,83 @@
+#  CC-0 2023.
+#  David Strahl, University of Potsdam
+#  Forester: Interactive human-in-the-loop web-based visualization of machine learning trees
+
+class ProjectIndex:
+	"""
+		In-memory index of the uuids and names of the projects in a TinyDB table.
+
+		TinyDB finds entries by testing a query against every entry of the table. The
+		index maps each uuid to the document id of its entry and each name to the ids of
+		all entries with this name, so that projects are found without a scan. The index
+		is built once and kept current by :class:`Database` on every change. When the
+		file of the table was changed by someone else, which `changes` tells, the index
+		is built again.
+
+		Attributes
+		----------
+		changes: callable
+			Returns a value that changes whenever the file was changed by someone else.
+		uuids: dict
+			The document id of each uuid.
+		names: dict
+			The set of document ids of each name.
+	"""
+
+	def __init__(self, table, changes):
+		self.table = table
+		self.changes = changes
+
+		self.uuids = {}
+		self.names = {}
+		self.entries = {}
+		self.stamp = None
+
+		self.build()
+
+	def build(self):
+		""" Builds the index from all entries of the table. """
+		self.uuids.clear()
+		self.names.clear()
+		self.entries.clear()
+
+		for entry in self.table.all():
+			self.add(entry.doc_id, entry)
+		self.stamp = self.changes()
+
+	def refresh(self):
+		""" Builds the index again when the file was changed since the last change through the index. """
+		if self.changes() != self.stamp:
+			self.build()
+
+	def written(self):
+		""" Records a change of the file through the index. """
+		self.stamp = self.changes()
+
+	def find(self, key, value):
+		"""
+		Returns the document id of the first entry whose `key` (``uuid`` or ``name``)
+		has the given value, or `None`.
+		"""
+		self.refresh()
+		if key == 'uuid':
+			return self.uuids.get(value)
+		if key == 'name':
+			ids = self.names.get(value)
+			return min(ids) if ids else None
+		raise KeyError(f"Projects are not indexed by {key!r}")
+
+	def add(self, doc_id, entry):
+		uuid, name = entry.get('uuid'), entry.get('name')
+		self.entries[doc_id] = (uuid, name)
+		self.uuids[uuid] = doc_id
+		self.names.setdefault(name, set()).add(doc_id)
+
+	def discard(self, doc_id):
+		uuid, name = self.entries.pop(doc_id)
+		if self.uuids.get(uuid) == doc_id:
+			del self.uuids[uuid]
+
+		ids = self.names[name]
+		ids.discard(doc_id)
+		if not ids:
+			del self.names[name]
@@ -3,7 +3,9 @@
 #  Forester: Interactive human-in-the-loop web-based visualization of machine learning trees
 
 import os
+import glob
 import shutil
+import tempfile
 import uuid
 import json
 
@@ -13,6 +15,7 @@ from datetime import datetime
 from loguru import logger
 
 from .errors import *
+import parser
 
 
 @dataclass_json
@@ -42,6 +45,8 @@ class Project:
             Unique identifier for this project. Is generated automatically.
         size: int
             File size of the project in bytes (default zero)
+        kind: str
+            Either `tree` for a single tree or `ensemble` for the trees of an ensemble (default `tree`)
     """
     name: str
     path: str
@@ -52,6 +57,7 @@ class Project:
     uuid: str = field(default_factory=lambda: str(uuid.uuid4()), repr=False)
     size: int = field(repr=False, default=0)
     files: dict = field(repr=False, default_factory=lambda: {})
+    kind: str = field(default="tree")
 
     def __post_init__(self):
         """
@@ -66,7 +72,7 @@ class Project:
         # use tree as a default name for the tree path
         self.files = {'tree': os.path.join(self.path, "tree.json")}
 
-    def add_file(self, path, name="unnamed", overwrite=True):
+    def add_file(self, path, name="unnamed", overwrite=True, move=False):
         """
 
         Adds a file to the project directory and records it in the list
@@ -85,6 +91,9 @@ class Project:
         overwrite:
             Whether files and names should be overwritten if they
             already exist.
+        move: bool
+            Whether the file is moved into the project directory
+            instead of copied.
         """
 
         # where to save the new file (in the project directory)
@@ -108,13 +117,22 @@ class Project:
         if exists and name != [key for key, value in self.files.items() if value == os.path.basename(path)][0]:
             raise DatabaseException(f"{new_path} already exists with other name")
 
+        # the binary trees and the nested tree are written again from the new tree file
+        if name == 'tree':
+            for file in [self.arrays_path(), self.nested_path()] + glob.glob(self.pruned_path("*")):
+                if os.path.isfile(file):
+                    os.remove(file)
+
         # remove the file under the name
         if has_name:
             os.remove(os.path.join(self.path, self.files[name]))
             del self.files[name]
 
-        # copy file into project directory
-        shutil.copy(path, new_path)
+        # copy or move file into project directory
+        if move:
+            os.replace(path, new_path)
+        else:
+            shutil.copy(path, new_path)
 
         # add file to project's file list
         self.files[name] = os.path.basename(path)
@@ -127,3 +145,113 @@ class Project:
             return data
         else:
             return None
+
+    def open_as_bytes(self, name):
+        """ Returns the content of a project file without decoding it or `None` when there is no such file. """
+        if name in self.files:
+            with open(os.path.join(self.path, self.files[name]), "rb") as file:
+                return file.read()
+        else:
+            return None
+
+    def arrays_path(self):
+        """ Path of the tree in the binary format, next to the tree file (e.g. *tree.bin*). """
+        return os.path.join(self.path, os.path.splitext(self.files['tree'])[0] + ".bin")
+
+    def write_arrays(self):
+        """
+            Stores the tree of the project in the binary format of :mod:`parser.binary`,
+            so that it can be opened without decoding the JSON file.
+
+            The file is written under another name and then replaces the old file, so
+            that readers which have mapped the old file into memory keep reading it.
+        """
+        tree = parser.TreeArrays.from_json(self.open_as_json("tree"))
+        self._replace(lambda path: parser.write_tree(tree, path), self.arrays_path())
+
+    def _replace(self, write, path):
+        """ Writes a file with `write` into a temporary file in the project directory, which then replaces `path`. """
+        file, temp_path = tempfile.mkstemp(dir=self.path, suffix=os.path.splitext(path)[1])
+        os.close(file)
+        try:
+            write(temp_path)
+            os.replace(temp_path, path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+    def open_as_arrays(self):
+        """
+            Opens the tree of the project as memory-mapped arrays. The binary file is
+            written from the tree file when it does not exist yet.
+        """
+        if not os.path.isfile(self.arrays_path()):
+            self.write_arrays()
+        return parser.open_tree(self.arrays_path())
+
+    def nested_path(self):
+        """ Path of the tree encoded in the nested shape, next to the tree file (e.g. *tree.nested.json*). """
+        return os.path.join(self.path, os.path.splitext(self.files['tree'])[0] + ".nested.json")
+
+    def open_as_nested(self):
+        """
+            Returns the tree of the project encoded in the nested shape, without decoding it.
+            Trees that are stored in the flat shape are encoded once from their binary file
+            and the encoded tree is kept next to it, or `None` when there is no tree.
+        """
+        if 'tree' not in self.files:
+            return None
+
+        with open(os.path.join(self.path, self.files['tree']), "rb") as file:
+            if parser.json_version(file.read(256)) < 2:
+                file.seek(0)
+                return file.read()
+
+        path = self.nested_path()
+        if not os.path.isfile(path):
+            tree = self.open_as_arrays()
+
+            def write(temp_path):
+                with open(temp_path, "w") as file:
+                    parser.dump(tree, file, shape="nested")
+
+            self._replace(write, path)
+
+        with open(path, "rb") as file:
+            return file.read()
+
+    def pruned_path(self, level):
+        """ Path of the tree pruned to a level in the binary format, next to the tree file (e.g. *tree.pruned-2.bin*). """
+        return os.path.join(self.path, f"{os.path.splitext(self.files['tree'])[0]}.pruned-{level}.bin")
+
+    def open_pruned(self, level):
+        """
+            Opens the tree of the project pruned to a level of its pruning sequence, see
+            :func:`parser.pruning.prune`. Each level is pruned once and kept as a binary
+            file, which is opened as memory-mapped arrays on later calls.
+        """
+        path = self.pruned_path(level)
+        if not os.path.isfile(path):
+            # the file is written under another name first, so that concurrent
+            # calls never open a file that is not written completely
+            self._replace(lambda temp_path: parser.write_tree(parser.prune(self.open_as_arrays(), level), temp_path), path)
+        return parser.open_tree(path)
+
+    def open_ensemble(self):
+        """
+            Opens the trees of an ensemble project as memory-mapped arrays, see
+            :class:`parser.binary.Ensemble`. Single trees are only read when accessed.
+        """
+        if 'ensemble' not in self.files:
+            raise DatabaseException(f"{self} is not an ensemble")
+        return parser.open_ensemble(os.path.join(self.path, self.files['ensemble']))
+
+    def open_membership(self):
+        """
+            Opens the index of the training rows in each node of the tree, see
+            :class:`parser.membership.Membership`, or returns `None` when the rows are not known.
+        """
+        if 'rows' not in self.files:
+            return None
+        return parser.open_membership(os.path.join(self.path, self.files['rows']))
@@ -5,6 +5,7 @@
 import os
 import shutil
 import json
+import tempfile
 
 import traceback
 from loguru import logger
@@ -14,7 +15,7 @@ from .errors import *
 import parser
 
 
-def create_project_from_files(self, name, paths, **kwargs):
+def create_project_from_files(self, name, paths, move=False, arrays=True, **kwargs):
 	"""
 	Creates a project from a file path.
 
@@ -31,6 +32,12 @@ def create_project_from_files(self, name, paths, **kwargs):
 		The name of the project.
 	paths: path
 		The path of the file from which the project should be generated.
+	move: bool
+		Whether the file is moved into the project directory instead of copied (default `false`).
+		The file has to be on the same file system as the database.
+	arrays: bool
+		Whether the tree is stored in the binary format right away (default `true`), otherwise
+		it is stored when it is first opened as arrays.
 	kwargs: dict
 		Additional information for the project. See Project.
 
@@ -40,6 +47,10 @@ def create_project_from_files(self, name, paths, **kwargs):
 
 	"""
 
+	# the files of an existing project must not be overwritten
+	if self.has_project(name):
+		raise ProjectAlreadyExistsException(f"A project with name {name} already exists.")
+
 	project = None
 
 	try:
@@ -67,12 +78,16 @@ def create_project_from_files(self, name, paths, **kwargs):
 			if not os.path.isfile(path):
 				raise DatabaseException(f"The given path {path} is not a file!")
 
-			# copy the given file into the project directory
-			shutil.copy(path, project_path, follow_symlinks=True)
-
 			# new path
 			new_path = os.path.join(project_path, os.path.basename(path))
 
+			# copy the given file into the project directory, files
+			# that are moved are renamed atomically
+			if move:
+				os.replace(path, new_path)
+			else:
+				shutil.copy(path, project_path, follow_symlinks=True)
+
 			# check if file was copied correctly
 			if not os.path.isfile(new_path):
 				raise DatabaseException(f"Copying the file {path} failed!")
@@ -80,6 +95,14 @@ def create_project_from_files(self, name, paths, **kwargs):
 			# add the only file as the tree
 			project.files = {'tree': os.path.basename(path)}
 
+			# store the tree in the binary format, trees that can not be
+			# converted are only available as JSON
+			try:
+				if arrays:
+					project.write_arrays()
+			except (ValueError, KeyError, TypeError, AttributeError) as e:
+				logger.warning(f"Unable to store the tree of '{name}' in the binary format: {e}")
+
 		if type(paths) is dict:
 			raise NotImplementedError(f"Creating a project from multiple files is not yet supported!")
 
@@ -113,21 +136,143 @@ def create_project_from_vendor(self, name, path, **kwargs):
 		The added project.
 	"""
 
-	# path where the tree will be saved
-	tree_path = os.path.join(self.temp_path, "tree.json")
+	# reject names that are taken and files that can not be parsed before any expensive work starts
+	if self.has_project(name):
+		raise ProjectAlreadyExistsException(f"A project with name {name} already exists.")
+	format = parser.check(path, dict(kwargs))
+
+	# the stages of the import are recorded and stored with the project
+	timings = parser.ParseTimings(os.path.abspath(path), format)
 
-	# parse the file
-	# TODO: should happen in another thread
-	tree = parser.parse(os.path.abspath(path), **kwargs)
+	# exports of Forester already hold the tree, they are stored as they are
+	export = format == "json.forester.export"
 
-	# save the parsed file
-	file = open(tree_path, "w")
-	file.write(json.dumps(tree))
-	file.close()
+	# files that were parsed before are taken from the cache
+	key = None if export else self.cache.key(path, format, **kwargs)
+	cached_path = None if export else self.cache.get(key)
+	cached_rows = self.cache.get(key, "rows.bin") if cached_path is not None else None
 
 	# drop the name parameter from kwargs to be sure
 	# that no error happens
 	kwargs.pop('name', None)
 
-	# create the project
-	return self.create_project_from_files(name, tree_path)
+	# each import writes into its own directory, so that concurrent imports do not
+	# overwrite their files
+	directory = tempfile.mkdtemp(dir=self.temp_path)
+	tree_path = os.path.join(directory, "tree.json")
+	timings_path = os.path.join(directory, "timings.json")
+	rows_path = os.path.join(directory, "rows.bin")
+
+	try:
+		if export:
+			# the file is validated in one pass and copied without decoding it,
+			# the binary tree is written when it is first needed
+			with timings.activate():
+				with parser.stage("validate", bytes=os.path.getsize(path)) as entry:
+					entry['nodes'] = parser.validate_export(path)['nodes']
+				with parser.stage("copy", bytes=os.path.getsize(path)):
+					shutil.copy(path, tree_path)
+		elif cached_path is None:
+			# parse the file
+			# TODO: should happen in another thread
+			tree = parser.parse(os.path.abspath(path), shape="arrays", timings=timings, **kwargs)
+
+			# write the tree node by node in the flat shape, which
+			# can be stored for trees of any depth
+			with timings.activate(), parser.stage("serialize", shape="flat", nodes=len(tree)) as entry:
+				with open(tree_path, "w") as file:
+					parser.dump(tree, file, shape="flat")
+				entry['bytes'] = os.path.getsize(tree_path)
+
+			# the training rows of each node, when the parser knows them
+			membership = parser.Membership.from_tree(tree)
+			del tree
+			if membership is not None:
+				parser.write_membership(membership, rows_path)
+				self.cache.put(key, rows_path, "rows.bin")
+				cached_rows = rows_path
+			del membership
+
+			# the cache links the file, which is then moved into the project
+			self.cache.put(key, tree_path)
+
+		# the project is stored together with its files
+		with self.transaction():
+			if export:
+				project = self.create_project_from_files(name, tree_path, move=True, arrays=False)
+			elif cached_path is not None:
+				with timings.activate(), parser.stage("cache", bytes=os.path.getsize(cached_path)):
+					project = self.create_project_from_files(name, cached_path)
+			else:
+				project = self.create_project_from_files(name, tree_path, move=True)
+
+			if project is not None:
+				if cached_rows is not None:
+					self.add_file_to_project(cached_rows, project, name="rows", move=cached_rows == rows_path)
+
+				with open(timings_path, "w") as file:
+					json.dump(timings.to_dict(), file)
+				self.add_file_to_project(timings_path, project, name="timings", move=True)
+
+		return project
+
+	finally:
+		shutil.rmtree(directory, ignore_errors=True)
+
+
+def create_ensemble_from_vendor(self, name, path, **kwargs):
+	"""
+	Creates a new project from the trees of an ensemble.
+
+	The trees are parsed one after another and written into a single binary file,
+	so that the whole ensemble is never held in memory. The first tree is stored as
+	the tree of the project, all trees can be opened with :meth:`Project.open_ensemble`.
+
+	Parameters
+	----------
+	name: str
+		The name of the project.
+	path: path
+		The path to the file that should be parsed.
+	kwargs: dict
+		Dictionary with values that are passed on to the parsing function.
+
+	Returns
+	-------
+		The added project.
+	"""
+
+	kwargs.pop('name', None)
+	kwargs.pop('ensemble', None)
+
+	# reject names that are taken and files that can not be parsed before any expensive work starts
+	if self.has_project(name):
+		raise ProjectAlreadyExistsException(f"A project with name {name} already exists.")
+	parser.check(path, dict(kwargs), ensemble=True)
+
+	# paths where the first tree and the ensemble will be saved
+	directory = tempfile.mkdtemp(dir=self.temp_path)
+	tree_path = os.path.join(directory, "tree.json")
+	ensemble_path = os.path.join(directory, "ensemble.bin")
+
+	try:
+		with parser.EnsembleWriter(ensemble_path) as writer:
+			for tree in parser.parse_ensemble(os.path.abspath(path), **kwargs):
+				if len(writer) == 0:
+					with open(tree_path, "w") as file:
+						parser.dump(tree, file, shape="flat")
+				writer.add(tree)
+
+		if len(writer) == 0:
+			raise DatabaseException(f"No trees found in {os.path.basename(path)}")
+
+		# create the project
+		with self.transaction():
+			project = self.create_project_from_files(name, tree_path, move=True, kind="ensemble")
+			if project is not None:
+				self.add_file_to_project(ensemble_path, project, name="ensemble", move=True)
+
+		return project
+
+	finally:
+		shutil.rmtree(directory, ignore_errors=True)
@@ -0,0 +1,216 @@
+#  CC-0 2023.
+#  David Strahl, University of Potsdam
+#  Forester: Interactive human-in-the-loop web-based visualization of machine learning trees
+
+"""
+	Database of the projects in SQLite.
+
+	TinyDB writes the whole *database.json* on every change and finds projects by
+	scanning all entries. With many projects, :class:`SQLiteDatabase` stores the
+	projects in *database.sqlite* instead, one row per project:
+
+	.. code-block:: sql
+
+		CREATE TABLE projects (uuid TEXT NOT NULL, name TEXT NOT NULL, entry TEXT NOT NULL)
+		CREATE UNIQUE INDEX projects_uuid ON projects (uuid)
+		CREATE UNIQUE INDEX projects_name ON projects (name)
+
+	The `entry` holds the dictionary of the project as JSON. The file is written in
+	WAL mode, so that reads do not wait for writes. An existing *database.json* is
+	migrated when the SQLite file is created, other files can be migrated with
+
+	.. code-block:: bash
+
+		python -m forester.database.sqlite ./instance/database.json ./instance/database.sqlite
+"""
+
+import os
+import json
+import sqlite3
+import argparse
+import threading
+
+from contextlib import contextmanager
+from loguru import logger
+from tinydb import TinyDB
+
+from . import Database
+from .errors import *
+
+
+def _connect(path, table_name):
+	""" Opens the SQLite file and creates the table of the projects if it does not exist yet. """
+	if not table_name.isidentifier():
+		raise DatabaseError(f"Invalid name of the table {table_name!r}")
+
+	# transactions are started explicitly, see SQLiteDatabase.transaction
+	connection = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+	connection.execute("PRAGMA journal_mode=WAL")
+	connection.execute("PRAGMA synchronous=NORMAL")
+
+	connection.execute(f'CREATE TABLE IF NOT EXISTS "{table_name}" '
+	                   f'(uuid TEXT NOT NULL, name TEXT NOT NULL, entry TEXT NOT NULL)')
+	connection.execute(f'CREATE UNIQUE INDEX IF NOT EXISTS "{table_name}_uuid" ON "{table_name}" (uuid)')
+	connection.execute(f'CREATE UNIQUE INDEX IF NOT EXISTS "{table_name}_name" ON "{table_name}" (name)')
+	return connection
+
+
+def migrate(json_path, sqlite_path, table_name="projects") -> int:
+	"""
+	Copies the projects of a TinyDB *database.json* into a SQLite file.
+
+	All projects are added in a single transaction. Entries without uuid or name and
+	entries whose uuid or name is already taken are skipped.
+
+	Parameters
+	----------
+	json_path: str
+		The path to the TinyDB file.
+	sqlite_path: str
+		The path to the SQLite file, which is created if it does not exist.
+	table_name: str
+		The name of the table of the projects in both files (default `projects`).
+
+	Returns
+	-------
+	int:
+		The number of migrated projects.
+	"""
+	with TinyDB(json_path, access_mode="r") as database:
+		entries = database.table(table_name).all()
+
+	connection = _connect(sqlite_path, table_name)
+	migrated = 0
+	try:
+		connection.execute("BEGIN IMMEDIATE")
+		for entry in entries:
+			if not all(key in entry for key in ("uuid", "name")):
+				logger.warning(f"Skipped invalid entry {entry}")
+				continue
+
+			cursor = connection.execute(f'INSERT OR IGNORE INTO "{table_name}" (uuid, name, entry) VALUES (?, ?, ?)',
+			                            (entry['uuid'], entry['name'], json.dumps(dict(entry))))
+			if cursor.rowcount == 0:
+				logger.warning(f"Skipped project {entry['name']}, its uuid or name is already taken")
+			migrated += cursor.rowcount
+		connection.execute("COMMIT")
+	except BaseException:
+		connection.execute("ROLLBACK")
+		raise
+	finally:
+		connection.close()
+
+	logger.info(f"Migrated {migrated} of {len(entries)} projects from {json_path} to {sqlite_path}")
+	return migrated
+
+
+class SQLiteDatabase(Database):
+	"""
+		Database of the projects, stored with SQLite in *database.sqlite*.
+
+		Has the same methods as :class:`Database`. Projects are found by the unique
+		indexes on their uuid and name, and each change only writes the row of its
+		project. One connection is shared by all threads, a lock orders the access.
+	"""
+
+	# name of the database file in the directory
+	file_name = "database.sqlite"
+
+	connection = None
+
+	@contextmanager
+	def transaction(self):
+		"""
+			Groups several steps on the database, which are then stored together.
+
+			The steps are rolled back when an exception is raised. Transactions may be
+			nested, only the outermost one is committed. Other threads wait until the
+			transaction is finished.
+		"""
+		with self.lock:
+			outermost = not self.connection.in_transaction
+			if outermost:
+				self.connection.execute("BEGIN IMMEDIATE")
+			try:
+				yield self
+			except BaseException:
+				if outermost:
+					self.connection.execute("ROLLBACK")
+				raise
+			if outermost:
+				self.connection.execute("COMMIT")
+
+	def flush(self):
+		""" Changes are written by each step, so there is nothing to write. """
+
+	def close(self):
+		self.connection.close()
+
+	def _execute(self, statement, parameters=()) -> list:
+		""" Runs a statement on the table of the projects, which is named `{table}` in the statement. """
+		with self.lock:
+			return self.connection.execute(statement.format(table=f'"{self.table_name}"'), parameters).fetchall()
+
+	def _open(self, table_name):
+		""" Opens the SQLite file, a *database.json* is migrated when the file does not exist yet. """
+		json_path = os.path.join(self.root_path, Database.file_name)
+		if not os.path.isfile(self.base_path) and os.path.isfile(json_path):
+			migrate(json_path, self.base_path, table_name)
+
+		self.lock = threading.RLock()
+		self.table_name = table_name
+		self.connection = _connect(self.base_path, table_name)
+		self.database = self.connection
+
+	def _count(self) -> int:
+		return self._execute("SELECT COUNT(*) FROM {table}")[0][0]
+
+	def _all(self) -> list:
+		return [json.loads(entry) for entry, in self._execute("SELECT entry FROM {table} ORDER BY rowid")]
+
+	def _find(self, key, value):
+		""" Returns the entry whose `key` (``uuid`` or ``name``) has the given value, or `None`. """
+		rows = self._execute(f"SELECT entry FROM {{table}} WHERE {self._column(key)} = ?", (value,))
+		return json.loads(rows[0][0]) if rows else None
+
+	def _contains(self, key, value) -> bool:
+		return len(self._execute(f"SELECT 1 FROM {{table}} WHERE {self._column(key)} = ?", (value,))) > 0
+
+	def _insert(self, entry):
+		try:
+			self._execute("INSERT INTO {table} (uuid, name, entry) VALUES (?, ?, ?)",
+			              (entry['uuid'], entry['name'], json.dumps(entry)))
+		except sqlite3.IntegrityError as e:
+			raise ProjectAlreadyExistsException(
+				f"A project with id {entry['uuid']} or name {entry['name']} already exists.") from e
+
+	def _update(self, entry):
+		""" Replaces the entry with the same uuid. """
+		try:
+			self._execute("UPDATE {table} SET name = ?, entry = ? WHERE uuid = ?",
+			              (entry['name'], json.dumps(entry), entry['uuid']))
+		except sqlite3.IntegrityError as e:
+			raise ProjectAlreadyExistsException(f"A project with name {entry['name']} already exists.") from e
+
+	def _remove(self, uuid):
+		self._execute("DELETE FROM {table} WHERE uuid = ?", (uuid,))
+
+	def _truncate(self):
+		self._execute("DELETE FROM {table}")
+
+	@staticmethod
+	def _column(key):
+		""" The indexed column of a key, projects can only be found by uuid and name. """
+		if key not in ("uuid", "name"):
+			raise DatabaseError(f"Projects can not be found by {key!r}")
+		return key
+
+
+if __name__ == "__main__":
+	arguments = argparse.ArgumentParser(description="Migrates the projects of a TinyDB file into a SQLite file.")
+	arguments.add_argument("json_path", help="path to the database.json of TinyDB")
+	arguments.add_argument("sqlite_path", help="path to the SQLite file, which is created if it does not exist")
+	arguments.add_argument("--table", default="projects", help="name of the table of the projects")
+	arguments = arguments.parse_args()
+
+	migrate(arguments.json_path, arguments.sqlite_path, arguments.table)
@@ -0,0 +1,178 @@
+#  CC-0 2023.
+#  David Strahl, University of Potsdam
+#  Forester: Interactive human-in-the-loop web-based visualization of machine learning trees
+
+"""
+	Storage of the TinyDB *database.json*.
+
+	TinyDB writes the whole file on every change. :class:`WriteBehindMiddleware` keeps
+	the data in memory and collects the changes, which are written together after a
+	short delay, after a number of changes, at the end of a transaction of the database
+	and when the program exits. :class:`AtomicJSONStorage` writes the file into a temporary
+	file next to it, which replaces the file only once it is completely on the disk, so
+	that a crash leaves either the old or the new file.
+"""
+
+import os
+import json
+import atexit
+import tempfile
+import threading
+
+from contextlib import contextmanager
+from loguru import logger
+from tinydb.storages import Storage
+from tinydb.middlewares import Middleware
+
+
+class AtomicJSONStorage(Storage):
+	"""
+		JSON storage of TinyDB that replaces the file atomically on each write.
+	"""
+
+	def __init__(self, path, **kwargs):
+		super().__init__()
+		self.path = path
+		self.kwargs = kwargs
+
+	def read(self):
+		try:
+			with open(self.path) as file:
+				text = file.read()
+		except FileNotFoundError:
+			return None
+		return json.loads(text) if text.strip() else None
+
+	def write(self, data):
+		directory = os.path.dirname(os.path.abspath(self.path))
+		descriptor, temp_path = tempfile.mkstemp(dir=directory, prefix=".database-", suffix=".json")
+		try:
+			with os.fdopen(descriptor, "w") as file:
+				json.dump(data, file, **self.kwargs)
+				file.flush()
+				os.fsync(file.fileno())
+			os.replace(temp_path, self.path)
+		except BaseException:
+			if os.path.exists(temp_path):
+				os.remove(temp_path)
+			raise
+
+		# the new entry of the directory is written, too
+		if os.name == "posix":
+			descriptor = os.open(directory, os.O_RDONLY)
+			try:
+				os.fsync(descriptor)
+			finally:
+				os.close(descriptor)
+
+
+class WriteBehindMiddleware(Middleware):
+	"""
+		Middleware of TinyDB that keeps the data in memory and writes changes later.
+
+		The changes are written `delay` seconds after the first change that is not yet
+		written, or as soon as `max_writes` changes are waiting. Within :meth:`group`
+		nothing is written until the outermost group ends. Changes that are still
+		waiting when the program exits are written, too.
+
+		The file is read again when it was changed by someone else while no changes
+		are waiting, which is noticed from its time of modification and size.
+
+		Attributes
+		----------
+		loads: int
+			The number of times the data was read from the file.
+	"""
+
+	def __init__(self, storage_cls=AtomicJSONStorage, delay=1.0, max_writes=64):
+		super().__init__(storage_cls)
+		self.delay = delay
+		self.max_writes = max_writes
+
+		self.lock = threading.RLock()
+		self.timer = None
+		self.data = None
+		self.loaded = False
+		self.loads = 0
+		self.stamp = None
+		self.pending = 0
+		self.groups = 0
+
+		atexit.register(self.flush)
+
+	def _stamp(self):
+		""" The time of modification and the size of the file, or `None` when it does not exist. """
+		try:
+			stat = os.stat(self.storage.path)
+		except (AttributeError, FileNotFoundError):
+			return None
+		return stat.st_mtime_ns, stat.st_size
+
+	def read(self):
+		with self.lock:
+			if not self.loaded or (self.pending == 0 and self._stamp() != self.stamp):
+				self.stamp = self._stamp()
+				self.data = self.storage.read()
+				self.loaded = True
+				self.loads += 1
+			return self.data
+
+	def write(self, data):
+		with self.lock:
+			self.data = data
+			self.loaded = True
+			self.pending += 1
+
+			if self.groups == 0:
+				if self.pending >= self.max_writes:
+					self.flush()
+				elif self.timer is None:
+					self.timer = threading.Timer(self.delay, self._timeout)
+					self.timer.daemon = True
+					self.timer.start()
+
+	def changes(self) -> int:
+		""" Checks the file for changes by someone else and returns the number of loads. """
+		with self.lock:
+			self.read()
+			return self.loads
+
+	def flush(self):
+		""" Writes the changes that are waiting. """
+		with self.lock:
+			if self.timer is not None:
+				self.timer.cancel()
+				self.timer = None
+
+			if self.pending > 0:
+				self.storage.write(self.data)
+				self.pending = 0
+				self.stamp = self._stamp()
+
+	def _timeout(self):
+		with self.lock:
+			self.timer = None
+			if self.groups > 0:
+				return
+			try:
+				self.flush()
+			except Exception as e:
+				logger.error(f"Writing {self.storage.path} failed: {e}")
+
+	@contextmanager
+	def group(self):
+		""" Writes all changes within the group together when the outermost group ends. """
+		with self.lock:
+			self.groups += 1
+		try:
+			yield self
+		finally:
+			with self.lock:
+				self.groups -= 1
+				if self.groups == 0:
+					self.flush()
+
+	def close(self):
+		self.flush()
+		atexit.unregister(self.flush)
+		self.storage.close()
@@ -3,16 +3,25 @@
 #  Forester: Interactive human-in-the-loop web-based visualization of machine learning trees
 
 import os
+import json
+import time
 import shutil
+import sqlite3
 import unittest
+import unittest.mock
+
+from tinydb import TinyDB
+
+import parser
 
 from src.forester.database import *
+from src.forester.database.sqlite import SQLiteDatabase, migrate
 
 
 class DatabaseTest(unittest.TestCase):
 
-    def __init__(self, methodName):
-        super().__init__(methodName)
+    def setUp(self):
+        super().setUp()
 
         # remove old directory
         if os.path.isdir("instance"):
@@ -24,12 +33,18 @@ class DatabaseTest(unittest.TestCase):
 
 class MethodTest(DatabaseTest):
 
-    def __init__(self, methodName):
-        super().__init__(methodName)
+    # the class of the database that is tested
+    backend = Database
 
-        self.database = Database("./instance")
+    def setUp(self):
+        super().setUp()
+
+        self.database = self.backend("./instance")
         self.database.load_examples(directory="./instance/examples")
 
+    def tearDown(self):
+        self.database.close()
+
     def test_examples_loaded(self):
         self.assertEqual(4, self.database.size())
         self.assertTrue(os.path.isfile("./instance/data/R Iris/tree.json"))
@@ -65,13 +80,125 @@ class MethodTest(DatabaseTest):
         self.assertRaises(ProjectNotFoundException, self.database.get_project, "R Iris")
 
     def test_add_double(self):
-        self.assertRaises(ProjectAlreadyExistsException, self.database.create_project_from_files, "R Iris", "./instance/examples/R Iris/tree.json")
+        project = self.database.get_project("R Iris")
+        files = {name: os.path.join(project.path, filename) for name, filename in project.files.items()}
+        contents = {name: open(path, "rb").read() for name, path in files.items()}
+
+        self.assertRaises(ProjectAlreadyExistsException, self.database.create_project_from_files, "R Iris", "./instance/examples/Matlab Iris/tree.json")
+        self.assertRaises(ProjectAlreadyExistsException, self.database.create_project_from_vendor, "R Iris", "./instance/examples/Matlab Iris/tree.json")
+
+        # the files of the existing project are kept
+        self.assertEqual(contents, {name: open(path, "rb").read() for name, path in files.items()})
 
     def test_parse(self):
         self.database.purge()
         project = self.database.create_project_from_vendor("R Iris", "./instance/examples/R Iris/input.RData", type="RData", vendor="R", origin="rpart")
         self.assertEqual(1, self.database.size())
 
+        # parsed trees are stored as a flat list of nodes
+        tree = project.open_as_json("tree")
+        self.assertEqual(2, tree['version'])
+        self.assertEqual(tree, project.open_as_arrays().to_flat())
+
+        # the nested shape is encoded once from the binary tree and then read from its file
+        self.assertEqual(parser.nest(tree), json.loads(project.open_as_nested()))
+        self.assertTrue(os.path.isfile(project.nested_path()))
+        with unittest.mock.patch.object(Project, "open_as_arrays", side_effect=AssertionError("Tree was encoded again")):
+            self.assertEqual(parser.nest(tree), json.loads(project.open_as_nested()))
+
+        # the stages of parsing are stored with the project
+        timings = project.open_as_json("timings")
+        self.assertEqual("rdata.r.rpart", timings['format'])
+        self.assertIn("serialize", [stage['name'] for stage in timings['stages']])
+
+        # the training rows of each node are taken from rpart's 'where'
+        membership = project.open_membership()
+        self.assertEqual(project.open_as_arrays().samples.tolist(), membership.counts().tolist())
+
+    def test_parse_cache(self):
+        """
+            Checks that a file that was parsed before is taken from the cache
+            instead of being parsed again.
+        """
+        path = "./instance/examples/Matlab Iris/input.json"
+        first = self.database.create_project_from_vendor("Matlab Iris 1", path, type="json", vendor="Matlab", origin="fitctree")
+
+        with unittest.mock.patch("parser.parse", side_effect=AssertionError("File was parsed again")):
+            second = self.database.create_project_from_vendor("Matlab Iris 2", path, type="JSON", vendor="Matlab", origin="fitctree")
+
+        self.assertEqual(first.open_as_json("tree"), second.open_as_json("tree"))
+        self.assertEqual(first.open_membership()[0].tolist(), second.open_membership()[0].tolist())
+        self.assertEqual(6, self.database.size())
+
+        # the key is computed from the format that was checked before, without reading the format again
+        with unittest.mock.patch("parser.format_key", side_effect=AssertionError("Format was read again")):
+            key = self.database.cache.key(path, "json.matlab.fitctree")
+        self.assertIsNotNone(self.database.cache.get(key))
+        self.assertNotEqual(key, self.database.cache.key(path, "json.matlab.fitrtree"))
+
+        # the parsed tree was moved out of the temporary directory
+        self.assertEqual([], os.listdir(self.database.temp_path))
+
+    def test_pruned(self):
+        """
+            Checks that the pruned trees of a project are written once and then opened from their files.
+        """
+        project = self.database.create_project_from_vendor("Matlab Iris Pruned", "./instance/examples/Matlab Iris/input.json",
+                                                           type="json", vendor="Matlab", origin="fitctree")
+
+        pruned = project.open_pruned(3)
+        self.assertEqual(3, len(pruned))
+        self.assertTrue(os.path.isfile(project.pruned_path(3)))
+
+        with unittest.mock.patch("parser.prune", side_effect=AssertionError("Tree was pruned again")):
+            self.assertEqual(pruned.to_json(), project.open_pruned(3).to_json())
+
+    def test_import_export(self):
+        """
+            Checks that an export of Forester is stored without changing its bytes.
+        """
+        path = "./instance/examples/R Diabetes/tree.json"
+        project = self.database.create_project_from_vendor("R Diabetes Export", path, type="json")
+
+        with open(path, "rb") as file:
+            self.assertEqual(file.read(), project.open_as_bytes("tree"))
+        self.assertEqual(["validate", "copy"], [stage['name'] for stage in project.open_as_json("timings")['stages']])
+        self.assertEqual(31, project.open_as_arrays().stats()['nodes'])
+
+    def test_arrays(self):
+        """
+            Checks that the tree of a project is stored in the binary format and equals the JSON tree.
+        """
+        project = self.database.get_project("R Diabetes")
+        self.assertTrue(os.path.isfile("./instance/data/R Diabetes/tree.bin"))
+
+        tree = project.open_as_arrays()
+        self.assertEqual(project.open_as_json("tree"), tree.to_json())
+        self.assertEqual(31, tree.stats()['nodes'])
+
+        # trees that are stored nested are sent as they are
+        with open("./instance/data/R Diabetes/tree.json", "rb") as file:
+            self.assertEqual(file.read(), project.open_as_nested())
+        self.assertFalse(os.path.isfile(project.nested_path()))
+
+        # a tree that is open keeps its file when the file is written again
+        project.write_arrays()
+        self.assertEqual(project.open_as_json("tree"), tree.to_json())
+        self.assertEqual([], [file for file in os.listdir(project.path) if file.startswith("tmp")])
+
+    def test_ensemble(self):
+        """
+            Checks that the trees of an ensemble are stored in the project and that a
+            single tree can be opened from it.
+        """
+        project = self.database.create_ensemble_from_vendor("R Iris Ensemble", "./instance/examples/R Iris/input.RData",
+                                                            type="RData", vendor="R", origin="rpart", ensemble=True)
+        self.assertEqual("ensemble", self.database.get_project(project.uuid).kind)
+
+        ensemble = project.open_ensemble()
+        self.assertEqual(1, len(ensemble))
+        self.assertEqual(project.open_as_json("tree"), ensemble[0].to_flat())
+
     def test_add_file(self):
         """
             Checks whether a file is properly added to a project. This includes copying into
@@ -115,5 +242,192 @@ class MethodTest(DatabaseTest):
                           "./instance/test.json", project, name="add_file_test_2", overwrite=True)
 
 
+class IndexTest(DatabaseTest):
+
+    def setUp(self):
+        super().setUp()
+
+        self.database = Database("./instance")
+        self.database.load_examples(directory="./instance/examples")
+
+    def tearDown(self):
+        self.database.close()
+
+    def test_lookup(self):
+        """
+            Checks that projects are found through the index, without a scan of the table.
+        """
+        uuid = self.database.get_project("R Iris").uuid
+
+        with unittest.mock.patch.object(self.database.database, "search", side_effect=AssertionError("Table was scanned")), \
+                unittest.mock.patch.object(self.database.database, "all", side_effect=AssertionError("Table was scanned")):
+            self.assertTrue(self.database.has_project("R Iris"))
+            self.assertTrue(self.database.has_project(uuid))
+            self.assertFalse(self.database.has_project("bla"))
+            self.assertEqual("R Iris", self.database.get_project(uuid).name)
+            self.assertEqual(4, self.database.size())
+
+    def test_changes(self):
+        """
+            Checks that the index follows updates, removals and a purge.
+        """
+        project = self.database.get_project("R Iris")
+        project.name = "R Iris Renamed"
+        self.database.update(project)
+        self.assertFalse(self.database.has_project("R Iris"))
+        self.assertEqual(project.uuid, self.database.get_project("R Iris Renamed").uuid)
+
+        self.database.remove_project("R Diabetes")
+        self.assertFalse(self.database.has_project("R Diabetes"))
+        self.assertEqual(3, self.database.size())
+
+        self.database.purge()
+        self.assertFalse(self.database.has_project(project.uuid))
+
+    def test_external_change(self):
+        """
+            Checks that the index is built again when the file was changed by another database.
+        """
+        self.database.flush()
+        other = Database("./instance")
+        other.remove_project("R Iris")
+        other.close()
+
+        self.assertFalse(self.database.has_project("R Iris"))
+        self.assertEqual(3, self.database.size())
+
+
+class StorageTest(DatabaseTest):
+
+    def setUp(self):
+        super().setUp()
+
+        self.database = Database("./instance", write_delay=60, max_writes=4)
+        self.database.load_examples(directory="./instance/examples")
+        self.database.flush()
+
+    def tearDown(self):
+        self.database.close()
+
+    def stored(self):
+        """ The authors of the projects in the database file. """
+        with open(self.database.base_path) as file:
+            return {entry['name']: entry['author'] for entry in json.load(file)['projects'].values()}
+
+    def test_write_behind(self):
+        """
+            Checks that changes are written after a number of changes or when the database is closed.
+        """
+        project = self.database.get_project("R Iris")
+        for author in ("A", "B", "C"):
+            project.author = author
+            self.database.update(project)
+
+        self.assertEqual("Forester Team", self.stored()["R Iris"])
+        self.assertEqual("C", self.database.get_project("R Iris").author)
+
+        project.author = "D"
+        self.database.update(project)
+        self.assertEqual("D", self.stored()["R Iris"])
+
+        project.author = "E"
+        self.database.update(project)
+        self.database.close()
+        self.assertEqual("E", self.stored()["R Iris"])
+
+    def test_group(self):
+        """
+            Checks that the changes within a transaction are written together when it ends.
+        """
+        with unittest.mock.patch.object(self.database.storage.storage, "write",
+                                        wraps=self.database.storage.storage.write) as write:
+            with self.database.transaction():
+                for project in self.database.get_projects():
+                    project.author = "Tester"
+                    self.database.update(project)
+                    self.database.update(project)
+            write.assert_called_once()
+
+        self.assertEqual({"Tester"}, set(self.stored().values()))
+        self.assertEqual([], [name for name in os.listdir("./instance") if name.startswith(".database-")])
+
+    def test_timer(self):
+        """
+            Checks that changes are written after the delay.
+        """
+        self.database.storage.delay = 0.05
+        project = self.database.get_project("R Iris")
+        project.author = "Tester"
+        self.database.update(project)
+
+        time.sleep(0.5)
+        self.assertEqual("Tester", self.stored()["R Iris"])
+
+
+class SQLiteMethodTest(MethodTest):
+    """
+        Runs the tests of the methods on the SQLite database.
+    """
+
+    backend = SQLiteDatabase
+
+    def test_migrate(self):
+        """
+            Checks that the projects of a TinyDB file are migrated into a new SQLite file.
+        """
+        json_path, sqlite_path = "./instance/migrate.json", "./instance/migrate.sqlite"
+        with TinyDB(json_path) as database:
+            database.table("projects").insert_multiple(self.database._all())
+
+        self.assertEqual(4, migrate(json_path, sqlite_path))
+        with sqlite3.connect(sqlite_path) as connection:
+            names = [name for name, in connection.execute("SELECT name FROM projects ORDER BY rowid")]
+        self.assertEqual([project.name for project in self.database.get_projects()], names)
+
+        # projects that already exist are skipped
+        self.assertEqual(0, migrate(json_path, sqlite_path))
+
+    def test_transaction(self):
+        """
+            Checks that the steps of a failed transaction are rolled back.
+        """
+        project = self.database.get_project("R Iris")
+        project.author = "Tester"
+
+        with self.assertRaises(ProjectNotFoundException):
+            with self.database.transaction():
+                self.database.update(project)
+                self.database.get_project("Missing")
+
+        self.assertEqual("Forester Team", self.database.get_project("R Iris").author)
+
+    def test_rename_taken(self):
+        """
+            Checks that renaming a project to the name of another project is refused.
+        """
+        project = self.database.get_project("R Iris")
+        project.name = "Matlab Iris"
+
+        with self.assertRaises(ProjectAlreadyExistsException):
+            self.database.update(project)
+        self.assertEqual("R Iris", self.database.get_project(project.uuid).name)
+
+    def test_clean(self):
+        """
+            Checks that a clean startup deletes the SQLite file and its write-ahead log.
+        """
+        self.database.close()
+        base_path = self.database.base_path
+        for suffix in ["-wal", "-shm"]:
+            open(base_path + suffix, "wb").close()
+
+        with unittest.mock.patch("os.remove", wraps=os.remove) as remove:
+            self.database = self.backend("./instance", clean=True)
+
+        removed = {call.args[0] for call in remove.call_args_list}
+        self.assertLessEqual({base_path, base_path + "-wal", base_path + "-shm"}, removed)
+        self.assertEqual(0, self.database.size())
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -6,7 +6,6 @@ import os
 import shutil
 
 from loguru import logger
-from tinydb import where
 
 from .errors import *
 from .project import Project
@@ -32,7 +31,7 @@ def _cross_validate(database, delete=True):
 	"""
 
 	# check if all database entries have a folder
-	for project in database.database.all():
+	for project in database._all():
 
 		# check if the important fields are in the database
 		if not all(key in project for key in ("uuid", "name", "path")):
@@ -48,7 +47,7 @@ def _cross_validate(database, delete=True):
 		if not os.path.isdir(path):
 
 			if delete:
-				database.database.remove(where('uuid') == project.uuid)
+				database._remove(project.uuid)
 				logger.warning(f"Removed entry {project}")
 			else:
 				logger.error(f"Unlinked entry {project}")
@@ -57,7 +56,7 @@ def _cross_validate(database, delete=True):
 	# check all folders in the data directory for a database entry
 	for name in os.listdir(database.data_path):
 		directory = os.path.join(database.data_path, name)
-		if os.path.isdir(directory) and database.database.contains(where('name') == directory):
+		if os.path.isdir(directory) and database._contains('name', directory):
 			if delete:
 				shutil.rmtree(directory)
 				logger.warning(f"Removed folder ./data/{name}")
@@ -0,0 +1,27 @@
+#  CC-0 2023.
+#  David Strahl, University of Potsdam
+#  Forester: Interactive human-in-the-loop web-based visualization of machine learning trees
+
+import os
+import unittest
+import unittest.mock
+
+from src.forester import api
+
+
+class ConfigTest(unittest.TestCase):
+
+    def test_r_workers(self):
+        """
+            Checks that the number of R workers is taken from the environment before the config.
+        """
+        with unittest.mock.patch.dict(os.environ, {"FORESTER_R_WORKERS": "5"}):
+            self.assertEqual(5, api.r_workers())
+
+        with unittest.mock.patch.dict(os.environ), unittest.mock.patch.dict(api.config, {"r_workers": 3}):
+            os.environ.pop("FORESTER_R_WORKERS", None)
+            self.assertEqual(3, api.r_workers())
+
+
+if __name__ == '__main__':
+    unittest.main()
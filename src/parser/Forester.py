@@ -0,0 +1,315 @@
+#  CC-0 2023.
+#  David Strahl, University of Potsdam
+#  Forester: Interactive human-in-the-loop web-based visualization of machine learning trees
+
+"""
+    Import of trees exported by Forester.
+
+    Exports are already in the Forester JSON format, in the nested or the flat shape (see
+    :mod:`parser.tree`). They are validated in a single pass over the file with the reader
+    of :mod:`parser.stream`, which only decodes the values of one node at a time. A valid
+    file can then be stored as it is, without decoding and encoding it again.
+"""
+
+import os
+import json
+import numpy as np
+from loguru import logger
+
+from .stream import _Reader
+from .timing import stage
+from .tree import TreeArrays, OPERATORS, FLAT_VERSION
+from .errors import InvalidExportException
+
+# types of the nodes
+NODE_TYPES = ('root', 'node', 'leaf')
+
+
+def _is_integer(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+class _Checks:
+    """
+        Checks of the single nodes of a tree. Checks against the meta information are
+        done at the end, as the meta information may follow the nodes in the file.
+    """
+
+    def __init__(self):
+        self.nodes = 0
+        self.n_classes = None
+        self.max_feature = -1
+        self.max_vote = -1
+
+    def node(self, node, n_children, is_root, where):
+        """ Checks the values of a node with the given number of children. """
+        if not isinstance(node, dict):
+            raise InvalidExportException(f"{where} is not an object")
+        self.nodes += 1
+
+        if n_children not in (0, 2):
+            raise InvalidExportException(f"{where} has {n_children} children, only binary trees are supported")
+
+        type = node.get('type')
+        expected = 'root' if is_root else ('node' if n_children else 'leaf')
+        if type not in NODE_TYPES:
+            raise InvalidExportException(f"{where} has the unknown type {type!r}, use one of {', '.join(NODE_TYPES)}")
+        if type != expected:
+            raise InvalidExportException(f"{where} with {n_children} children has type {type}, expected {expected}")
+
+        if 'samples' in node and not (_is_integer(node['samples']) and node['samples'] >= 0):
+            raise InvalidExportException(f"{where} has an invalid number of samples {node['samples']!r}")
+
+        if 'distribution' in node:
+            distribution = node['distribution']
+            if not isinstance(distribution, list) or not all(_is_number(value) for value in distribution):
+                raise InvalidExportException(f"{where} has a distribution that is not a list of numbers")
+            if self.n_classes is None:
+                self.n_classes = len(distribution)
+            elif len(distribution) != self.n_classes:
+                raise InvalidExportException(f"{where} has a distribution of length {len(distribution)}, "
+                                             f"other nodes have {self.n_classes}")
+
+        if 'vote' in node:
+            if not (_is_integer(node['vote']) and node['vote'] >= 0):
+                raise InvalidExportException(f"{where} has an invalid vote {node['vote']!r}")
+            self.max_vote = max(self.max_vote, node['vote'])
+
+        if 'prune' in node and not (_is_integer(node['prune']) and node['prune'] >= 0):
+            raise InvalidExportException(f"{where} has an invalid level of pruning {node['prune']!r}")
+
+        if 'value' in node and not _is_number(node['value']):
+            raise InvalidExportException(f"{where} has an invalid value {node['value']!r}")
+
+        if 'split' in node:
+            split = node['split']
+            if not isinstance(split, dict):
+                raise InvalidExportException(f"{where} has a split that is not an object")
+            if not (_is_integer(split.get('feature')) and split['feature'] >= 0):
+                raise InvalidExportException(f"{where} has a split with an invalid feature {split.get('feature')!r}")
+            if split.get('operator') not in OPERATORS:
+                raise InvalidExportException(f"{where} has a split with the unknown operator {split.get('operator')!r}")
+            if not _is_number(split.get('location')):
+                raise InvalidExportException(f"{where} has a split with an invalid location {split.get('location')!r}")
+            self.max_feature = max(self.max_feature, split['feature'])
+
+    def meta(self, meta):
+        """ Checks the nodes against the features and classes of the tree. """
+        if not isinstance(meta, dict):
+            raise InvalidExportException("The meta information is not an object")
+
+        features, classes = meta.get('features'), meta.get('classes')
+        if features is not None and self.max_feature >= len(features):
+            raise InvalidExportException(f"A split uses feature {self.max_feature}, "
+                                         f"but the tree has {len(features)} features")
+        if classes is not None:
+            if self.n_classes is not None and self.n_classes != len(classes):
+                raise InvalidExportException(f"The distributions have length {self.n_classes}, "
+                                             f"but the tree has {len(classes)} classes")
+            if self.max_vote >= len(classes):
+                raise InvalidExportException(f"A node votes for class {self.max_vote}, "
+                                             f"but the tree has {len(classes)} classes")
+
+
+def _check_nested(reader, checks):
+    """
+        Checks the nested tree at the cursor. The nodes are walked with a stack of
+        open nodes, so that trees of any depth can be checked.
+    """
+    # each open node holds its values, its index in pre-order, its number of children,
+    # whether a value was read already and whether the cursor is within the list of children
+    def open_node(index):
+        reader.expect('{')
+        return {'node': {}, 'index': index, 'children': 0, 'first': True, 'in_children': False}
+
+    stack = [open_node(0)]
+    opened = 1
+
+    while stack:
+        frame = stack[-1]
+        char = reader.peek()
+
+        if frame['in_children']:
+            if char == ord(']'):
+                reader.pos += 1
+                frame['in_children'] = False
+                continue
+            if frame['children'] > 0:
+                reader.expect(',')
+            frame['children'] += 1
+            stack.append(open_node(opened))
+            opened += 1
+            continue
+
+        if char == ord('}'):
+            reader.pos += 1
+            stack.pop()
+            checks.node(frame['node'], frame['children'], frame['index'] == 0, f"Node {frame['index']}")
+            continue
+
+        if not frame['first']:
+            reader.expect(',')
+        frame['first'] = False
+
+        key = reader.read_value()
+        reader.expect(':')
+        if key == 'children':
+            reader.expect('[')
+            frame['in_children'] = True
+        else:
+            frame['node'][key] = reader.read_value()
+
+
+def _check_flat(reader, checks):
+    """ Checks the list of nodes at the cursor and the links between the nodes. """
+    parents, children = [], []
+
+    reader.expect('[')
+    while reader.peek() != ord(']'):
+        if parents:
+            reader.expect(',')
+
+        node = reader.read_value()
+        index = len(parents)
+        where = f"Node {index}"
+
+        links = node.get('children', []) if isinstance(node, dict) else None
+        parent = node.get('parent', -1) if isinstance(node, dict) else None
+        if not isinstance(links, list) or not all(_is_integer(link) for link in links) or not _is_integer(parent):
+            raise InvalidExportException(f"{where} has invalid links to its parent or children")
+
+        checks.node(node, len(links), index == 0, where)
+        parents.append(parent)
+        children.append(links or [-1, -1])
+    reader.pos += 1
+
+    n_nodes = len(parents)
+    parent = np.asarray(parents, dtype=np.int64)
+    links = np.asarray(children, dtype=np.int64).reshape(n_nodes, 2)
+    is_branch = links[:, 0] >= 0
+
+    if n_nodes == 0:
+        raise InvalidExportException("The tree has no nodes")
+    if parent[0] != -1:
+        raise InvalidExportException("The root must be the first node and has no parent")
+    if links[is_branch].min(initial=0) < 0 or links.max() >= n_nodes:
+        raise InvalidExportException(f"The children of a node are not in the tree of {n_nodes} nodes")
+
+    # every node except the root is the child of exactly its parent
+    child = links[is_branch].reshape(-1)
+    owner = np.repeat(np.flatnonzero(is_branch), 2)
+    if len(child) != n_nodes - 1 or len(np.unique(child)) != len(child) or np.any(parent[child] != owner):
+        raise InvalidExportException("The links between parents and children do not match")
+
+    # all nodes are reached from the root level by level, which rules out cycles
+    reached, frontier = 0, np.zeros(1, dtype=np.int64)
+    while len(frontier) > 0:
+        reached += len(frontier)
+        frontier = links[frontier[is_branch[frontier]]].reshape(-1)
+    if reached != n_nodes:
+        raise InvalidExportException("Some nodes are not reached from the root")
+
+
+def _at_end(reader):
+    """ Whether only whitespace follows the cursor. """
+    try:
+        reader.peek()
+    except ValueError:
+        return True
+    return False
+
+
+def validate_export(path, chunk_size=1 << 20) -> dict:
+    """
+    Validates a Forester export in a single pass over the file.
+
+    Checks the type and the number of children of each node, the links between the nodes
+    of the flat shape, the length of the distributions against the classes, the votes
+    and the features of the splits against the meta information of the tree. Only the
+    values of one node are decoded at a time.
+
+    Parameters
+    ----------
+    path: str
+        The path to the JSON file.
+    chunk_size: int
+        Number of bytes that are read at once (default 1 MiB).
+
+    Returns
+    -------
+    dict:
+        The ``shape`` of the tree (``nested`` or ``flat``), the number of ``nodes`` and the ``meta``
+        information.
+
+    Raises
+    ------
+    InvalidExportException
+        When the file is not a valid Forester export.
+    """
+    checks = _Checks()
+    values = {}
+
+    try:
+        with open(path, "rb") as file:
+            reader = _Reader(file, chunk_size)
+            reader.expect('{')
+
+            while reader.peek() != ord('}'):
+                if values:
+                    reader.expect(',')
+                key = reader.read_value()
+                reader.expect(':')
+
+                if key == 'tree' and 'nodes' not in values:
+                    _check_nested(reader, checks)
+                    values[key] = 'nested'
+                elif key == 'nodes' and 'tree' not in values:
+                    _check_flat(reader, checks)
+                    values[key] = 'flat'
+                elif key in ('meta', 'version'):
+                    values[key] = reader.read_value()
+                else:
+                    reader.skip_value()
+                    values[key] = None
+            reader.pos += 1
+
+            if not _at_end(reader):
+                raise InvalidExportException("The file holds data after the tree")
+    except ValueError as e:
+        raise InvalidExportException(f"File is not valid JSON: {e}") from e
+
+    shape = values.get('tree') or values.get('nodes')
+    if shape is None:
+        raise InvalidExportException("File holds no tree, the key 'tree' or 'nodes' is missing")
+    if shape == 'flat' and values.get('version') != FLAT_VERSION:
+        raise InvalidExportException(f"A list of nodes needs the version {FLAT_VERSION}, found {values.get('version')}")
+
+    meta = values.get('meta')
+    checks.meta({} if meta is None else meta)
+
+    return {'shape': shape, 'nodes': checks.nodes, 'meta': meta or {}}
+
+
+def _parse_export(path, **kwargs) -> TreeArrays:
+    """
+    Parses a tree that was exported by Forester. The file is validated before it is decoded.
+
+    :param path: The path to the *.json* file
+    :param kwargs: Additional arguments for parsing the file
+    :return: A common representation of the tree
+    """
+    logger.info('Tree was exported by Forester')
+
+    with stage("validate", bytes=os.path.getsize(path)) as entry:
+        entry['nodes'] = validate_export(path)['nodes']
+
+    with stage("load", bytes=os.path.getsize(path)):
+        with open(path) as file:
+            tree = json.load(file)
+
+    with stage("assemble", nodes=entry['nodes']):
+        return TreeArrays.from_json(tree)
@@ -2,13 +2,41 @@
 #  David Strahl, University of Potsdam
 #  Forester: Interactive human-in-the-loop web-based visualization of machine learning trees
 
+import os
 import numpy as np
-import json
 from loguru import logger
 
 from .utils import _humanize
+from .timing import stage
+from .stream import load_keys, iter_array, iter_key
+from .tree import TreeArrays, OPERATORS
+from .mat import read_mat
+from .sketch import add_histograms
+from .pruning import add_pruning
+from .errors import MatFileException
 
-def _parse_fitctree(path, **kwargs) -> dict:
+# fields of a fitctree object that are needed to create the tree,
+# all other fields (e.g. the training data) are skipped while reading
+FITCTREE_KEYS = ('PredictorNames', 'ClassNames', 'NumObservations', 'NumNodes', 'Parent', 'Children',
+                 'NodeSize', 'ClassCount', 'ClassProbability', 'CutPoint', 'CutPredictorIndex')
+
+# fields with the training data, from which the node of each training row is found,
+# the training data 'X' of JSON files is not loaded but passed through the tree in batches
+FITCTREE_ROW_KEYS = ('X', 'RowsUsed')
+
+# number of rows of the training data that are passed through the tree at once
+ROW_BATCH = 1024
+
+# fields with the pruning sequence, which are empty for trees grown with 'Prune', 'off'
+FITCTREE_PRUNE_KEYS = ('PruneList', 'PruneAlpha')
+
+# fields of a fitrtree object that are needed to create the tree, the
+# training targets 'Y' are read to count the histograms of the nodes
+FITRTREE_KEYS = ('PredictorNames', 'NumObservations', 'NumNodes', 'Parent', 'Children', 'NodeSize',
+                 'NodeMean', 'CutPoint', 'CutPredictorIndex')
+
+
+def _parse_fitctree(path, **kwargs) -> TreeArrays:
     """
     Parse a *.json* object that was generated using Matlab's ``jsonencode`` function
     from the result of a call to ``fitctree``.
@@ -20,51 +48,334 @@ def _parse_fitctree(path, **kwargs) -> dict:
 
     logger.info('CART originates from MATLAB\'s function fitctree')
 
-    fit = json.load(open(path))
+    with stage("load", bytes=os.path.getsize(path)):
+        offsets = {}
+        fit = load_keys(path, FITCTREE_KEYS + ('RowsUsed',) + FITCTREE_PRUNE_KEYS, offsets=offsets, locate=('X',))
+
+    return _fitctree(fit, X=_training_data(path, offsets))
+
+
+def _parse_fitctree_mat(path, **kwargs) -> TreeArrays:
+    """
+    Parse a *.mat* file (version 5 or 7) that holds the fields of a ``fitctree`` object,
+    either as variables or as the fields of a struct. Objects of class ``ClassificationTree``
+    can not be read from *.mat* files, their fields are saved in Matlab with
+
+    .. code-block:: matlab
+
+        fields = {'PredictorNames', 'ClassNames', 'NumObservations', 'NumNodes', 'Parent', ...
+                  'Children', 'NodeSize', 'ClassCount', 'ClassProbability', 'CutPoint', ...
+                  'CutPredictorIndex', 'PruneList', 'PruneAlpha', 'X', 'RowsUsed'};
+        s = struct();
+        for f = fields, s.(f{1}) = tree.(f{1}); end
+        s.ClassNames = cellstr(s.ClassNames);
+        save('tree.mat', '-struct', 's');
+
+    Only the fields of the tree are read, other variables are skipped. The pruning sequence
+    and the training data ``X`` are optional.
+
+    :param path: The path to the *.mat* file
+    :param kwargs: Additional arguments, ``name`` selects the struct that holds the fields
+    :return: A common representation of the tree
+    """
+
+    logger.info('CART originates from MATLAB\'s function fitctree, saved as MAT-file')
+
+    with stage("load", bytes=os.path.getsize(path)):
+        variables = read_mat(path, FITCTREE_KEYS + FITCTREE_ROW_KEYS + FITCTREE_PRUNE_KEYS)
+
+    return _fitctree(_find_fitctree(variables, kwargs.get('name')))
+
+
+def _parse_fitrtree(path, **kwargs) -> TreeArrays:
+    """
+    Parse a *.json* object that was generated using Matlab's ``jsonencode`` function
+    from the result of a call to ``fitrtree``.
+
+    :param fit: The *.json* object that was produced by Matlab
+    :param kwargs: Additional arguments for parsing the object
+    :return: A common representation of the tree
+    """
+
+    logger.info('CART originates from MATLAB\'s function fitrtree')
+
+    with stage("load", bytes=os.path.getsize(path)):
+        offsets = {}
+        fit = load_keys(path, FITRTREE_KEYS + ('RowsUsed', 'Y') + FITCTREE_PRUNE_KEYS, offsets=offsets, locate=('X',))
+
+    return _fitrtree(fit, X=_training_data(path, offsets))
+
+
+def _training_data(path, offsets):
+    """
+    Returns the batches of rows of the training data ``X`` of a *.json* file, which are
+    read from the position of ``X`` that :func:`parser.stream.load_keys` recorded in `offsets`,
+    or `None` when the file holds no ``X``.
+    """
+    if 'X' not in offsets:
+        return None
+    return iter_key(path, 'X', size=ROW_BATCH, offset=offsets['X'])
+
+
+def _find_fitctree(variables, name=None):
+    """ Returns the fields of a fitctree object, saved as variables or in the struct with the given name. """
+    if name is None and all(key in variables for key in FITCTREE_KEYS):
+        return variables
+
+    structs = [value for key, value in variables.items() if isinstance(value, dict) and (name is None or key == name)]
+    for fit in structs:
+        if all(key in fit for key in FITCTREE_KEYS):
+            return fit
+
+    missing = [key for key in FITCTREE_KEYS if key not in (structs[0] if structs else variables)]
+    raise MatFileException(f"MAT-file does not hold the fields of a fitctree object, missing {', '.join(missing)}")
+
+
+def _iter_fitctree(path, **kwargs):
+    """
+    Iterates over the trees of an ensemble, given as a *.json* array of ``fitctree``
+    objects, e.g. from ``jsonencode(ensemble.Trees)``. The trees are read one at a time.
+
+    :param path: The path to the *.json* file
+    :param kwargs: Additional arguments for parsing the objects
+    :return: A generator of the trees
+    """
+    logger.info('Ensemble originates from MATLAB\'s function fitctree')
+
+    for fit in iter_array(path, FITCTREE_KEYS + FITCTREE_PRUNE_KEYS):
+        yield _fitctree(fit)
+
+
+def _fitctree(fit, X=None) -> TreeArrays:
+    """
+    Creates the tree from the fields of a ``fitctree`` object. The training data is taken
+    from `X`, an iterable of batches of rows, or else from the field ``X`` of the object.
+    """
 
     # general info describing the tree
-    meta = {
-        'type': 'classification',
-        'features': _humanize(fit['PredictorNames']),
-        'classes': _humanize(fit['ClassNames']),
-        'samples': int(fit['NumObservations'])
-    }
+    with stage("humanize"):
+        meta = {
+            'type': 'classification',
+            'features': _humanize(fit['PredictorNames']),
+            'classes': _humanize(fit['ClassNames']),
+            'samples': int(fit['NumObservations'])
+        }
+
+    # convert the tree fields into arrays once
+    with stage("extract", nodes=int(fit['NumNodes'])):
+        arrays = _fitctree_arrays(fit)
 
-    # total number of nodes
-    n_nodes = fit['NumNodes']
-
-    # go through all nodes, they are organized in a level-first manner
-    nodes = []
-    for i in range(fit['NumNodes']):
-        # info about the node
-        node = {
-            'children': [],
-            'type': 'root' if fit['Parent'][i] == 0 else ('leaf' if sum(fit['Children'][i]) == 0 else 'node'),
-            'samples': int(fit['NodeSize'][i]),
-            'distribution': [int(s) for s in fit['ClassCount'][i]],
-            'vote': int(np.argmax(fit['ClassProbability'][i])),
-            'parent': fit['Parent'][i] - 1
+    # assemble tree structure
+    with stage("assemble"):
+        tree = _fitctree_tree(arrays, meta)
+        _fitctree_pruning(tree, fit)
+
+    _fitctree_membership(tree, fit, arrays, X)
+    return tree
+
+
+def _fitrtree(fit, X=None) -> TreeArrays:
+    """
+    Creates the tree from the fields of a ``fitrtree`` object. When the object holds the
+    training data, the nodes hold the histograms of the targets ``Y`` (see :mod:`parser.sketch`).
+    """
+
+    # general info describing the tree
+    with stage("humanize"):
+        meta = {
+            'type': 'regression',
+            'features': _humanize(fit['PredictorNames']),
+            'classes': ['Samples'],
+            'samples': int(fit['NumObservations'])
         }
 
-        # add info about split, whenever node is not leaf
-        if fit['CutPoint'][i] is not None:
-            node['split'] = {
-                'feature': fit['CutPredictorIndex'][i] - 1,
-                'operator': '<',
-                'location': fit['CutPoint'][i]
-            }
+    with stage("extract", nodes=int(fit['NumNodes'])):
+        arrays = _fitctree_arrays(fit)
 
-        nodes.append(node)
+    with stage("assemble"):
+        tree = _fitctree_tree(arrays, meta)
+        _fitctree_pruning(tree, fit)
 
-    for i in reversed(range(fit['NumNodes'])):
-        node = nodes[i]
+    _fitctree_membership(tree, fit, arrays, X)
 
-        if (j := node["parent"]) >= 0:
-            parent = nodes[j]
-            parent["children"].append(node)
-            nodes[j] = parent
+    # the targets belong to the rows of X
+    if tree.rows is not None and fit.get('Y') is not None:
+        with stage("sketch", nodes=len(tree), rows=len(tree.rows)):
+            add_histograms(tree, np.array(fit['Y'], dtype=float))
 
-        del node["parent"]
+    return tree
 
-    # assemble tree structure
-    return {'meta': meta, 'tree': nodes[0]}
\ No newline at end of file
+
+def _fitctree_arrays(fit) -> dict:
+    """
+    Converts the node fields of a ``fitctree`` or ``fitrtree`` object into NumPy arrays.
+
+    Matlab's ``jsonencode`` drops the outer brackets of matrices with a single row,
+    therefore all fields are reshaped to the number of nodes. Missing cut points
+    (``null``) are converted to ``NaN``.
+    """
+    n_nodes = int(fit['NumNodes'])
+
+    arrays = {
+        'parent': np.asarray(fit['Parent'], dtype=int).reshape(n_nodes),
+        'children': np.asarray(fit['Children'], dtype=int).reshape(n_nodes, 2),
+        'size': np.asarray(fit['NodeSize'], dtype=int).reshape(n_nodes),
+        'cut_point': np.array(fit['CutPoint'], dtype=float).reshape(n_nodes),
+        'cut_predictor_index': np.asarray(fit['CutPredictorIndex'], dtype=int).reshape(n_nodes)
+    }
+
+    # regression trees hold the mean of each node instead of the classes
+    if 'NodeMean' in fit:
+        arrays['node_mean'] = np.array(fit['NodeMean'], dtype=float).reshape(n_nodes)
+    else:
+        arrays['class_count'] = np.asarray(fit['ClassCount'], dtype=float).reshape(n_nodes, -1)
+        arrays['class_probability'] = np.asarray(fit['ClassProbability'], dtype=float).reshape(n_nodes, -1)
+
+    return arrays
+
+
+def _fitctree_tree(arrays, meta) -> TreeArrays:
+    """
+    Creates the tree from the arrays of a ``fitctree`` or ``fitrtree`` object.
+
+    Votes, splits and child links are each computed on the whole arrays. The nodes
+    keep Matlab's level-first order, the first node is the root. Children are
+    linked with the higher node index first. The nodes of regression trees hold their
+    mean as value and their number of samples as distribution.
+    """
+    children = arrays['children']
+    regression = 'node_mean' in arrays
+    is_branch = children.sum(axis=1) > 0
+
+    # nodes that hold a split, the indices in Matlab start at one
+    has_split = ~np.isnan(arrays['cut_point'])
+
+    return TreeArrays(
+        parent=arrays['parent'].astype(np.int32) - 1,
+        left=np.where(is_branch, children.max(axis=1) - 1, -1).astype(np.int32),
+        right=np.where(is_branch, children.min(axis=1) - 1, -1).astype(np.int32),
+        feature=np.where(has_split, arrays['cut_predictor_index'] - 1, -1).astype(np.int32),
+        operator=np.where(has_split, OPERATORS.index('<'), -1).astype(np.int8),
+        threshold=arrays['cut_point'],
+        samples=arrays['size'].astype(np.int64),
+        # most probable class in each node
+        vote=np.zeros(len(children), dtype=np.int32) if regression
+        else np.argmax(arrays['class_probability'], axis=1).astype(np.int32),
+        distribution=arrays['size'][:, None].astype(int) if regression else arrays['class_count'].astype(int),
+        meta=meta,
+        value=arrays['node_mean'] if regression else None
+    )
+
+
+def _fitctree_pruning(tree, fit):
+    """ Stores the pruning sequence of ``PruneList`` and ``PruneAlpha``, when the object holds one. """
+    prune_list = np.asarray([] if fit.get('PruneList') is None else fit['PruneList'], dtype=float).reshape(-1)
+    prune_alpha = np.asarray([] if fit.get('PruneAlpha') is None else fit['PruneAlpha'], dtype=float).reshape(-1)
+
+    if len(prune_list) == len(tree) and len(prune_alpha):
+        add_pruning(tree, prune_list.astype(np.int32), 'alpha', prune_alpha)
+    return tree
+
+
+def _fitctree_membership(tree, fit, arrays, X=None):
+    """
+    Stores the node of each training row in the tree, when the object holds the training
+    data. The objects only hold the training data when they were not compacted.
+    """
+    if X is None:
+        if fit.get('X') is None or not len(fit['X']):
+            return tree
+        X = [fit['X']]
+
+    with stage("rows", nodes=len(tree)) as entry:
+        rows = _fitctree_rows(X, fit.get('RowsUsed'), arrays)
+        if rows is not None:
+            tree.rows, tree.row_ids = rows
+        entry['rows'] = 0 if rows is None else len(tree.rows)
+    return tree
+
+
+def _fitctree_matrix(X) -> np.ndarray:
+    """ Converts rows of the training data ``X`` into a matrix, values that are not numbers are ``NaN``. """
+    # tables are encoded as one object per row, matrices as one list per row,
+    # matrices read from MAT-files are already arrays
+    if isinstance(X, np.ndarray) and X.dtype.kind in 'fiub':
+        return X.astype(float, copy=False).reshape(len(X), -1)
+
+    if isinstance(X[0], dict):
+        X = [list(row.values()) for row in X]
+
+    # rows that only hold numbers are converted at once
+    try:
+        matrix = np.array(X)
+    except ValueError:
+        matrix = None
+    if matrix is not None and matrix.dtype.kind in 'fiub':
+        return matrix.astype(float, copy=False).reshape(len(X), -1)
+
+    return np.array([[value if isinstance(value, (int, float)) else np.nan for value in np.atleast_1d(row)]
+                     for row in X], dtype=float).reshape(len(X), -1)
+
+
+def _fitctree_route(X, arrays) -> np.ndarray:
+    """
+    Passes rows of the training data through the tree and returns the node of each row.
+
+    Matlab sends rows with ``x < CutPoint`` to the first child in ``Children``. Rows with a
+    missing value of the split feature and rows at categorical splits, which have no cut
+    point, stop at the inner node.
+    """
+    children = arrays['children'] - 1
+    feature = arrays['cut_predictor_index'] - 1
+    cut_point = arrays['cut_point']
+
+    rows = np.zeros(len(X), dtype=int)
+    active = np.arange(len(X))
+
+    # all rows move down one level at a time, until they reach a leaf or stop
+    while len(active):
+        node = rows[active]
+        value = X[active, feature[node].clip(0)]
+        moves = (children[node, 0] >= 0) & ~np.isnan(cut_point[node]) & ~np.isnan(value)
+        active, node, value = active[moves], node[moves], value[moves]
+        rows[active] = np.where(value < cut_point[node], children[node, 0], children[node, 1])
+
+    return rows
+
+
+def _fitctree_rows(X, rows_used, arrays):
+    """
+    Finds the node of each training row by passing the training data ``X`` through the tree,
+    one batch of rows at a time, so that the whole training data is never held in memory.
+    Only the rows marked in ``RowsUsed`` are kept.
+
+    Parameters
+    ----------
+    X: iterable
+        Batches of rows of the training data.
+    rows_used: array_like
+        The field ``RowsUsed``, may be `None` or empty.
+    arrays: dict
+        The arrays of the tree, see :func:`_fitctree_arrays`.
+
+    Returns
+    -------
+    tuple:
+        The node of each row of ``X`` (``-1`` for rows that were not used) and the ids of the
+        rows in the original training data or `None` when they are the positions in ``X``.
+        `None` when ``X`` has no rows.
+    """
+    batches = [_fitctree_route(_fitctree_matrix(batch), arrays) for batch in X if len(batch)]
+    if not batches:
+        return None
+    rows = np.concatenate(batches)
+
+    # rows that were used are marked in the original data, which X may already be reduced to
+    used = np.asarray([] if rows_used is None else rows_used, dtype=bool).reshape(-1)
+    ids = None
+    if len(used) and len(used) != len(rows):
+        ids = np.flatnonzero(used)
+    elif len(used):
+        rows[~used] = -1
+
+    return rows, ids
@@ -0,0 +1,171 @@
+#  CC-0 2023.
+#  David Strahl, University of Potsdam
+#  Forester: Interactive human-in-the-loop web-based visualization of machine learning trees
+
+"""
+    Parsing of trees trained in Python with scikit-learn.
+
+    The arrays of a fitted ``tree_`` object are read from an ``.npz`` file, which
+    can be written without any Forester code:
+
+    .. code-block:: python
+
+        t = clf.tree_
+        numpy.savez("tree.npz", children_left=t.children_left, children_right=t.children_right,
+                    feature=t.feature, threshold=t.threshold, value=t.value,
+                    n_node_samples=t.n_node_samples, feature_names=clf.feature_names_in_,
+                    classes=clf.classes_.astype(str))
+
+    ``feature_names`` and ``classes`` are optional. scikit-learn does not need to be
+    installed to read the file.
+"""
+
+import os
+import mmap
+import struct
+import zipfile
+import numpy as np
+
+from loguru import logger
+
+from .utils import _humanize
+from .tree import TreeArrays, OPERATORS
+from .timing import stage
+
+# arrays of the tree_ object that are needed to create the tree
+SKLEARN_KEYS = ('children_left', 'children_right', 'feature', 'threshold', 'value', 'n_node_samples')
+
+# optional arrays with the names of the features and classes
+SKLEARN_NAMES = ('feature_names', 'classes')
+
+# fixed part of the local file header of a zip member
+_LOCAL_HEADER = struct.Struct("<4s5H3L2H")
+
+
+def _load_npz(path, keys):
+    """
+    Loads arrays from an ``.npz`` file.
+
+    ``numpy.load`` ignores ``mmap_mode`` for ``.npz`` files. Members that are stored
+    without compression (``numpy.savez``) are therefore mapped directly from the file,
+    members of ``numpy.savez_compressed`` are decompressed as usual.
+
+    Parameters
+    ----------
+    path: str
+        The path to the file.
+    keys: tuple
+        Names of the arrays to load, missing arrays are skipped.
+
+    Returns
+    -------
+    dict:
+        The arrays by name.
+    """
+    arrays = {}
+
+    with open(path, "rb") as file, zipfile.ZipFile(file) as archive:
+        members = {info.filename[:-4]: info for info in archive.infolist() if info.filename.endswith(".npy")}
+        buffer = None
+
+        for key in keys:
+            if key not in members:
+                continue
+            info = members[key]
+
+            if info.compress_type != zipfile.ZIP_STORED:
+                with archive.open(info) as member:
+                    arrays[key] = np.lib.format.read_array(member, allow_pickle=False)
+                continue
+
+            if buffer is None:
+                buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+            # the data of the member follows its local header
+            header = _LOCAL_HEADER.unpack_from(buffer, info.header_offset)
+            start = info.header_offset + _LOCAL_HEADER.size + header[-2] + header[-1]
+
+            # the member itself is a .npy file with its own header
+            with archive.open(info) as member:
+                version = np.lib.format.read_magic(member)
+                read_header = np.lib.format.read_array_header_1_0 if version == (1, 0) \
+                    else np.lib.format.read_array_header_2_0
+                shape, fortran_order, dtype = read_header(member)
+                offset = member.tell()
+
+            if dtype.hasobject:
+                raise ValueError(f"Array {key} holds Python objects, which are not loaded")
+
+            array = np.frombuffer(buffer, dtype=dtype, count=int(np.prod(shape)), offset=start + offset)
+            arrays[key] = array.reshape(shape, order='F' if fortran_order else 'C')
+
+    return arrays
+
+
+def _parse_sklearn(path, **kwargs) -> TreeArrays:
+    """
+    Parses the arrays of a scikit-learn ``DecisionTreeClassifier`` from an ``.npz`` file.
+
+    :param path: The path to the *.npz* file
+    :param kwargs: Additional arguments for parsing the object
+    :return: A common representation of the tree
+    """
+    logger.info('CART originates from scikit-learn')
+
+    with stage("load", bytes=os.path.getsize(path)):
+        arrays = _load_npz(path, SKLEARN_KEYS + SKLEARN_NAMES)
+
+    missing = [key for key in SKLEARN_KEYS if key not in arrays]
+    if missing:
+        raise KeyError(f"Arrays {', '.join(missing)} are missing in {path}")
+
+    with stage("extract", nodes=len(arrays['children_left'])):
+        left = np.asarray(arrays['children_left'], dtype=np.int32)
+        right = np.asarray(arrays['children_right'], dtype=np.int32)
+        samples = np.asarray(arrays['n_node_samples'], dtype=np.int64)
+        n_nodes = len(left)
+
+        # only the first output of multi-output trees is used
+        value = np.asarray(arrays['value'], dtype=float).reshape(n_nodes, -1, np.shape(arrays['value'])[-1])[:, 0, :]
+
+        # newer versions of scikit-learn store fractions instead of counts
+        if np.allclose(value.sum(axis=1), 1):
+            value = value * samples[:, None]
+        distribution = np.rint(value).astype(np.int64)
+
+    with stage("assemble"):
+        # leaves have -1 as children and -2 as feature and threshold
+        is_branch = left >= 0
+
+        parent = np.full(n_nodes, -1, dtype=np.int32)
+        parent[left[is_branch]] = np.flatnonzero(is_branch)
+        parent[right[is_branch]] = np.flatnonzero(is_branch)
+
+        # samples go to the left child when the feature is smaller or equal to the threshold
+        tree = TreeArrays(
+            parent=parent,
+            left=left,
+            right=right,
+            feature=np.where(is_branch, arrays['feature'], -1).astype(np.int32),
+            operator=np.where(is_branch, OPERATORS.index('<='), -1).astype(np.int8),
+            threshold=np.where(is_branch, arrays['threshold'], np.nan),
+            samples=samples,
+            vote=np.argmax(value, axis=1).astype(np.int32),
+            distribution=distribution
+        )
+
+    with stage("humanize"):
+        n_features = int(arrays['feature'].max()) + 1 if n_nodes > 0 else 0
+        features = [str(f) for f in arrays['feature_names']] if 'feature_names' in arrays \
+            else [f"Feature {i + 1}" for i in range(n_features)]
+        classes = [str(c) for c in arrays['classes']] if 'classes' in arrays \
+            else [f"Class {i + 1}" for i in range(distribution.shape[1])]
+
+        tree.meta = {
+            'type': 'classification',
+            'features': _humanize(features),
+            'classes': _humanize(classes),
+            'samples': int(samples[0])
+        }
+
+    return tree
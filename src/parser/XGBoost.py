@@ -0,0 +1,124 @@
+#  CC-0 2023.
+#  David Strahl, University of Potsdam
+#  Forester: Interactive human-in-the-loop web-based visualization of machine learning trees
+
+"""
+    Parsing of boosted ensembles from XGBoost.
+
+    The trees are read from the JSON dump of a booster, which XGBoost writes with
+
+    .. code-block:: python
+
+        booster.dump_model("dump.json", dump_format="json", with_stats=True)
+
+    The dump is a JSON array with one nested tree per element. The trees are read one
+    after another, so that the whole dump is never held in memory. The leaves of a
+    boosted tree hold a score instead of a class distribution, it is stored as the
+    only column of the distribution. Inner nodes hold the mean score of their leaves,
+    weighted by the cover (hessian sum) when the dump contains statistics.
+"""
+
+import numpy as np
+from loguru import logger
+
+from .utils import _humanize
+from .tree import TreeArrays, OPERATORS
+from .stream import iter_array
+
+
+def _xgboost_tree(dump, features) -> TreeArrays:
+    """
+    Converts one tree of an XGBoost JSON dump.
+
+    Parameters
+    ----------
+    dump: dict
+        The nested tree with the keys ``nodeid``, ``split``, ``split_condition``, ``yes``,
+        ``no`` and ``children`` for inner nodes and ``leaf`` for leaves.
+    features: dict
+        Index of each feature name, names that are not yet known are added.
+
+    Returns
+    -------
+    TreeArrays:
+        The tree in pre-order, the ``yes`` branch is the first child.
+    """
+    nodes, parents = [], []
+    stack = [(dump, -1)]
+    while stack:
+        node, parent = stack.pop()
+        parents.append(parent)
+        index = len(nodes)
+        nodes.append(node)
+
+        if 'leaf' not in node:
+            if 'split_condition' not in node:
+                raise ValueError("Categorical splits of XGBoost are not supported")
+            children = {child['nodeid']: child for child in node['children']}
+            stack.extend([(children[node['no']], index), (children[node['yes']], index)])
+
+    n_nodes = len(nodes)
+    parent = np.asarray(parents, dtype=np.int32)
+    is_leaf = np.asarray(['leaf' in node for node in nodes])
+
+    left = np.full(n_nodes, -1, dtype=np.int32)
+    right = np.full(n_nodes, -1, dtype=np.int32)
+    for i in range(1, n_nodes):
+        if left[parent[i]] < 0:
+            left[parent[i]] = i
+        else:
+            right[parent[i]] = i
+
+    feature = np.asarray([-1 if leaf else features.setdefault(node['split'], len(features))
+                          for node, leaf in zip(nodes, is_leaf.tolist())], dtype=np.int32)
+    threshold = np.asarray([np.nan if leaf else node['split_condition']
+                            for node, leaf in zip(nodes, is_leaf.tolist())], dtype=float)
+    cover = np.asarray([node.get('cover', 1.0) for node in nodes], dtype=float)
+
+    # the score of an inner node is the weighted mean of its leaves, summed
+    # up from the leaves to the root, children follow their parent in pre-order
+    weight = np.where(is_leaf, cover, 0.0)
+    score = np.asarray([node.get('leaf', 0.0) for node in nodes], dtype=float) * weight
+    for i in range(n_nodes - 1, 0, -1):
+        weight[parent[i]] += weight[i]
+        score[parent[i]] += score[i]
+    score = np.divide(score, weight, out=np.zeros(n_nodes), where=weight > 0)
+
+    return TreeArrays(
+        parent=parent,
+        left=left,
+        right=right,
+        feature=feature,
+        # samples go to the 'yes' branch when the feature is smaller than the threshold
+        operator=np.where(is_leaf, -1, OPERATORS.index('<')).astype(np.int8),
+        threshold=threshold,
+        samples=np.rint(cover).astype(np.int64) if 'cover' in dump else np.zeros(n_nodes, dtype=np.int64),
+        vote=np.zeros(n_nodes, dtype=np.int32),
+        distribution=score[:, None]
+    )
+
+
+def _iter_xgboost_dump(path, **kwargs):
+    """
+    Iterates over the trees of an XGBoost JSON dump.
+
+    :param path: The path to the *.json* dump
+    :param kwargs: Additional arguments for parsing, ``features`` may hold the names of the features
+    :return: A generator of the trees, which share their feature table
+    """
+    logger.info('Ensemble originates from XGBoost')
+
+    features = {name: i for i, name in enumerate(kwargs.get('features', []))}
+
+    for dump in iter_array(path):
+        tree = _xgboost_tree(dump, features)
+
+        # the feature table grows while the dump is read, every tree
+        # references the table as it is known at its position
+        tree.meta = {
+            'type': 'regression',
+            'features': _humanize(list(features)),
+            'classes': ['Score'],
+            'samples': int(tree.samples[0])
+        }
+        yield tree
@@ -3,56 +3,145 @@
 #  Forester: Interactive human-in-the-loop web-based visualization of machine learning trees
 
 import os
-import traceback
-import dataclasses
 from loguru import logger
 
 from .errors import UnknownFormatException
+from .pool import WorkerPool, R_POOL
+from .registry import Parser, entry_point_parsers
+from .batch import parse_many, ParseBatch, ParseResult
+from .tree import TreeArrays, as_json, is_flat, json_version, flatten, nest, iterencode, dump
+from .binary import write_tree, open_tree, EnsembleWriter, open_ensemble, write_membership, open_membership
+from .membership import Membership
+from .pruning import prune, pruning_level, pruning_sequence
+from .timing import ParseTimings, stage
+from .Forester import validate_export
+from . import sniff
 
 # supported formats for parsing a file
 FORMATS = {}
+# supported formats for parsing the trees of an ensemble
+ENSEMBLES = {}
 # errors for the given formats
 ERRORS = {}
 
-def has(format):
-	return format.lower() in FORMATS.keys()
+def _registry(ensemble):
+	return ENSEMBLES if ensemble else FORMATS
 
-def register(format, parser):
-	FORMATS[format] = parser
+def has(format, ensemble=False):
+	return format.lower() in _registry(ensemble).keys()
 
-def unregister(format):
-	del FORMATS[format]
+def available(format, ensemble=False):
+	"""
+		Whether a registered parser can be used for the format.
+		This does not import the parsing module.
+	"""
+	return has(format, ensemble) and _registry(ensemble)[format.lower()].available()
 
-def error_message(format):
+def register(format, parser, ensemble=False):
+	"""
+		Registers the parser of a format. Parsers of ensembles (`ensemble`) are
+		generators that yield the trees of a file one after another.
+	"""
+	if not isinstance(parser, Parser):
+		parser = Parser.from_function(format.lower(), parser)
+	_registry(ensemble)[format.lower()] = parser
+
+def unregister(format, ensemble=False):
+	del _registry(ensemble)[format.lower()]
+
+def error_message(format, ensemble=False):
 	if format.lower() in ERRORS.keys():
-		return ERRORS[format]
+		return ERRORS[format.lower()]
+	elif has(format, ensemble) and not available(format, ensemble):
+		return _registry(ensemble)[format.lower()].error
 	else:
 		return None
 
 # register the parser for matlab
-try:
-	from .Matlab import _parse_fitctree
-	register('json.matlab.fitctree', _parse_fitctree)
-except Exception as e:
-	error = f"Unable to load Matlab parsing module due to error: {e}"
-	logger.error(error)
-	logger.error("Module will be disabled.")
-	logger.error(traceback.format_exc())
-	ERRORS['json.matlab.fitctree'] = error
-
-
-# register the parser for R
-try:
-	from .R import _parse_rpart_class
-	register('rdata.r.rpart', _parse_rpart_class)
-except Exception as e:
-	error = f"Unable to load R parsing module due to error: {e}"
-	logger.error(error)
-	logger.error("Module will be disabled.")
-	logger.error(traceback.format_exc())
-	ERRORS['rdata.r.rpart'] = error
-
-def parse(path, **kwargs):
+register('json.matlab.fitctree', Parser('json.matlab.fitctree', f"{__name__}.Matlab", "_parse_fitctree", version=2))
+register('mat.matlab.fitctree', Parser('mat.matlab.fitctree', f"{__name__}.Matlab", "_parse_fitctree_mat", version=2))
+register('json.matlab.fitrtree', Parser('json.matlab.fitrtree', f"{__name__}.Matlab", "_parse_fitrtree"))
+
+# register the importer of Forester's own exports
+register('json.forester.export', Parser('json.forester.export', f"{__name__}.Forester", "_parse_export"))
+
+# register the parser for scikit-learn
+register('npz.python.sklearn', Parser('npz.python.sklearn', f"{__name__}.Python", "_parse_sklearn"))
+
+# register the parser for R, files are read without R and only files that
+# can not be read are parsed by the R runtime within the workers of the R pool
+register('rdata.r.rpart', Parser('rdata.r.rpart', f"{__name__}.rpart", "_parse_rpart_class", version=3))
+
+# register the parsers of ensembles
+register('json.xgboost.dump', Parser('json.xgboost.dump', f"{__name__}.XGBoost", "_iter_xgboost_dump"), ensemble=True)
+register('json.matlab.fitctree', Parser('json.matlab.fitctree', f"{__name__}.Matlab", "_iter_fitctree"), ensemble=True)
+register('rdata.r.rpart', Parser('rdata.r.rpart', f"{__name__}.rpart", "_iter_rpart"), ensemble=True)
+
+# register the parsers of other packages
+for entry_point_parser in entry_point_parsers():
+	logger.info(f"Found parser {entry_point_parser.module}:{entry_point_parser.function} "
+	            f"for format {entry_point_parser.format}")
+	register(entry_point_parser.format, entry_point_parser)
+
+def format_key(path, kwargs):
+	"""
+		Returns the format key ``type.vendor.origin`` under which a file is parsed.
+		Missing values in `kwargs` are filled in from the detected format of the file, when it
+		agrees with the given values, and otherwise with the defaults that :func:`parse` uses.
+		Given values are never replaced.
+	"""
+	# the detected format only fills in the values that were not given
+	detected = sniff.sniff(path) if os.path.isfile(path) else None
+	if detected is not None:
+		detected = dict(zip(("type", "vendor", "origin"), detected.split(".")))
+		if any(str(kwargs[key]).lower() != value for key, value in detected.items() if key in kwargs):
+			detected = None
+
+	# check if there is a file type in the arguments
+	# if not extract from path
+	if "type" not in kwargs:
+		kwargs['type'] = detected['type'] if detected else str(path.split(".").pop())
+
+	# use Forester as default vendor
+	if "vendor" not in kwargs:
+		kwargs['vendor'] = detected['vendor'] if detected else "Forester"
+
+	# use Forester export as default origin
+	if "origin" not in kwargs:
+		kwargs['origin'] = detected['origin'] if detected else "export"
+
+	# combine into format key
+	return (kwargs['type'] + "." + kwargs['vendor'] + "." + kwargs['origin']).lower()
+
+def check(path, kwargs, ensemble=False):
+	"""
+		Checks whether a file can be parsed and returns its format key.
+		Missing values in `kwargs` are filled in, as in :func:`format_key`.
+		With `ensemble`, the parsers of ensembles are checked.
+
+		Only the first and last few KB of the file are read. When the file does not
+		have any of the detected formats, it is only accepted for parsers that are
+		not known to :mod:`parser.sniff`.
+
+		Raises
+		------
+		UnknownFormatException
+			When no parser is available or the file does not match the format.
+	"""
+	format = format_key(path, kwargs)
+
+	if not has(format, ensemble):
+		raise UnknownFormatException(f"No module loaded that can parse {'ensembles of ' if ensemble else ''}format {format}")
+
+	if format in sniff.FORMATS and sniff.sniff(path) != format:
+		raise UnknownFormatException(f"File {os.path.basename(path)} is not a valid {format} file")
+
+	if not available(format, ensemble):
+		raise UnknownFormatException(f"Format {format} can not be parsed: {error_message(format, ensemble)}")
+
+	return format
+
+def parse(path, shape="nested", timings=None, **kwargs):
     """
     Converts some output formats from Matlab and R into the Forester generalized format.
 
@@ -65,13 +154,20 @@ def parse(path, **kwargs):
     ----------
     path: str
           The path to the output file to be loaded. May be absolute or relative.
+    shape: str
+           Either ``nested`` (default) or ``flat``, see :mod:`parser.tree`. Only the flat
+           shape can be encoded by ``json.dumps`` for trees of any depth. With ``arrays``,
+           the tree is returned as :class:`TreeArrays`, which can be written with :func:`dump`.
+    timings: ParseTimings
+             Record into which the duration, number of nodes and bytes of each stage of
+             parsing are written, see :mod:`parser.timing`. The record is logged in any case.
     kwargs: dict
             Dictionary containing some additional information for the parser. See Notes.
 
     Returns
     -------
-    str
-        The generalized Forester tree structure as a .json string
+    dict or TreeArrays
+        The generalized Forester tree structure
 
     Examples
     --------
@@ -101,8 +197,9 @@ def parse(path, **kwargs):
             file.write(json.dumps(mat))
             file.close()
 
-    Because the parser can not read .mat files directly and the result from Matlab is given as .json,
-    the user may need to set the origin algorithm using the ``origin`` field.
+    Output from Matlab can also be saved as a .mat file that holds the fields of the tree, see
+    :func:`parser.Matlab._parse_fitctree_mat`. As the files do not tell which function created
+    the tree, the user may need to set the origin algorithm using the ``origin`` field.
 
     Notes
     -----
@@ -117,23 +214,57 @@ def parse(path, **kwargs):
 
     logger.info("Loading CART structure from file " + path)
 
-    # check if there is a file type in the arguments
-    # if not extract from path
-    if "type" not in kwargs:
-        kwargs['type'] = str(path.split(".").pop())
+    timings = timings if timings is not None else ParseTimings()
+    timings.path = path
+
+    with timings.activate():
+        # complete the format information, the format
+        # is detected from the content of the file
+        with stage("sniff", bytes=os.path.getsize(path)):
+            format = check(path, kwargs)
+        timings.format = format
+
+        tree = FORMATS[format](path, **kwargs)
+
+        # parsers may return the columnar tree, which is converted here
+        if shape != "arrays":
+            with stage("serialize", shape=shape) as entry:
+                if isinstance(tree, TreeArrays):
+                    entry['nodes'] = len(tree)
+                tree = as_json(tree, shape)
+        else:
+            tree = as_json(tree, shape)
+
+    logger.info(f"Parsed {os.path.basename(path)} as {timings}")
+
+    return tree
+
+def parse_ensemble(path, **kwargs):
+	"""
+		Parses the trees of an ensemble (e.g. a random forest or a boosted model) one
+		after another, so that only one tree is held in memory at a time.
+
+		Parameters
+		----------
+		path: str
+			The path to the file that holds the trees.
+		kwargs: dict
+			Information on the format, as for :func:`parse`.
+
+		Returns
+		-------
+		generator:
+			The trees as :class:`TreeArrays`.
 
-    # use Forester as default vendor
-    if "vendor" not in kwargs:
-        kwargs['vendor'] = "Forester"
+		Raises
+		------
+		UnknownFormatException
+			When no parser for ensembles of the format is available.
+	"""
+	path = os.path.abspath(path)
 
-    # use Forester export as default origin
-    if "origin" not in kwargs:
-        kwargs['origin'] = "export"
+	logger.info("Loading ensemble from file " + path)
 
-    # combine into format key
-    format = (kwargs['type'] + "." + kwargs['vendor'] + "." + kwargs['origin']).lower()
+	format = check(path, kwargs, ensemble=True)
 
-    if has(format):
-        return FORMATS[format](path, **kwargs)
-    else:
-        raise UnknownFormatException(f"No module loaded that can parse format {format}")
\ No newline at end of file
+	return ENSEMBLES[format](path, **kwargs)
@@ -0,0 +1,183 @@
+#  CC-0 2023.
+#  David Strahl, University of Potsdam
+#  Forester: Interactive human-in-the-loop web-based visualization of machine learning trees
+
+"""
+    Parsing of many files in parallel.
+
+    The files are distributed over a pool of worker processes. Each worker only imports
+    the parsing modules for the formats in the batch, so that e.g. the R runtime is not
+    started for a batch of Matlab files. Within a worker, parsers run directly and not
+    in the pool that they use when called from the server (e.g. :data:`parser.R_POOL`),
+    see :class:`parser.pool.WorkerPool`. The trees are sent back from the workers as
+    :class:`parser.TreeArrays`, which are pickled without recursion for trees of any depth.
+"""
+
+import os
+import time
+
+from concurrent.futures import as_completed
+from dataclasses import dataclass, field
+from loguru import logger
+
+from .pool import WorkerPool
+from .tree import TreeArrays
+
+
+@dataclass
+class ParseResult:
+    """
+        Result of parsing one file of a batch.
+
+        Attributes
+        ----------
+        path: str
+            The path of the parsed file.
+        kwargs: dict
+            The arguments that were passed on to the parser.
+        tree: TreeArrays
+            The parsed tree or `None` when parsing failed.
+        error: str
+            The error message or `None` when parsing succeeded.
+        seconds: float
+            Time spent on parsing the file in seconds.
+    """
+    path: str
+    kwargs: dict = field(default_factory=dict)
+    tree: TreeArrays = field(default=None, repr=False)
+    error: str = field(default=None)
+    seconds: float = field(default=0.0)
+
+    @property
+    def ok(self):
+        return self.error is None
+
+
+def _spec(spec):
+    """ Converts a path, a ``(path, kwargs)`` tuple or a dict with a ``path`` into a path and kwargs. """
+    if isinstance(spec, (str, os.PathLike)):
+        return os.path.abspath(spec), {}
+    if isinstance(spec, dict):
+        kwargs = dict(spec)
+        return os.path.abspath(kwargs.pop('path')), kwargs
+    path, kwargs = spec
+    return os.path.abspath(path), dict(kwargs)
+
+
+def _parse_local(path, kwargs):
+    """ Parses a file within a worker, without dispatching it to another pool. """
+    from . import FORMATS, format_key, as_json
+
+    start = time.perf_counter()
+    tree = as_json(FORMATS[format_key(path, kwargs)].load()(path, **kwargs), shape="arrays")
+    return tree, time.perf_counter() - start
+
+
+class ParseBatch:
+    """
+        Batch of files that are parsed in parallel.
+
+        Parsing starts when the batch is iterated. Results are yielded in the order in
+        which they finish. Errors of single files are collected and do not stop the batch.
+
+        Attributes
+        ----------
+        results: list
+            All results that have finished so far.
+        elapsed: float
+            Wall time of the batch in seconds.
+    """
+
+    def __init__(self, specs, workers=None):
+        self.specs = [_spec(spec) for spec in specs]
+        self.workers = workers or os.cpu_count()
+        self.results = []
+        self.elapsed = 0.0
+
+    @property
+    def errors(self):
+        """ Error messages of all failed files by path. """
+        return {result.path: result.error for result in self.results if not result.ok}
+
+    @property
+    def throughput(self):
+        """ Number of parsed files per second. """
+        return len(self.results) / self.elapsed if self.elapsed > 0 else 0.0
+
+    def __iter__(self):
+        from . import FORMATS, check
+        from .errors import UnknownFormatException
+
+        start = time.perf_counter()
+
+        # check the formats before any work is done
+        jobs = []
+        for path, kwargs in self.specs:
+            if not os.path.isfile(path):
+                yield self._add(ParseResult(path, kwargs, error=f"No such file {path}"))
+                continue
+
+            try:
+                jobs.append((path, kwargs, check(path, kwargs)))
+            except UnknownFormatException as e:
+                yield self._add(ParseResult(path, kwargs, error=str(e)))
+
+        # only the modules of the formats in this batch are imported by the workers
+        modules = sorted({FORMATS[format].module for _, _, format in jobs})
+        pool = WorkerPool(size=min(self.workers, max(len(jobs), 1)), modules=modules)
+
+        try:
+            futures = {pool.submit(__name__, "_parse_local", path, kwargs): (path, kwargs)
+                       for path, kwargs, _ in jobs}
+
+            for future in as_completed(futures):
+                path, kwargs = futures[future]
+                try:
+                    tree, seconds = future.result()
+                    result = ParseResult(path, kwargs, tree=tree, seconds=seconds)
+                except Exception as e:
+                    result = ParseResult(path, kwargs, error=f"{type(e).__name__}: {e}")
+                yield self._add(result)
+        finally:
+            pool.shutdown()
+            self.elapsed = time.perf_counter() - start
+
+        logger.info(f"Parsed {len(self.results)} files ({len(self.errors)} failed) in {self.elapsed:.2f}s "
+                    f"with {pool.size} worker(s), {self.throughput:.2f} files/s")
+
+    def _add(self, result):
+        self.results.append(result)
+        if not result.ok:
+            logger.error(f"Unable to parse {result.path}: {result.error}")
+        return result
+
+
+def parse_many(paths_or_specs, workers=None):
+    """
+    Parses many files in parallel.
+
+    Parameters
+    ----------
+    paths_or_specs: iterable
+        Paths of the files or ``(path, kwargs)`` tuples or dictionaries with a ``path`` and
+        the arguments for :func:`parser.parse`.
+    workers: int
+        Number of worker processes (default number of CPUs).
+
+    Returns
+    -------
+    ParseBatch:
+        The batch, which yields a :class:`ParseResult` for each file as soon as it is parsed.
+
+    Examples
+    --------
+
+    .. code-block:: python
+
+        matlab = {"vendor": "Matlab", "origin": "fitctree"}
+        batch = parse_many([("iris.json", matlab), ("fanny.json", matlab)], workers=2)
+        for result in batch:
+            print(result.path, result.error)
+        print(f"{batch.throughput} files/s")
+    """
+    return ParseBatch(paths_or_specs, workers=workers)
@@ -0,0 +1,382 @@
+#  CC-0 2023.
+#  David Strahl, University of Potsdam
+#  Forester: Interactive human-in-the-loop web-based visualization of machine learning trees
+
+"""
+    Binary storage format for parsed trees.
+
+    A tree file starts with the magic bytes ``FORESTER``, the format version and the
+    length of a JSON header. The header holds the meta information of the tree, the
+    string tables of the features and classes and the position of every node array.
+    The node arrays follow the header, each aligned to 64 bytes and stored in little
+    endian byte order. The nodes are stored in pre-order, so that every subtree is a
+    contiguous range of nodes.
+
+    Files are opened with ``mmap``, the arrays of the returned tree are read-only views
+    on the file. Only the pages of the file that are accessed are read from disk.
+
+    Ensembles are stored in a single file, in which the node arrays of the trees
+    follow each other. The index of the trees and the shared tables of features and
+    classes are written behind the last tree, so that the trees can be written while
+    they are parsed.
+
+    The index of the training rows in each node (:class:`parser.membership.Membership`)
+    is stored in a file of its own, with the same layout as a tree file.
+"""
+
+import os
+import json
+import mmap
+import struct
+import dataclasses
+import numpy as np
+
+from .tree import TreeArrays
+from .membership import Membership
+from .errors import UnknownFormatException
+
+MAGIC = b"FORESTER"
+ENSEMBLE_MAGIC = b"FORESTS\x00"
+MEMBERSHIP_MAGIC = b"FORROWS\x00"
+VERSION = 1
+
+# alignment of the node arrays in bytes
+ALIGNMENT = 64
+
+# magic bytes, version and length of the header
+_PREFIX = struct.Struct("<8sII")
+
+# offset and length of the index of an ensemble file, at its end
+_TRAILER = struct.Struct("<QQ8s")
+
+# data types of the node arrays, the distribution keeps its integer or float type,
+# the values are only stored for regression trees and the pruning levels when known
+SECTIONS = {
+    'parent': '<i4',
+    'left': '<i4',
+    'right': '<i4',
+    'end': '<i4',
+    'feature': '<i4',
+    'operator': '<i1',
+    'threshold': '<f8',
+    'samples': '<i8',
+    'vote': '<i4',
+    'distribution': None,
+    'value': '<f8',
+    'prune': '<i4'
+}
+
+
+def _align(offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def _node_arrays(tree):
+    """ Converts the node arrays of a tree into their stored data types and computes their offsets. """
+    arrays = {}
+    for name, dtype in SECTIONS.items():
+        array = getattr(tree, name)
+        if array is None:
+            continue
+        if dtype is None:
+            dtype = '<f8' if np.issubdtype(array.dtype, np.floating) else '<i8'
+        arrays[name] = np.ascontiguousarray(array, dtype=dtype)
+
+    return (arrays, *_layout(arrays))
+
+
+def _layout(arrays):
+    """ Computes the offset of each array and the size of all arrays. """
+    # offsets are relative to the first aligned byte of the arrays
+    sections = {}
+    offset = 0
+    for name, array in arrays.items():
+        sections[name] = {'dtype': array.dtype.str, 'shape': list(array.shape), 'offset': offset}
+        offset = _align(offset + array.nbytes)
+
+    return sections, offset
+
+
+def _write_arrays(file, arrays, sections, start):
+    for name, array in arrays.items():
+        file.seek(start + sections[name]['offset'])
+        file.write(array.tobytes())
+
+
+def _read_arrays(buffer, sections, start):
+    arrays = {}
+    for name, section in sections.items():
+        shape = tuple(section['shape'])
+        arrays[name] = np.frombuffer(buffer, dtype=section['dtype'], count=int(np.prod(shape)),
+                                     offset=start + section['offset']).reshape(shape)
+    return arrays
+
+
+def _map(path):
+    with open(path, "rb") as file:
+        if os.fstat(file.fileno()).st_size == 0:
+            raise UnknownFormatException("File is empty")
+        return mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def write_tree(tree: TreeArrays, path):
+    """
+    Writes a tree in the binary format.
+
+    Parameters
+    ----------
+    tree: TreeArrays
+        The tree, it is brought into pre-order when it is not already.
+    path: str
+        The path of the file.
+    """
+    if tree.end is None:
+        tree = tree.preorder()
+
+    meta = dict(tree.meta)
+    features = meta.pop('features', [])
+    classes = meta.pop('classes', [])
+
+    arrays, sections, _ = _node_arrays(tree)
+
+    header = json.dumps({
+        'nodes': len(tree),
+        'meta': meta,
+        'features': features,
+        'classes': classes,
+        'extra': {str(i): extra for i, extra in tree.extra.items()},
+        'sections': sections
+    }).encode()
+
+    with open(path, "wb") as file:
+        file.write(_PREFIX.pack(MAGIC, VERSION, len(header)))
+        file.write(header)
+        _write_arrays(file, arrays, sections, _align(_PREFIX.size + len(header)))
+
+
+def read_header(buffer, magic=MAGIC, kind="tree"):
+    """ Reads the header of a tree file and returns it with the offset of the node arrays. """
+    if len(buffer) < _PREFIX.size:
+        raise UnknownFormatException(f"File is too short to be a Forester {kind} file")
+
+    found, version, length = _PREFIX.unpack_from(buffer)
+    if found != magic:
+        raise UnknownFormatException(f"File is not a Forester {kind} file")
+    if version != VERSION:
+        raise UnknownFormatException(f"Forester {kind} file version {version} is not supported")
+
+    header = json.loads(bytes(buffer[_PREFIX.size:_PREFIX.size + length]))
+    return header, _align(_PREFIX.size + length)
+
+
+def open_tree(path) -> TreeArrays:
+    """
+    Opens a tree file without reading the node arrays into memory.
+
+    Parameters
+    ----------
+    path: str
+        The path of the file.
+
+    Returns
+    -------
+    TreeArrays:
+        The tree in pre-order, its arrays are read-only views on the mapped file.
+    """
+    buffer = _map(path)
+    header, start = read_header(buffer)
+
+    meta = dict(header['meta'])
+    meta['features'] = header['features']
+    meta['classes'] = header['classes']
+
+    return TreeArrays(**_read_arrays(buffer, header['sections'], start), meta=meta,
+                      extra={int(i): extra for i, extra in header['extra'].items()})
+
+
+def write_membership(membership: Membership, path):
+    """
+    Writes the index of the training rows of a tree.
+
+    Parameters
+    ----------
+    membership: Membership
+        The index, see :meth:`Membership.from_tree`.
+    path: str
+        The path of the file.
+    """
+    arrays = {
+        'offsets': np.ascontiguousarray(membership.offsets, dtype='<i8'),
+        'rows': np.ascontiguousarray(membership.rows, dtype='<i8'),
+        'end': np.ascontiguousarray(membership.end, dtype='<i4')
+    }
+    sections, _ = _layout(arrays)
+
+    header = json.dumps({'nodes': len(membership), 'rows': len(membership.rows), 'sections': sections}).encode()
+
+    with open(path, "wb") as file:
+        file.write(_PREFIX.pack(MEMBERSHIP_MAGIC, VERSION, len(header)))
+        file.write(header)
+        _write_arrays(file, arrays, sections, _align(_PREFIX.size + len(header)))
+
+
+def open_membership(path) -> Membership:
+    """
+    Opens the index of the training rows of a tree, its arrays are read-only views on
+    the mapped file. Only the pages that hold the requested rows are read from disk.
+    """
+    buffer = _map(path)
+    header, start = read_header(buffer, MEMBERSHIP_MAGIC, "membership")
+    return Membership(**_read_arrays(buffer, header['sections'], start))
+
+
+class EnsembleWriter:
+    """
+        Writes the trees of an ensemble one after another into a single file.
+
+        The node arrays of each tree are written as soon as the tree is added, only a small
+        index is kept in memory. All trees share one table of features and classes, the
+        features of each tree are mapped onto the shared table. Regression trees keep their
+        own bins of the targets (see :mod:`parser.sketch`), their classes are stored with
+        the tree when they differ from the shared table. The index and the tables are
+        written at the end of the file, followed by their offset.
+
+        Examples
+        --------
+
+        .. code-block:: python
+
+            with EnsembleWriter("forest.bin") as writer:
+                for tree in parse_ensemble("forest.json", vendor="xgboost", origin="dump"):
+                    writer.add(tree)
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "wb")
+        self.file.write(_PREFIX.pack(ENSEMBLE_MAGIC, VERSION, 0))
+        self.offset = _align(_PREFIX.size)
+
+        self.meta = None
+        self.features = {}
+        self.classes = None
+        self.trees = []
+
+    def __len__(self):
+        return len(self.trees)
+
+    def add(self, tree: TreeArrays):
+        """ Writes a tree of the ensemble. """
+        if tree.end is None:
+            tree = tree.preorder()
+
+        meta = dict(tree.meta)
+        features = meta.pop('features', [])
+        classes = meta.pop('classes', [])
+
+        if self.classes is None:
+            self.meta, self.classes = dict(meta), list(classes)
+        elif list(classes) != self.classes:
+            if meta.get('type') != 'regression':
+                raise ValueError(f"Tree {len(self.trees)} has other classes than the ensemble")
+            meta['classes'] = list(classes)
+
+        # map the features of the tree onto the shared table
+        mapping = np.asarray([self.features.setdefault(name, len(self.features)) for name in features] or [0],
+                             dtype=np.int32)
+        tree = dataclasses.replace(tree, feature=np.where(tree.feature >= 0, mapping[tree.feature.clip(0)], -1))
+
+        arrays, sections, size = _node_arrays(tree)
+        _write_arrays(self.file, arrays, sections, self.offset)
+
+        self.trees.append({
+            'nodes': len(tree),
+            'start': self.offset,
+            'meta': {key: value for key, value in meta.items() if self.meta.get(key) != value},
+            'extra': {str(i): extra for i, extra in tree.extra.items()},
+            'sections': sections
+        })
+        self.offset = _align(self.offset + size)
+
+    def close(self):
+        """ Writes the index and the shared tables and closes the file. """
+        if self.file.closed:
+            return
+
+        footer = json.dumps({
+            'trees': len(self.trees),
+            'meta': self.meta or {},
+            'features': list(self.features),
+            'classes': self.classes or [],
+            'index': self.trees
+        }).encode()
+
+        self.file.seek(self.offset)
+        self.file.write(footer)
+        self.file.write(_TRAILER.pack(self.offset, len(footer), ENSEMBLE_MAGIC))
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class Ensemble:
+    """
+        The trees of an ensemble file, opened with ``mmap``.
+
+        Only the index of the trees is decoded when the file is opened. The node arrays of
+        a tree are views on the mapped file, which are created when the tree is accessed.
+
+        Attributes
+        ----------
+        meta: dict
+            The meta information shared by all trees, including the tables of features and classes.
+    """
+
+    def __init__(self, path):
+        self.buffer = _map(path)
+
+        magic, version, _ = _PREFIX.unpack_from(self.buffer)
+        if magic != ENSEMBLE_MAGIC or len(self.buffer) < _PREFIX.size + _TRAILER.size:
+            raise UnknownFormatException("File is not a Forester ensemble file")
+        if version != VERSION:
+            raise UnknownFormatException(f"Forester ensemble file version {version} is not supported")
+
+        offset, length, _ = _TRAILER.unpack_from(self.buffer, len(self.buffer) - _TRAILER.size)
+        footer = json.loads(bytes(self.buffer[offset:offset + length]))
+
+        self.index = footer['index']
+        self.meta = dict(footer['meta'])
+        self.meta['features'] = footer['features']
+        self.meta['classes'] = footer['classes']
+
+    def __len__(self):
+        return len(self.index)
+
+    def __getitem__(self, i) -> TreeArrays:
+        entry = self.index[i]
+        return TreeArrays(**_read_arrays(self.buffer, entry['sections'], entry['start']),
+                          meta={**self.meta, **entry['meta']},
+                          extra={int(node): extra for node, extra in entry['extra'].items()})
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+    def stats(self):
+        """ Returns the number of trees and the size of each tree, computed from the index only. """
+        nodes = [entry['nodes'] for entry in self.index]
+        return {
+            'trees': len(self),
+            'nodes': int(sum(nodes)),
+            'sizes': nodes,
+            'features': len(self.meta['features']),
+            'classes': self.meta['classes']
+        }
+
+
+def open_ensemble(path) -> Ensemble:
+    """ Opens an ensemble file written by :class:`EnsembleWriter`. """
+    return Ensemble(path)
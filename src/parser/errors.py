@@ -6,4 +6,16 @@ class UnknownFormatException(Exception):
 	pass
 
 class RNotFoundException(Exception):
-	pass
\ No newline at end of file
+	pass
+
+class WorkerCrashedException(Exception):
+	pass
+
+class RDataException(Exception):
+	pass
+
+class MatFileException(Exception):
+	pass
+
+class InvalidExportException(UnknownFormatException):
+	pass
@@ -0,0 +1,278 @@
+#  CC-0 2023.
+#  David Strahl, University of Potsdam
+#  Forester: Interactive human-in-the-loop web-based visualization of machine learning trees
+
+"""
+    Reader for Matlab's ``.mat`` files of version 5 (``-v6`` and the default ``-v7``).
+
+    A file is a 128 byte header followed by one data element per variable. Each element
+    starts with its type and length, so that variables which are not needed are skipped
+    without reading them. Variables that were saved with compression (the default of
+    ``-v7``) are only decompressed as far as needed to read their name.
+
+    Uncompressed files are opened with ``mmap``, numeric arrays that are stored in their
+    own data type are returned as read-only views on the file, so that large arrays (e.g.
+    the training data ``X``) are only read from disk when they are accessed.
+
+    Values are converted as by Matlab's ``jsonencode``: numeric and logical arrays become
+    NumPy arrays (scalars for ``1x1`` arrays), character arrays become strings, cell arrays
+    become lists and structs become dictionaries. Objects of ``classdef`` classes (e.g. a
+    ``ClassificationTree``) are stored in an undocumented format and can not be read.
+    MAT-files of version 7.3 are HDF5 files and are not supported either.
+
+    See https://www.mathworks.com/help/pdf_doc/matlab/matfile_format.pdf for the format.
+"""
+
+import os
+import mmap
+import zlib
+import struct
+import numpy as np
+
+from .errors import MatFileException
+
+# size of the header at the start of a file
+HEADER_SIZE = 128
+
+# text at the start of files of version 5 (and 7, which uses the same container)
+MAT_MAGIC = b"MATLAB 5.0 MAT-file"
+
+# data types of the data elements
+miINT8 = 1
+miUINT8 = 2
+miINT16 = 3
+miUINT16 = 4
+miINT32 = 5
+miUINT32 = 6
+miSINGLE = 7
+miDOUBLE = 9
+miINT64 = 12
+miUINT64 = 13
+miMATRIX = 14
+miCOMPRESSED = 15
+miUTF8 = 16
+miUTF16 = 17
+miUTF32 = 18
+
+# array classes of a matrix element
+mxCELL_CLASS = 1
+mxSTRUCT_CLASS = 2
+mxOBJECT_CLASS = 3
+mxCHAR_CLASS = 4
+mxSPARSE_CLASS = 5
+mxOPAQUE_CLASS = 17
+
+# flags of a matrix element
+_LOGICAL = 0x0200
+
+# NumPy data types of the data elements
+DATA_TYPES = {
+    miINT8: 'i1', miUINT8: 'u1', miINT16: 'i2', miUINT16: 'u2', miINT32: 'i4', miUINT32: 'u4',
+    miSINGLE: 'f4', miDOUBLE: 'f8', miINT64: 'i8', miUINT64: 'u8', miUTF8: 'u1', miUTF16: 'u2', miUTF32: 'u4'
+}
+
+# NumPy data types of the numeric array classes
+CLASS_TYPES = {
+    6: 'f8', 7: 'f4', 8: 'i1', 9: 'u1', 10: 'i2', 11: 'u2', 12: 'i4', 13: 'u4', 14: 'i8', 15: 'u8'
+}
+
+# number of decompressed bytes that are read to find the name of a compressed variable
+_PEEK_SIZE = 1024
+
+
+def _pad(n):
+    return (n + 7) // 8 * 8
+
+
+class _MatReader:
+    """ Reads the data elements of a matrix from a buffer, which is the mapped file or a decompressed variable. """
+
+    def __init__(self, buffer, order, pos=0):
+        self.buffer = buffer
+        self.order = order
+        self.pos = pos
+
+    def tag(self):
+        """ Reads the tag of a data element and returns its type, the start and the length of its data. """
+        first, second = struct.unpack_from(self.order + "II", self.buffer, self.pos)
+
+        # small data elements hold up to four bytes within the tag
+        if first >> 16:
+            self.pos += 8
+            return first & 0xffff, self.pos - 4, first >> 16
+
+        start = self.pos + 8
+        self.pos = start + _pad(second)
+        return first, start, second
+
+    def data(self):
+        """ Reads a data element of a numeric type as a view on the buffer. """
+        type, start, length = self.tag()
+        if type not in DATA_TYPES:
+            raise MatFileException(f"Unexpected data type {type} within a matrix")
+        dtype = np.dtype(DATA_TYPES[type]).newbyteorder(self.order)
+        return np.frombuffer(self.buffer, dtype=dtype, count=length // dtype.itemsize, offset=start)
+
+    def _encoding(self, type):
+        """ The encoding of the characters of a char array stored with the given data type. """
+        suffix = "-le" if self.order == "<" else "-be"
+        if type in (miUTF16, miUINT16):
+            return "utf-16" + suffix
+        if type in (miUTF32, miUINT32):
+            return "utf-32" + suffix
+        return "utf-8" if type == miUTF8 else "latin-1"
+
+    def header(self):
+        """ Reads the class, the dimensions and the name of a matrix. """
+        flags = self.data()
+        dims = tuple(int(d) for d in self.data())
+        name = self.data().tobytes().decode("ascii")
+        return int(flags[0]), dims, name
+
+    def element(self):
+        """ Reads a matrix element, see :meth:`matrix`. """
+        type, start, length = self.tag()
+        if type != miMATRIX:
+            raise MatFileException(f"Expected a matrix, found data type {type}")
+        end, self.pos = self.pos, start
+        try:
+            return self.matrix(length)[1]
+        finally:
+            self.pos = end
+
+    def matrix(self, length, fields=None):
+        """
+            Reads the matrix that starts at the current position and returns its name and
+            value. Of structs, only the `fields` are read when they are given.
+        """
+        # empty cells are stored as matrices without any data
+        if length == 0:
+            return "", np.empty((0, 0))
+
+        flags, dims, name = self.header()
+        cls = flags & 0xff
+        size = int(np.prod(dims))
+
+        if cls in CLASS_TYPES:
+            values = self.data().astype(bool if flags & _LOGICAL else CLASS_TYPES[cls], copy=False)
+            values = values.reshape(dims, order="F")
+            return name, values.item() if size == 1 else values
+
+        if cls == mxCHAR_CLASS:
+            type, start, length = self.tag()
+            text = bytes(self.buffer[start:start + length]).decode(self._encoding(type))
+
+            # the characters of a char matrix are stored column by column
+            rows = [text[i::dims[0]] for i in range(dims[0])] if size else [""]
+            return name, rows[0] if len(rows) == 1 else rows
+
+        if cls == mxCELL_CLASS:
+            return name, [self.element() for _ in range(size)]
+
+        if cls in (mxSTRUCT_CLASS, mxOBJECT_CLASS):
+            if cls == mxOBJECT_CLASS:
+                self.data()
+
+            # the field names are padded to the same length
+            width = int(self.data()[0])
+            names = self.data().tobytes()
+            names = [names[i:i + width].split(b"\0", 1)[0].decode("ascii") for i in range(0, len(names), width)]
+
+            elements = []
+            for _ in range(size):
+                element = {}
+                for field in names:
+                    if fields is None or field in fields:
+                        element[field] = self.element()
+                    else:
+                        self.tag()
+                elements.append(element)
+            return name, elements[0] if size == 1 else elements
+
+        raise MatFileException(f"Variable {name or '(unnamed)'} of array class {cls} is not supported, "
+                               f"only numeric, logical, char, cell and struct arrays can be read")
+
+
+def _map(path):
+    with open(path, "rb") as file:
+        if os.fstat(file.fileno()).st_size < HEADER_SIZE:
+            raise MatFileException("File is too short to be a MAT-file")
+        return mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def read_mat(path, names=None) -> dict:
+    """
+    Reads the variables of a ``.mat`` file.
+
+    Parameters
+    ----------
+    path: str
+        The path to the file, as written by Matlab's ``save``.
+    names: iterable
+        When given, only variables with these names are read. Structs are always read, but
+        only their fields with these names, so that the fields of a saved struct can be
+        selected in the same way. All other variables are skipped.
+
+    Returns
+    -------
+    dict:
+        The read variables by name, in the order in which they were saved.
+
+    Raises
+    ------
+    MatFileException
+        When the file is not a MAT-file of version 5 or a variable can not be read.
+    """
+    buffer = _map(path)
+
+    if not buffer[:len(MAT_MAGIC)] == MAT_MAGIC:
+        if buffer[:10] == b"MATLAB 7.3":
+            raise MatFileException("MAT-files of version 7.3 are not supported, save the file with -v7")
+        raise MatFileException("File is not a MAT-file of version 5")
+
+    # the endian indicator 'MI' is written as a 16 bit integer
+    order = {b"IM": "<", b"MI": ">"}.get(bytes(buffer[126:128]))
+    if order is None:
+        raise MatFileException("MAT-file has an invalid endian indicator")
+
+    names = None if names is None else set(names)
+    variables = {}
+
+    pos = HEADER_SIZE
+    try:
+        while pos + 8 <= len(buffer):
+            type, length = struct.unpack_from(order + "II", buffer, pos)
+            start, pos = pos + 8, pos + 8 + length
+
+            if type == miCOMPRESSED:
+                # the header of the variable is at the start of the compressed data
+                head = zlib.decompressobj().decompress(buffer[start:min(start + length, start + _PEEK_SIZE)], _PEEK_SIZE)
+                try:
+                    flags, _, name = _MatReader(head, order, 8).header()
+                except struct.error:
+                    flags, name = mxSTRUCT_CLASS, None
+                if not _selected(names, flags, name):
+                    continue
+                reader = _MatReader(zlib.decompress(buffer[start:pos]), order)
+                type, start, length = reader.tag()
+                reader.pos = start
+            elif type == miMATRIX:
+                reader = _MatReader(buffer, order, start)
+                flags, _, name = reader.header()
+                if not _selected(names, flags, name):
+                    continue
+                reader.pos = start
+            else:
+                continue
+
+            name, value = reader.matrix(length, fields=names)
+            variables[name] = value
+    except (struct.error, ValueError, zlib.error) as e:
+        raise MatFileException(f"Unable to read MAT-file: {e}") from e
+
+    return variables
+
+
+def _selected(names, flags, name):
+    """ Whether a variable is read, structs are always read as their fields may be selected. """
+    return names is None or name in names or flags & 0xff in (mxSTRUCT_CLASS, mxOBJECT_CLASS)
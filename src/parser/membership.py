@@ -0,0 +1,90 @@
+#  CC-0 2023.
+#  David Strahl, University of Potsdam
+#  Forester: Interactive human-in-the-loop web-based visualization of machine learning trees
+
+"""
+    Index of the training rows in each node of a tree.
+
+    The parsers record in which node each training row ended up (:attr:`TreeArrays.rows`),
+    e.g. from the ``where`` element of an rpart object. The index stores the ids of the
+    rows sorted by their node in pre-order, together with the offset of the rows of each
+    node (compressed sparse rows):
+
+    .. code-block:: python
+
+        rows[offsets[i]:offsets[i + 1]]     # rows that ended up in node i
+        rows[offsets[i]:offsets[end[i]]]    # rows in the subtree of node i
+
+    As every subtree is a contiguous range of nodes in pre-order, the rows of any node
+    are a contiguous range of the index, which is found without searching.
+"""
+
+import numpy as np
+
+from dataclasses import dataclass
+
+from .tree import TreeArrays
+
+
+@dataclass
+class Membership:
+    """
+        The training rows of each node of a tree in pre-order.
+
+        Attributes
+        ----------
+        offsets: np.ndarray
+            Start of the rows of each node in `rows`, with ``n_nodes + 1`` entries.
+        rows: np.ndarray
+            Ids of the training rows, sorted by their node.
+        end: np.ndarray
+            The end (exclusive) of the subtree of each node, as in :class:`TreeArrays`.
+    """
+    offsets: np.ndarray
+    rows: np.ndarray
+    end: np.ndarray
+
+    def __len__(self):
+        return len(self.end)
+
+    @classmethod
+    def from_tree(cls, tree: TreeArrays):
+        """
+        Creates the index from the rows of a tree.
+
+        Returns
+        -------
+        Membership:
+            The index of the tree in pre-order or `None` when the rows of the tree are not known.
+        """
+        if tree.rows is None:
+            return None
+        if tree.end is None:
+            tree = tree.preorder()
+
+        used = tree.rows >= 0
+        nodes = tree.rows[used]
+        ids = np.flatnonzero(used) if tree.row_ids is None else np.asarray(tree.row_ids)[used]
+
+        offsets = np.zeros(len(tree) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(nodes, minlength=len(tree)), out=offsets[1:])
+
+        return cls(
+            offsets=offsets,
+            rows=ids[np.argsort(nodes, kind="stable")].astype(np.int64),
+            end=np.asarray(tree.end, dtype=np.int32)
+        )
+
+    def node_rows(self, node):
+        """ Returns the ids of the rows that ended up in the node itself (e.g. a leaf). """
+        return self.rows[self.offsets[node]:self.offsets[node + 1]]
+
+    def __getitem__(self, node):
+        """ Returns the ids of the rows in the subtree of a node, as a view on the index. """
+        if not 0 <= node < len(self):
+            raise IndexError(f"Node {node} is not in the tree")
+        return self.rows[self.offsets[node]:self.offsets[self.end[node]]]
+
+    def counts(self):
+        """ Returns the number of rows in the subtree of each node. """
+        return self.offsets[self.end] - self.offsets[:-1]
@@ -0,0 +1,137 @@
+#  CC-0 2023.
+#  David Strahl, University of Potsdam
+#  Forester: Interactive human-in-the-loop web-based visualization of machine learning trees
+
+"""
+    Pool of long-lived worker processes for parsing.
+
+    Parsers that embed another runtime (e.g. R through rpy2) are run outside of the
+    server process. Each worker imports the parsing modules once when it is started
+    and then handles parse jobs from the pool's queue. When a worker crashes, only the
+    job that it was working on fails and the pool is restarted.
+"""
+
+import os
+import atexit
+import importlib
+import threading
+import multiprocessing
+
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from loguru import logger
+
+from .errors import WorkerCrashedException
+
+# whether this process is a worker of a pool
+_WORKER = False
+
+
+def _initialize(modules):
+    """ Warms up a worker by importing the parsing modules. """
+    global _WORKER
+    _WORKER = True
+    for module in modules:
+        importlib.import_module(module)
+
+
+def _call(module, function, args, kwargs):
+    """ Runs one job within a worker. """
+    return getattr(importlib.import_module(module), function)(*args, **kwargs)
+
+
+class WorkerPool:
+    """
+        Pool of worker processes that are started on first use.
+
+        Within a worker of a pool, jobs are run directly in the worker, so that
+        workers never start pools of their own.
+
+        Attributes
+        ----------
+        size: int
+            Number of worker processes.
+        modules: tuple
+            Modules that are imported once in each worker when it is started.
+    """
+
+    def __init__(self, size=1, modules=()):
+        self.size = max(1, int(size))
+        self.modules = tuple(modules)
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                logger.info(f"Starting {self.size} parsing worker(s) for {', '.join(self.modules)}")
+                self._executor = ProcessPoolExecutor(max_workers=self.size,
+                                                     mp_context=multiprocessing.get_context("spawn"),
+                                                     initializer=_initialize,
+                                                     initargs=(self.modules,))
+                # the workers are stopped when the program exits, only while they run
+                atexit.register(self.shutdown)
+            return self._executor
+
+    def _restart(self, executor):
+        with self._lock:
+            # another job may already have restarted the pool
+            if self._executor is executor:
+                executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+                atexit.unregister(self.shutdown)
+
+    def submit(self, module, function, *args, **kwargs):
+        """
+        Queues a job for the workers.
+
+        Parameters
+        ----------
+        module: str
+            Absolute name of the module that holds the function.
+        function: str
+            Name of the function that is called with ``args`` and ``kwargs``.
+
+        Returns
+        -------
+        concurrent.futures.Future:
+            The future holding the result of the job.
+        """
+        return self._get_executor().submit(_call, module, function, args, kwargs)
+
+    def run(self, module, function, *args, **kwargs):
+        """
+        Runs a job in one of the workers and waits for its result.
+
+        Exceptions raised by the job are passed on. When the worker crashes,
+        a :class:`WorkerCrashedException` is raised and the pool is restarted.
+        """
+        if _WORKER:
+            return _call(module, function, args, kwargs)
+
+        executor = self._get_executor()
+        try:
+            return executor.submit(_call, module, function, args, kwargs).result()
+        except BrokenProcessPool as e:
+            self._restart(executor)
+            raise WorkerCrashedException(f"Parsing worker crashed while running {module}.{function}") from e
+
+    def resize(self, size):
+        """ Changes the number of workers, running workers are stopped after their jobs. """
+        size = max(1, int(size))
+        if size != self.size:
+            self.shutdown(wait=False)
+            self.size = size
+
+    def shutdown(self, wait=True):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=wait)
+                self._executor = None
+                atexit.unregister(self.shutdown)
+
+
+# pool that runs the R parsing module, the number of
+# workers can be set with the environment variable
+R_POOL = WorkerPool(size=os.environ.get("FORESTER_R_WORKERS", 1),
+                    modules=(f"{__package__}.R",))
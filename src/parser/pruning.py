@@ -0,0 +1,136 @@
+#  CC-0 2023.
+#  David Strahl, University of Potsdam
+#  Forester: Interactive human-in-the-loop web-based visualization of machine learning trees
+
+"""
+    Pruning of trees along the pruning sequence of cost-complexity pruning.
+
+    Matlab (``PruneList`` and ``PruneAlpha``) and rpart (the ``complexity`` of each node and
+    the ``cptable``) store the sequence of subtrees that pruning with a growing complexity
+    parameter yields. The sequence is stored with the tree as the level at which each node
+    becomes a leaf (:attr:`TreeArrays.prune`, ``0`` for leaves) and the value of the complexity
+    parameter of each level, ascending from the full tree:
+
+    .. code-block:: python
+
+        tree.prune[i]                       # node i becomes a leaf at this level and above
+        tree.meta['pruning']['values'][k]   # complexity parameter of level k
+
+    The levels are stored such that no node becomes a leaf after its parent, so a node is
+    part of the tree pruned to level ``k`` exactly when ``prune[parent] > k``. Pruning is a
+    mask over the node arrays, no node is visited on its own.
+"""
+
+import numpy as np
+
+from .tree import TreeArrays
+
+
+def add_pruning(tree: TreeArrays, prune, parameter, values):
+    """
+    Stores the pruning sequence of a tree.
+
+    Parameters
+    ----------
+    tree: TreeArrays
+        The tree.
+    prune: array_like
+        The level at which each node becomes a leaf.
+    parameter: str
+        The name of the complexity parameter (``alpha`` for Matlab, ``cp`` for rpart).
+    values: array_like
+        The ascending value of the complexity parameter of each level.
+    """
+    prune = np.where(tree.is_leaf, 0, np.asarray(prune, dtype=np.int32).reshape(len(tree)))
+
+    # a node becomes a leaf at the latest together with its parent
+    is_branch = ~tree.is_leaf
+    for level in tree.levels():
+        branch = level[is_branch[level]]
+        for children in (tree.left[branch], tree.right[branch]):
+            prune[children] = np.minimum(prune[children], prune[branch])
+
+    tree.prune = prune.astype(np.int32)
+    tree.meta = dict(tree.meta, pruning={'parameter': parameter, 'values': np.asarray(values, dtype=float).tolist()})
+    return tree
+
+
+def pruning_level(tree: TreeArrays, value) -> int:
+    """ Returns the level of the largest subtree whose complexity parameter is not above `value`. """
+    values = tree.meta['pruning']['values']
+    return int(np.clip(np.searchsorted(values, value, side='right') - 1, 0, len(values) - 1))
+
+
+def pruning_sequence(tree: TreeArrays) -> dict:
+    """
+    Returns the complexity parameter and the number of nodes of each level of pruning.
+
+    Returns
+    -------
+    dict:
+        The name of the ``parameter``, its ``values`` and the number of ``nodes`` of each level.
+    """
+    values = tree.meta['pruning']['values']
+
+    # the nodes below the root are removed at the level of their parent
+    removed = np.bincount(tree.prune[tree.parent[tree.parent >= 0]], minlength=len(values))
+    nodes = len(tree) - np.cumsum(removed)[:len(values)]
+
+    return {'parameter': tree.meta['pruning']['parameter'], 'values': values, 'nodes': nodes.tolist()}
+
+
+def prune(tree: TreeArrays, level) -> TreeArrays:
+    """
+    Returns the tree pruned to a level of its pruning sequence.
+
+    The nodes of the pruned tree keep their order, the nodes that become leaves lose their
+    split. The training rows of removed nodes are moved to the leaf they were pruned into.
+
+    Parameters
+    ----------
+    tree: TreeArrays
+        The tree with its pruning sequence, see :func:`add_pruning`.
+    level: int
+        The level of pruning, ``0`` is the full tree.
+
+    Raises
+    ------
+    ValueError
+        When the tree has no pruning sequence.
+    """
+    if tree.prune is None:
+        raise ValueError("The tree has no pruning sequence")
+    if tree.end is None:
+        tree = tree.preorder()
+
+    keep = (tree.parent < 0) | (tree.prune[tree.parent.clip(0)] > level)
+    leaf = (tree.prune <= level)[keep]
+
+    # the index of the last kept node at or before each node, which for removed nodes
+    # in pre-order is the node they were pruned into
+    kept = np.concatenate([[0], np.cumsum(keep)])
+    index = kept[1:] - 1
+
+    def relink(links, cut=None):
+        links = links[keep]
+        valid = links >= 0 if cut is None else (links >= 0) & ~cut
+        return np.where(valid, index[links.clip(0)], -1).astype(np.int32)
+
+    return TreeArrays(
+        parent=relink(tree.parent),
+        left=relink(tree.left, leaf),
+        right=relink(tree.right, leaf),
+        feature=np.where(leaf, -1, tree.feature[keep]).astype(np.int32),
+        operator=np.where(leaf, -1, tree.operator[keep]).astype(np.int8),
+        threshold=np.where(leaf, np.nan, tree.threshold[keep]),
+        samples=tree.samples[keep],
+        vote=tree.vote[keep],
+        distribution=tree.distribution[keep],
+        meta=tree.meta,
+        extra={int(index[i]): extra for i, extra in tree.extra.items() if keep[i]},
+        end=kept[tree.end[keep]].astype(np.int32),
+        rows=None if tree.rows is None else np.where(tree.rows >= 0, index[tree.rows.clip(0)], -1),
+        row_ids=tree.row_ids,
+        value=None if tree.value is None else tree.value[keep],
+        prune=np.where(leaf, 0, tree.prune[keep]).astype(np.int32)
+    )
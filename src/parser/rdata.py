@@ -0,0 +1,483 @@
+#  CC-0 2023.
+#  David Strahl, University of Potsdam
+#  Forester: Interactive human-in-the-loop web-based visualization of machine learning trees
+
+"""
+    Reader for ``.RData`` files that does not need an R runtime.
+
+    The reader implements R's serialization format (versions 2 and 3) in the XDR
+    encoding, which is what R's ``save`` writes by default. Files can be compressed
+    with gzip, bzip2 or xz. Vectors are returned as NumPy views on the decompressed
+    bytes, so that large numeric vectors are not copied. Language objects, closures,
+    byte code and environments are read, but only kept as far as they are needed to
+    continue reading.
+
+    See ``src/main/serialize.c`` in the R sources for the reference implementation.
+"""
+
+import bz2
+import gzip
+import lzma
+import struct
+import numpy as np
+
+from .errors import RDataException
+
+# R's object types
+NILSXP = 0
+SYMSXP = 1
+LISTSXP = 2
+CLOSXP = 3
+ENVSXP = 4
+PROMSXP = 5
+LANGSXP = 6
+SPECIALSXP = 7
+BUILTINSXP = 8
+CHARSXP = 9
+LGLSXP = 10
+INTSXP = 13
+REALSXP = 14
+CPLXSXP = 15
+STRSXP = 16
+DOTSXP = 17
+VECSXP = 19
+EXPRSXP = 20
+BCODESXP = 21
+EXTPTRSXP = 22
+WEAKREFSXP = 23
+RAWSXP = 24
+S4SXP = 25
+
+# pseudo types that are only used in the serialization
+REFSXP = 255
+NILVALUE_SXP = 254
+GLOBALENV_SXP = 253
+UNBOUNDVALUE_SXP = 252
+MISSINGARG_SXP = 251
+BASENAMESPACE_SXP = 250
+NAMESPACESXP = 249
+PACKAGESXP = 248
+PERSISTSXP = 247
+CLASSREFSXP = 246
+GENERICREFSXP = 245
+BCREPDEF = 244
+BCREPREF = 243
+EMPTYENV_SXP = 242
+BASEENV_SXP = 241
+ATTRLANGSXP = 240
+ATTRLISTSXP = 239
+ALTREP_SXP = 238
+
+# flags of the CHARSXP encoding
+_LATIN1 = 1 << 2
+_UTF8 = 1 << 3
+_ASCII = 1 << 6
+
+# integer value of R's NA_integer_ and NA (logical)
+NA_INTEGER = -2 ** 31
+
+# pseudo types that stand for a fixed object
+_SINGLETONS = {
+    NILVALUE_SXP: None,
+    GLOBALENV_SXP: 'R_GlobalEnv',
+    UNBOUNDVALUE_SXP: 'R_UnboundValue',
+    MISSINGARG_SXP: 'R_MissingArg',
+    BASENAMESPACE_SXP: 'R_BaseNamespace',
+    EMPTYENV_SXP: 'R_EmptyEnv',
+    BASEENV_SXP: 'R_BaseEnv'
+}
+
+_INT = struct.Struct(">i")
+
+
+class RSymbol(str):
+    """ Name of an R symbol. """
+    pass
+
+
+class RObject:
+    """
+        An object read from an R serialization.
+
+        Attributes
+        ----------
+        type: int
+            The R type of the object (e.g. ``INTSXP``).
+        value:
+            NumPy array for atomic vectors, list of str for character vectors and
+            list of objects for generic vectors and pairlists.
+        attributes: dict
+            The attributes of the object by name.
+        tags: list
+            For pairlists, the tag of each element.
+    """
+    __slots__ = ('type', 'value', 'attributes', 'tags')
+
+    def __init__(self, type, value=None, attributes=None, tags=None):
+        self.type = type
+        self.value = value
+        self.attributes = attributes if attributes is not None else {}
+        self.tags = tags
+
+    def __repr__(self):
+        return f"RObject(type={self.type}, class={self.classes}, length={len(self)})"
+
+    def __len__(self):
+        return len(self.value) if self.value is not None else 0
+
+    def attr(self, name, default=None):
+        return self.attributes.get(name, default)
+
+    @property
+    def names(self):
+        """ The names of the elements, for pairlists these are the tags. """
+        if self.tags is not None:
+            return [str(tag) if tag is not None else "" for tag in self.tags]
+        names = self.attr('names')
+        return list(names.value) if names is not None else None
+
+    @property
+    def classes(self):
+        classes = self.attr('class')
+        return list(classes.value) if classes is not None else []
+
+    def __getitem__(self, name):
+        """ Returns the element with the given name of a list. """
+        names = self.names or []
+        if name not in names:
+            raise KeyError(name)
+        return self.value[names.index(name)]
+
+    def __contains__(self, name):
+        return name in (self.names or [])
+
+    def as_strings(self):
+        """ Values of a character vector or labels of a factor. """
+        if 'factor' in self.classes:
+            levels = np.asarray(self.attr('levels').value, dtype=object)
+            codes = np.asarray(self.value, dtype=int)
+            return np.where(codes == NA_INTEGER, None, levels[np.maximum(codes, 1) - 1]).tolist()
+        return list(self.value)
+
+    def as_array(self):
+        """ Values of an atomic vector, matrices are reshaped according to their ``dim`` attribute. """
+        array = np.asarray(self.value)
+        if array.dtype.byteorder == '>':
+            array = array.astype(array.dtype.newbyteorder('='))
+        if (dim := self.attr('dim')) is not None:
+            array = array.reshape(tuple(int(d) for d in dim.value), order='F')
+        return array
+
+
+class _Unserializer:
+    """
+        Reads the objects of an R serialization in XDR format.
+    """
+
+    def __init__(self, data, pos=0):
+        self.data = data
+        self.pos = pos
+        self.references = []
+        self.encoding = "utf-8"
+
+    def integer(self):
+        value = _INT.unpack_from(self.data, self.pos)[0]
+        self.pos += 4
+        return value
+
+    def length(self):
+        length = self.integer()
+        if length == -1:
+            upper, lower = self.integer(), self.integer()
+            length = (upper << 32) + lower
+        elif length < -1:
+            raise RDataException("Negative vector length in serialization")
+        return length
+
+    def bytes(self, n):
+        value = self.data[self.pos:self.pos + n]
+        self.pos += n
+        return value
+
+    def array(self, dtype, n):
+        value = np.frombuffer(self.data, dtype=dtype, count=n, offset=self.pos)
+        self.pos += value.nbytes
+        return value
+
+    def header(self):
+        """ Reads the header of the serialization. """
+        if self.bytes(2) != b"X\n":
+            raise RDataException("Only the XDR serialization format is supported")
+
+        version = self.integer()
+        self.integer()  # version of R that wrote the file
+        self.integer()  # minimal version of R that can read the file
+
+        if version == 3:
+            self.encoding = self.bytes(self.integer()).decode("ascii")
+        elif version != 2:
+            raise RDataException(f"Serialization version {version} is not supported")
+
+    def string_vector(self):
+        """ Reads the names of a package or namespace. """
+        if self.integer() != 0:
+            raise RDataException("Names in persistent string vectors are not supported")
+        return [self.item() for _ in range(self.integer())]
+
+    def attributes(self, flags):
+        """ Reads the attributes pairlist and converts it to a dictionary. """
+        if not flags & (1 << 9):
+            return {}
+        attributes = self.item()
+        return dict(zip(attributes.names, attributes.value)) if isinstance(attributes, RObject) else {}
+
+    def charsxp(self, flags):
+        length = self.integer()
+        if length == -1:
+            return None
+
+        value = self.bytes(length)
+        levels = flags >> 12
+        if levels & _UTF8:
+            return value.decode("utf-8", errors="replace")
+        if levels & _LATIN1:
+            return value.decode("latin-1")
+        if levels & _ASCII:
+            return value.decode("ascii", errors="replace")
+        try:
+            return value.decode(self.encoding, errors="replace")
+        except LookupError:
+            return value.decode("utf-8", errors="replace")
+
+    def pairlist(self, flags):
+        """
+            Reads a pairlist. The cells of the list are read in a loop instead of
+            recursively, so that long lists do not exceed the recursion limit.
+        """
+        head = RObject(flags & 0xFF, [], tags=[])
+        first = True
+
+        while True:
+            attributes = self.attributes(flags)
+            if first:
+                head.attributes = attributes
+                first = False
+
+            head.tags.append(self.item() if flags & (1 << 10) else None)
+            head.value.append(self.item())
+
+            flags = self.integer()
+            if flags & 0xFF == NILVALUE_SXP:
+                return head
+            if flags & 0xFF not in (LISTSXP, DOTSXP):
+                # improper list, the tail is kept as the last element
+                head.tags.append(None)
+                head.value.append(self.item(flags))
+                return head
+
+    def altrep(self):
+        """ Expands the compact ALTREP representations. """
+        info = self.item()
+        state = self.item()
+        attributes = self.item()
+
+        name = str(info.value[0]) if isinstance(info, RObject) else ""
+
+        if name in ("compact_intseq", "compact_realseq"):
+            n, start, step = state.as_array().tolist()
+            value = start + step * np.arange(int(n))
+            kind = INTSXP if name == "compact_intseq" else REALSXP
+            value = value.astype(np.int32 if kind == INTSXP else np.float64)
+        elif name.startswith("wrap_") or name == "deferred_string":
+            wrapped = state.value[0]
+            kind, value = wrapped.type, wrapped.value
+            if name == "deferred_string":
+                kind = STRSXP
+                value = [None if v == NA_INTEGER or v != v else f"{v:.15g}" for v in wrapped.as_array().tolist()]
+        else:
+            raise RDataException(f"ALTREP class {name} is not supported")
+
+        result = RObject(kind, value)
+        if isinstance(attributes, RObject):
+            result.attributes = dict(zip(attributes.names, attributes.value))
+        return result
+
+    def bytecode(self, representations):
+        code = self.item()
+        return RObject(BCODESXP, [code] + self.bytecode_constants(representations))
+
+    def bytecode_constants(self, representations):
+        constants = []
+        for _ in range(self.integer()):
+            kind = self.integer()
+            if kind == BCODESXP:
+                constants.append(self.bytecode(representations))
+            elif kind in (LANGSXP, LISTSXP, BCREPDEF, BCREPREF, ATTRLANGSXP, ATTRLISTSXP):
+                constants.append(self.bytecode_language(kind, representations))
+            else:
+                constants.append(self.item())
+        return constants
+
+    def bytecode_language(self, kind, representations):
+        if kind == BCREPREF:
+            return representations[self.integer()]
+
+        if kind not in (BCREPDEF, LANGSXP, LISTSXP, ATTRLANGSXP, ATTRLISTSXP):
+            return self.item()
+
+        position = -1
+        if kind == BCREPDEF:
+            position = self.integer()
+            kind = self.integer()
+
+        has_attributes = kind in (ATTRLANGSXP, ATTRLISTSXP)
+        kind = {ATTRLANGSXP: LANGSXP, ATTRLISTSXP: LISTSXP}.get(kind, kind)
+
+        cell = RObject(kind, [None, None], tags=[None, None])
+        if position >= 0:
+            representations[position] = cell
+
+        if has_attributes:
+            self.item()
+        cell.tags[0] = self.item()
+        cell.value[0] = self.bytecode_language(self.integer(), representations)
+        cell.value[1] = self.bytecode_language(self.integer(), representations)
+        return cell
+
+    def item(self, flags=None):
+        """ Reads the next object of the serialization. """
+        if flags is None:
+            flags = self.integer()
+        kind = flags & 0xFF
+
+        if kind in _SINGLETONS:
+            return _SINGLETONS[kind]
+
+        if kind == REFSXP:
+            index = flags >> 8
+            if index == 0:
+                index = self.integer()
+            return self.references[index - 1]
+
+        if kind in (PERSISTSXP, PACKAGESXP, NAMESPACESXP):
+            value = RObject(kind, self.string_vector())
+            self.references.append(value)
+            return value
+
+        if kind == SYMSXP:
+            value = RSymbol(self.item() or "")
+            self.references.append(value)
+            return value
+
+        if kind == ENVSXP:
+            self.integer()  # whether the environment is locked
+            value = RObject(ENVSXP, [])
+            self.references.append(value)
+            value.value = [self.item(), self.item(), self.item()]  # enclosure, frame and hash table
+            attributes = self.item()
+            if isinstance(attributes, RObject):
+                value.attributes = dict(zip(attributes.names, attributes.value))
+            return value
+
+        if kind in (LISTSXP, LANGSXP, DOTSXP):
+            return self.pairlist(flags)
+
+        if kind in (CLOSXP, PROMSXP):
+            attributes = self.attributes(flags)
+            tag = self.item() if flags & (1 << 10) else None
+            return RObject(kind, [self.item(), self.item()], attributes, tags=[tag, None])
+
+        if kind == ALTREP_SXP:
+            return self.altrep()
+
+        if kind == CHARSXP:
+            value = self.charsxp(flags)
+            self.attributes(flags)
+            return value
+
+        if kind == EXTPTRSXP:
+            value = RObject(kind)
+            self.references.append(value)
+            value.value = [self.item(), self.item()]
+        elif kind == WEAKREFSXP:
+            value = RObject(kind)
+            self.references.append(value)
+        elif kind in (SPECIALSXP, BUILTINSXP):
+            value = RObject(kind, self.bytes(self.integer()).decode("ascii"))
+        elif kind in (LGLSXP, INTSXP):
+            value = RObject(kind, self.array(">i4", self.length()))
+        elif kind == REALSXP:
+            value = RObject(kind, self.array(">f8", self.length()))
+        elif kind == CPLXSXP:
+            value = RObject(kind, self.array(">c16", self.length()))
+        elif kind == STRSXP:
+            value = RObject(kind, [self.item() for _ in range(self.length())])
+        elif kind in (VECSXP, EXPRSXP):
+            value = RObject(kind, [self.item() for _ in range(self.length())])
+        elif kind == RAWSXP:
+            value = RObject(kind, self.array(np.uint8, self.length()))
+        elif kind == BCODESXP:
+            value = self.bytecode([None] * self.integer())
+        elif kind == S4SXP:
+            value = RObject(kind)
+        else:
+            raise RDataException(f"Unsupported object type {kind} in serialization")
+
+        value.attributes = self.attributes(flags)
+        return value
+
+
+def _decompress(path):
+    """ Reads the content of a file, which may be compressed with gzip, bzip2 or xz. """
+    with open(path, "rb") as file:
+        magic = file.read(6)
+
+    if magic.startswith(b"\x1f\x8b"):
+        opener = gzip.open
+    elif magic.startswith(b"BZh"):
+        opener = bz2.open
+    elif magic.startswith(b"\xfd7zXZ\x00"):
+        opener = lzma.open
+    else:
+        opener = open
+
+    with opener(path, "rb") as file:
+        return file.read()
+
+
+def read_rdata(path) -> dict:
+    """
+    Reads all objects from an ``.RData`` file.
+
+    Parameters
+    ----------
+    path: str
+        The path to the file, as written by R's ``save``.
+
+    Returns
+    -------
+    dict:
+        The objects of the file by name, in the order in which they were saved.
+
+    Raises
+    ------
+    RDataException
+        When the file is not an ``.RData`` file or uses features of the serialization
+        that are not supported.
+    """
+    data = _decompress(path)
+
+    if data[:5] not in (b"RDX2\n", b"RDX3\n"):
+        raise RDataException("Only RData files in XDR format (RDX2, RDX3) are supported")
+
+    try:
+        reader = _Unserializer(data, pos=5)
+        reader.header()
+        objects = reader.item()
+    except (struct.error, ValueError, IndexError, AttributeError, TypeError) as e:
+        raise RDataException(f"Unable to read RData file: {e}") from e
+
+    if not isinstance(objects, RObject) or objects.type != LISTSXP:
+        raise RDataException("RData file does not contain a list of objects")
+
+    return dict(zip(objects.names, objects.value))
@@ -0,0 +1,116 @@
+#  CC-0 2023.
+#  David Strahl, University of Potsdam
+#  Forester: Interactive human-in-the-loop web-based visualization of machine learning trees
+
+"""
+    Lightweight descriptors for the registered parsers.
+
+    A descriptor only knows where the parsing function lives. The module is imported
+    the first time the format is parsed, so that expensive runtimes (e.g. R) are not
+    started when the package is imported. Third-party parsers can be registered with
+    the entry point group ``forester.parsers``, where the name of the entry point is
+    the format key and its value points to the parsing function.
+"""
+
+import traceback
+import importlib
+import importlib.util
+import importlib.metadata
+
+from dataclasses import dataclass, field
+from loguru import logger
+
+ENTRY_POINT_GROUP = "forester.parsers"
+
+
+@dataclass
+class Parser:
+    """
+        Descriptor of a parsing function that is imported on first use.
+
+        Attributes
+        ----------
+        format: str
+            The format key ``type.vendor.origin``.
+        module: str
+            Absolute name of the module that holds the parsing function.
+        function: str
+            Name of the parsing function in the module.
+        requires: tuple
+            Names of modules that need to be installed for the parser to work.
+            They are only looked up, not imported.
+        pool: WorkerPool
+            When given, the parser is run in the workers of this pool (default `None`).
+        version: int
+            Version of the parser output, to be increased when the output changes.
+        error: str
+            Message of the error that occurred when loading the parser.
+    """
+    format: str
+    module: str = field(default=None)
+    function: str = field(default=None)
+    requires: tuple = field(default=())
+    pool: object = field(default=None, repr=False)
+    version: int = field(default=1)
+    error: str = field(default=None, repr=False)
+
+    _function: object = field(default=None, repr=False)
+
+    @classmethod
+    def from_function(cls, format, function, **kwargs):
+        """ Creates a descriptor for an already loaded function. """
+        return cls(format, function.__module__, function.__name__, _function=function, **kwargs)
+
+    @classmethod
+    def from_entry_point(cls, entry_point):
+        """ Creates a descriptor from an entry point ``format = module:function``. """
+        return cls(entry_point.name.lower(), entry_point.module, entry_point.attr)
+
+    def available(self):
+        """
+        Whether the parser can be used.
+
+        The check only looks for the modules and does not import them. An error that
+        occurred when loading the parser before makes the parser unavailable.
+        """
+        if self.error is not None:
+            return False
+        if self._function is not None:
+            return True
+
+        for name in self.requires + (self.module,):
+            try:
+                if importlib.util.find_spec(name) is None:
+                    self.error = f"No module named '{name}'"
+            except (ImportError, ValueError) as e:
+                self.error = str(e)
+
+        return self.error is None
+
+    def load(self):
+        """ Imports the parsing function, the result is kept for later calls. """
+        if self._function is None:
+            try:
+                self._function = getattr(importlib.import_module(self.module), self.function)
+            except Exception as e:
+                self.error = f"Unable to load parsing module {self.module} due to error: {e}"
+                logger.error(self.error)
+                logger.error("Module will be disabled.")
+                logger.error(traceback.format_exc())
+                raise
+        return self._function
+
+    def __call__(self, path, **kwargs):
+        if self.pool is not None:
+            return self.pool.run(self.module, self.function, path, **kwargs)
+        return self.load()(path, **kwargs)
+
+
+def entry_point_parsers():
+    """ Returns the descriptors of all parsers that are registered by other packages. """
+    try:
+        entry_points = importlib.metadata.entry_points(group=ENTRY_POINT_GROUP)
+    except Exception as e:
+        logger.error(f"Unable to discover parsers of other packages due to error: {e}")
+        return []
+    return [Parser.from_entry_point(entry_point) for entry_point in entry_points]
@@ -0,0 +1,310 @@
+#  CC-0 2023.
+#  David Strahl, University of Potsdam
+#  Forester: Interactive human-in-the-loop web-based visualization of machine learning trees
+
+"""
+    Parsing of objects created by R's ``rpart``.
+
+    The functions in this file do not depend on an R runtime. They only work on
+    the columns of the rpart ``frame`` and the ``splits`` matrix, which the
+    different readers extract from an ``.RData`` file. By default the file is read
+    with :mod:`parser.rdata`, files that it can not read are handed over to the
+    rpy2 based parser in :mod:`parser.R`, when R is installed.
+"""
+
+import os
+import importlib.util
+import numpy as np
+from loguru import logger
+
+from .utils import _humanize
+from .timing import stage
+from .tree import TreeArrays, OPERATORS
+from .sketch import add_histograms
+from .pruning import add_pruning
+from .errors import RDataException
+from .rdata import read_rdata, RObject, VECSXP
+
+
+def _rpart_columns(frame, n_nodes):
+    """
+    Converts the columns of an rpart frame into NumPy arrays.
+
+    Parameters
+    ----------
+    frame: dict
+        Dictionary with the columns ``var``, ``n``, ``ncompete``, ``nsurrogate`` and ``yval2``
+        of the rpart frame. ``yval2`` may be given as an ``(n_nodes, 2k + 2)`` matrix or as a
+        flat list in R's column-major order. Regression trees (``method="anova"``) have no
+        ``yval2``, but the mean of each node in ``yval``.
+    n_nodes: int
+        Number of rows in the frame.
+
+    Returns
+    -------
+    dict:
+        The columns as arrays, ``yval2`` is always of shape ``(n_nodes, 2k + 2)``.
+    """
+    columns = {
+        'var': np.asarray(frame['var'], dtype=str),
+        'n': np.asarray(frame['n'], dtype=int),
+        'ncompete': np.asarray(frame['ncompete'], dtype=int),
+        'nsurrogate': np.asarray(frame['nsurrogate'], dtype=int)
+    }
+
+    if frame.get('yval2') is None:
+        columns['yval'] = np.asarray(frame['yval'], dtype=float).reshape(n_nodes)
+        return columns
+
+    yval2 = np.asarray(frame['yval2'], dtype=float)
+    if yval2.ndim == 1:
+        yval2 = yval2.reshape(-1, n_nodes).T
+    columns['yval2'] = yval2
+
+    return columns
+
+
+def _rpart_tree(frame, splits, features, classes=None) -> TreeArrays:
+    """
+    Creates the tree of a classification or regression tree from the columns of an rpart frame.
+
+    All values are computed on whole columns. The split row of each node is found
+    from the cumulative sum over ``ncompete + nsurrogate + is_split``, see
+    https://stackoverflow.com/questions/56209774/extract-split-values-from-rpart-object-in-r.
+
+    Parameters
+    ----------
+    frame: dict
+        The columns of the rpart frame, see :func:`_rpart_columns`.
+    splits: array_like
+        The ``splits`` matrix of the rpart object (including competing and surrogate splits).
+    features: list
+        Names of the features in the order of the Forester tree.
+    classes: list
+        Names of the classes (the ``ylevels`` attribute of the rpart object), not used for
+        regression trees.
+
+    Returns
+    -------
+    TreeArrays:
+        The tree with the nodes in the order of the frame, which is the pre-order of the tree.
+        The nodes of regression trees hold their mean as value and their number of samples as
+        distribution, until the histograms of the targets are added (see :mod:`parser.sketch`).
+    """
+    var = frame['var']
+    n_nodes = len(var)
+
+    with stage("assemble", nodes=n_nodes):
+        # whether the node has a primary split
+        is_split = var != '<leaf>'
+
+        # index of the primary split of each node in the splits matrix
+        counts = frame['ncompete'] + frame['nsurrogate'] + is_split
+        split_index = np.cumsum(counts) - counts
+
+        samples = frame['n'].astype(np.int64)
+        regression = 'yval2' not in frame
+
+        if regression:
+            vote = np.zeros(n_nodes, dtype=np.int32)
+            distribution = samples[:, None]
+        else:
+            # in 'yval2' the prediction, absolute and relative distribution and
+            # proportion in terms of the total sample number are saved
+            yval2 = frame['yval2']
+            n_classes = int((yval2.shape[1] - 2) / 2)
+            vote = yval2[:, 0].astype(np.int32) - 1
+            distribution = yval2[:, 1:(n_classes + 1)].astype(int)
+
+        # map the variable names to feature indices through a lookup table
+        names, inverse = np.unique(var, return_inverse=True)
+        lookup = {feature: i for i, feature in enumerate(features)}
+        lookup['<leaf>'] = -1
+        unknown = [name for name in names if name not in lookup]
+        if unknown:
+            raise KeyError(f"Split variable {unknown[0]} is not among the features")
+        feature = np.array([lookup[name] for name in names], dtype=np.int32)[inverse]
+
+        # primary split of every inner node
+        rows = np.asarray(splits, dtype=float).reshape(-1, 5)[split_index[is_split]]
+        operator = np.full(n_nodes, -1, dtype=np.int8)
+        operator[is_split] = np.where(rows[:, 1] < 0, OPERATORS.index('<'), OPERATORS.index('>'))
+        threshold = np.full(n_nodes, np.nan)
+        threshold[is_split] = rows[:, 3]
+
+        # the frame holds the nodes in pre-order, every split has two children
+        parent, left, right = TreeArrays.links_from_preorder(is_split)
+
+    with stage("humanize"):
+        meta = {
+            'type': 'regression' if regression else 'classification',
+            'features': _humanize(features),
+            'classes': ['Samples'] if regression else _humanize(classes),
+            'samples': int(frame['n'][0]),
+        }
+
+    return TreeArrays(
+        parent=parent,
+        left=left,
+        right=right,
+        feature=np.where(is_split, feature, -1).astype(np.int32),
+        operator=operator,
+        threshold=threshold,
+        samples=samples,
+        vote=vote,
+        distribution=distribution,
+        meta=meta,
+        value=frame['yval'] if regression else None
+    )
+
+
+def _find_rpart(objects, name=None):
+    """ Returns the object with the given name or the first rpart object in the order of R's ``ls``. """
+    if name is not None:
+        if name not in objects:
+            raise KeyError(f"No object named {name} in file")
+        return objects[name]
+
+    names = sorted(objects, key=lambda n: (n.lower(), n))
+    fits = [n for n in names if 'rpart' in getattr(objects[n], 'classes', [])]
+    return objects[(fits or names)[0]]
+
+
+def _parse_rpart_class(path, **kwargs) -> TreeArrays:
+    """
+    Parses a classification or regression tree created by ``rpart`` from an ``.RData`` file
+    without R.
+
+    When the file can not be read by :func:`parser.rdata.read_rdata` (e.g. because it was
+    saved in the ASCII format), it is parsed with R in the workers of :data:`parser.R_POOL`,
+    or directly when this already runs within a worker (e.g. of :func:`parser.parse_many`).
+    """
+    try:
+        with stage("load", bytes=os.path.getsize(path)):
+            objects = read_rdata(path)
+    except RDataException as e:
+        if importlib.util.find_spec("rpy2") is None:
+            raise
+        logger.warning(f"Unable to read {path} without R, falling back to R: {e}")
+
+        # the stages within the worker are not recorded
+        from .pool import R_POOL
+        with stage("load", bytes=os.path.getsize(path), worker="R"):
+            return R_POOL.run(f"{__package__}.R", "_parse_rpart_class", path, **kwargs)
+
+    logger.info('CART originates from \'rpart\'')
+
+    return _rpart_object(_find_rpart(objects, kwargs.get('name')))
+
+
+def _iter_rpart(path, **kwargs):
+    """
+    Iterates over all trees created by ``rpart`` in an ``.RData`` file.
+    The trees are either saved as separate objects or as elements of a list, e.g. of
+    a bagged ensemble created with ``lapply``. Only the object ``name`` is read, when given.
+    """
+    logger.info('Ensemble originates from \'rpart\'')
+
+    objects = read_rdata(path)
+
+    name = kwargs.get('name')
+    if name is not None:
+        objects = {name: _find_rpart(objects, name)}
+
+    for name in sorted(objects, key=lambda n: (n.lower(), n)):
+        fit = objects[name]
+        if not isinstance(fit, RObject):
+            continue
+        if 'rpart' in fit.classes:
+            yield _rpart_object(fit)
+        elif fit.type == VECSXP and not fit.classes:
+            for element in fit.value:
+                if isinstance(element, RObject) and 'rpart' in element.classes:
+                    yield _rpart_object(element)
+
+
+def _rpart_object(fit) -> TreeArrays:
+    """
+        Creates the tree of an rpart object that was read by :func:`parser.rdata.read_rdata`.
+        The nodes of regression trees hold the histograms of the targets ``y``, when rpart
+        kept them (the default).
+    """
+
+    # the elements of the rpart object are looked up by name, their
+    # position depends on the arguments of rpart (e.g. 'model' or 'x')
+    columns = fit['frame']
+    n_nodes = len(columns['n'])
+
+    with stage("extract", nodes=n_nodes):
+        frame = _rpart_columns({
+            'var': columns['var'].as_strings(),
+            'n': columns['n'].as_array(),
+            'ncompete': columns['ncompete'].as_array(),
+            'nsurrogate': columns['nsurrogate'].as_array(),
+            'yval2': columns['yval2'].as_array() if 'yval2' in columns else None,
+            'yval': columns['yval'].as_array()
+        }, n_nodes)
+
+        # trees without any split have no splits matrix
+        splits = fit['splits'].as_array() if 'splits' in fit else np.zeros((0, 5))
+
+        features = fit['ordered'].names
+        classes = fit.attr('ylevels').as_strings() if fit.attr('ylevels') is not None else None
+
+    tree = _rpart_tree(frame, splits, features, classes)
+
+    if 'cptable' in fit:
+        _rpart_pruning(tree, columns['complexity'].as_array(), fit['cptable'].as_array())
+
+    # the row of the frame in which each training row ended up
+    if 'where' in fit:
+        tree.rows, tree.row_ids = _rpart_rows(fit['where'].as_array(), fit['where'].names)
+
+    if tree.value is not None and tree.rows is not None and 'y' in fit:
+        with stage("sketch", nodes=n_nodes, rows=len(tree.rows)):
+            add_histograms(tree, fit['y'].as_array())
+
+    return tree
+
+
+def _rpart_pruning(tree, complexity, cptable):
+    """
+    Stores the pruning sequence of an rpart tree. The levels are the values of ``CP`` in the
+    ``cptable``, from the smallest (the full tree) to the largest. As in ``prune.rpart``, a
+    node becomes a leaf at the first level whose ``CP`` is not below its ``complexity``.
+
+    Parameters
+    ----------
+    tree: TreeArrays
+        The tree with the nodes in the order of the frame.
+    complexity: array_like
+        The ``complexity`` column of the frame.
+    cptable: array_like
+        The ``cptable`` matrix of the rpart object, with ``CP`` in the first column.
+    """
+    values = np.unique(np.atleast_2d(np.asarray(cptable, dtype=float))[:, 0])
+    level = np.searchsorted(values, np.asarray(complexity, dtype=float), side='left')
+    return add_pruning(tree, level, 'cp', values)
+
+
+def _rpart_rows(where, names=None):
+    """
+    Converts the ``where`` element of an rpart object into the node of each training row.
+
+    The names of ``where`` are the row names of the training data. Numbered rows (the
+    default row names in R) keep their number as id, so that rows which were dropped
+    by rpart (e.g. with missing values) do not shift the ids of the others.
+
+    Returns
+    -------
+    tuple:
+        The node of each row, which is the index of the row of the frame, and the id of
+        each row or `None` when the rows are numbered by their position.
+    """
+    rows = np.asarray(where, dtype=np.int64) - 1
+
+    ids = None
+    if names is not None and len(names) == len(rows) and all(str(name).isdigit() for name in names):
+        ids = np.asarray(names, dtype=np.int64) - 1
+
+    return rows, ids
@@ -0,0 +1,112 @@
+#  CC-0 2023.
+#  David Strahl, University of Potsdam
+#  Forester: Interactive human-in-the-loop web-based visualization of machine learning trees
+
+"""
+    Fixed-size summaries of the targets of regression trees.
+
+    The nodes of a regression tree hold a histogram of their training targets instead
+    of a class distribution. All nodes share the same bins, whose edges are quantiles of
+    the targets of the whole tree, so that every bin holds about the same number of rows
+    at the root. The histogram of each node has the same number of bins, no matter how
+    many rows end up in the node, and is stored in :attr:`TreeArrays.distribution` with
+    the bins as classes:
+
+    .. code-block:: python
+
+        tree.distribution[i]        # number of targets of node i in each bin
+        tree.meta['bins']           # the edges of the bins, one more than bins
+
+    The histograms of all nodes are counted in a single pass over the targets, from the
+    node in which each row ended up (:attr:`TreeArrays.rows`), and summed up from the
+    leaves to the root level by level.
+"""
+
+import numpy as np
+
+from .tree import TreeArrays
+
+# number of bins of the histograms
+N_BINS = 16
+
+
+def quantile_edges(targets, n_bins=N_BINS) -> np.ndarray:
+    """
+    Returns the edges of bins that hold about the same number of targets. Bins of
+    repeated targets are merged, so that there may be fewer than `n_bins` bins.
+    """
+    targets = np.asarray(targets, dtype=float)
+    targets = targets[~np.isnan(targets)]
+    if len(targets) == 0:
+        return np.zeros(0)
+    return np.unique(np.quantile(targets, np.linspace(0, 1, n_bins + 1)))
+
+
+def bin_labels(edges) -> list:
+    """ The names of the bins, the last bin includes its upper edge. """
+    if len(edges) == 1:
+        return [f"{edges[0]:.4g}"]
+    labels = [f"[{a:.4g}, {b:.4g})" for a, b in zip(edges[:-2], edges[1:-1])]
+    return labels + [f"[{edges[-2]:.4g}, {edges[-1]:.4g}]"]
+
+
+def bin_index(edges, values) -> np.ndarray:
+    """ The bin of each value, values outside of the edges are put into the first or last bin. """
+    n_bins = max(len(edges) - 1, 1)
+    return (np.searchsorted(edges, values, side='right') - 1).clip(0, n_bins - 1)
+
+
+def histograms(tree: TreeArrays, targets, n_bins=N_BINS):
+    """
+    Counts the targets of each node of a tree in quantile bins.
+
+    Parameters
+    ----------
+    tree: TreeArrays
+        The tree with the node of each training row in `rows`.
+    targets: array_like
+        The target of each training row, in the order of `rows`.
+    n_bins: int
+        The maximal number of bins.
+
+    Returns
+    -------
+    tuple:
+        The edges of the bins and the histograms as a matrix of shape ``(n_nodes, n_bins)``.
+        Rows that were not used and missing targets are not counted.
+    """
+    targets = np.asarray(targets, dtype=float).reshape(-1)
+    if len(targets) != len(tree.rows):
+        raise ValueError(f"Found {len(targets)} targets for {len(tree.rows)} training rows")
+
+    used = (tree.rows >= 0) & ~np.isnan(targets)
+    edges = quantile_edges(targets[used], n_bins)
+    n_bins = max(len(edges) - 1, 1)
+
+    # the histogram of the node in which each row stopped
+    cell = tree.rows[used] * n_bins + bin_index(edges, targets[used])
+    counts = np.bincount(cell, minlength=len(tree) * n_bins).reshape(len(tree), n_bins)
+
+    # the rows of the children are added from the deepest level to the root
+    is_branch = ~tree.is_leaf
+    for level in reversed(tree.levels()):
+        branch = level[is_branch[level]]
+        counts[branch] += counts[tree.left[branch]] + counts[tree.right[branch]]
+
+    return edges, counts
+
+
+def add_histograms(tree: TreeArrays, targets, n_bins=N_BINS):
+    """
+    Replaces the distribution of a regression tree by the histograms of its targets, see
+    :func:`histograms`. The vote of each node is the bin of its value. Trees without
+    any known target are returned unchanged.
+    """
+    edges, counts = histograms(tree, targets, n_bins)
+    if len(edges) == 0:
+        return tree
+
+    tree.distribution = counts
+    tree.vote = (bin_index(edges, tree.value) if tree.value is not None else counts.argmax(axis=1)).astype(np.int32)
+    tree.meta = dict(tree.meta, classes=bin_labels(edges), bins=edges.tolist())
+    return tree
@@ -0,0 +1,149 @@
+#  CC-0 2023.
+#  David Strahl, University of Potsdam
+#  Forester: Interactive human-in-the-loop web-based visualization of machine learning trees
+
+"""
+    Detection of file formats from the first and last bytes of a file.
+
+    Only a few KB of a file are read, so that files with a wrong format can be rejected
+    before any expensive parsing (or the start of the R runtime) happens.
+
+    | The following formats are detected:
+    | - ``.RData`` files written by R's ``save`` (gzip, bzip2, xz or not compressed)
+    | - Matlab's ``jsonencode`` output of a ``fitctree`` or ``fitrtree`` object
+    | - Matlab's ``.mat`` files (version 5 and 7), assumed to hold the fields of a ``fitctree`` object
+    | - Forester exports
+    | - ``.npz`` files with the arrays of a scikit-learn tree
+    | - JSON dumps of XGBoost ensembles
+
+    JSON files may hold a single object or an array of objects (e.g. the trees of an
+    ensemble), in which case the keys of the objects are checked.
+"""
+
+import re
+import os
+import bz2
+import zlib
+import lzma
+
+# number of bytes read from the start and the end of a file
+SNIFF_SIZE = 4096
+
+# formats that are detected, files that are uploaded with one
+# of these formats are rejected when they are not detected
+FORMATS = ('rdata.r.rpart', 'json.matlab.fitctree', 'json.matlab.fitrtree', 'mat.matlab.fitctree',
+           'json.forester.export', 'npz.python.sklearn', 'json.xgboost.dump')
+
+# magic bytes of the RData formats (XDR, ASCII and native binary)
+RDATA_MAGIC = (b"RDX2\n", b"RDX3\n", b"RDA2\n", b"RDA3\n", b"RDB2\n", b"RDB3\n")
+
+# magic bytes of the compression formats used by R's save
+GZIP_MAGIC = b"\x1f\x8b"
+BZIP2_MAGIC = b"BZh"
+XZ_MAGIC = b"\xfd7zXZ\x00"
+
+# text at the start of MAT-files of version 5 and 7
+MAT_MAGIC = b"MATLAB 5.0 MAT-file"
+
+# magic bytes of a zip archive, which is the container of .npz files
+ZIP_MAGIC = b"PK\x03\x04"
+
+# fields of a fitctree object as written by jsonencode
+FITCTREE_FIELDS = {
+    'Y', 'X', 'W', 'RowsUsed', 'ModelParameters', 'NumObservations', 'BinEdges',
+    'HyperparameterOptimizationResults', 'PredictorNames', 'CategoricalPredictors', 'ResponseName',
+    'ExpandedPredictorNames', 'ClassNames', 'Prior', 'Cost', 'ScoreTransform', 'CategoricalSplit',
+    'Children', 'ClassCount', 'ClassProbability', 'CutCategories', 'CutPoint', 'CutType', 'CutPredictor',
+    'CutPredictorIndex', 'IsBranchNode', 'NodeClass', 'NodeError', 'NodeProbability', 'NodeRisk',
+    'NodeSize', 'NumNodes', 'Parent', 'PruneAlpha', 'PruneList', 'SurrogateCutCategories',
+    'SurrogateCutFlip', 'SurrogateCutPoint', 'SurrogateCutType', 'SurrogateCutPredictor',
+    'SurrogatePredictorAssociation'
+}
+
+# fields of a fitrtree object that a fitctree object does not have
+FITRTREE_FIELDS = {'NodeMean', 'ResponseTransform'}
+
+# keys of the nodes of an XGBoost JSON dump
+XGBOOST_FIELDS = {'nodeid', 'split', 'split_condition', 'yes', 'no', 'leaf'}
+
+# a key within a JSON object
+_KEY = re.compile(rb'"([A-Za-z_]\w*)"\s*:')
+
+
+def _decompress_head(head):
+    """ Decompresses the start of a compressed file as far as possible. """
+    try:
+        if head.startswith(GZIP_MAGIC):
+            return zlib.decompressobj(16 + zlib.MAX_WBITS).decompress(head)
+        if head.startswith(BZIP2_MAGIC):
+            return bz2.BZ2Decompressor().decompress(head)
+        if head.startswith(XZ_MAGIC):
+            return lzma.LZMADecompressor().decompress(head)
+    except (zlib.error, OSError, EOFError, lzma.LZMAError):
+        return None
+    return head
+
+
+def _is_rdata(head):
+    data = _decompress_head(head)
+
+    # bzip2 only returns data after a whole block is read, the magic bytes
+    # of the container are accepted in this case
+    if data == b"" and head.startswith(BZIP2_MAGIC):
+        return True
+
+    return data is not None and data.startswith(RDATA_MAGIC)
+
+
+def _json_keys(head, tail):
+    """ Returns the keys of JSON objects found in the head and the tail of a file. """
+    if not head.lstrip(b"\xef\xbb\xbf \t\r\n").lstrip(b"[ \t\r\n").startswith(b"{"):
+        return None
+    return {key.decode() for key in _KEY.findall(head) + _KEY.findall(tail)}
+
+
+def sniff(path, size=SNIFF_SIZE):
+    """
+    Detects the format of a file.
+
+    Parameters
+    ----------
+    path: str
+        The path to the file.
+    size: int
+        Number of bytes read from the start and from the end of the file.
+
+    Returns
+    -------
+    str:
+        The format key ``type.vendor.origin`` or `None`, when the format is not detected.
+    """
+    with open(path, "rb") as file:
+        head = file.read(size)
+        file.seek(max(len(head), os.fstat(file.fileno()).st_size - size))
+        tail = file.read(size)
+
+    if _is_rdata(head):
+        return 'rdata.r.rpart'
+
+    if head.startswith(MAT_MAGIC):
+        return 'mat.matlab.fitctree'
+
+    # the central directory at the end of the archive lists all arrays
+    if head.startswith(ZIP_MAGIC):
+        return 'npz.python.sklearn' if b"children_left.npy" in head + tail else None
+
+    keys = _json_keys(head, tail)
+    if keys is None:
+        return None
+
+    if 'meta' in keys and ('tree' in keys or 'children' in keys):
+        return 'json.forester.export'
+
+    if 'nodeid' in keys and len(keys & XGBOOST_FIELDS) >= 2:
+        return 'json.xgboost.dump'
+
+    if len(keys & (FITCTREE_FIELDS | FITRTREE_FIELDS)) >= 2:
+        return 'json.matlab.fitrtree' if keys & FITRTREE_FIELDS else 'json.matlab.fitctree'
+
+    return None
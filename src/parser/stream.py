@@ -0,0 +1,509 @@
+#  CC-0 2023.
+#  David Strahl, University of Potsdam
+#  Forester: Interactive human-in-the-loop web-based visualization of machine learning trees
+
+"""
+    Incremental reader for large JSON files.
+
+    Exports from Matlab's ``jsonencode`` contain the whole training data next to the
+    few fields that describe the tree. The reader in this file walks over the top-level
+    object of such a file in chunks and only decodes the values of the requested keys.
+    All other values are skipped on the raw bytes, without creating Python objects for
+    them, so that the memory needed is bounded by the chunk size and the size of the
+    requested values. Files with a top-level array, such as the trees of an ensemble,
+    are read one element at a time.
+
+    The reader records the position of each key in the file, so that a large value
+    (e.g. the training data) can be read later without walking over the file again.
+"""
+
+import re
+import json
+import numpy as np
+
+# a complete JSON string, including escaped characters
+_STRING = re.compile(rb'"[^"\\]*(?:\\.[^"\\]*)*"', re.DOTALL)
+
+# a complete JSON string or a structural character
+_TOKEN = re.compile(rb'"[^"\\]*(?:\\.[^"\\]*)*"|[\[\]{}]', re.DOTALL)
+
+# a number or literal
+_SCALAR = re.compile(rb'[^,\]}\s]*')
+
+# whitespace between tokens
+_WHITESPACE = re.compile(rb'[ \t\n\r]*')
+
+# characters that may follow a complete value
+_DELIMITERS = frozenset(' \t\n\r,:]}')
+
+# separator after an element of an array
+_SEPARATOR = re.compile(r'[ \t\n\r]*([,\]])[ \t\n\r]*')
+
+# size of the first window in which a value is decoded or the end of a container is searched
+_WINDOW = 1 << 10
+
+# largest window that is searched for the end of a container at once
+_MAX_WINDOW = 1 << 18
+
+# window in which the elements of an array are decoded at once, which bounds the memory
+# of the decoded elements that are not yet yielded
+_ELEMENT_WINDOW = 1 << 16
+
+_DECODER = json.JSONDecoder()
+
+_OPEN = (ord('['), ord('{'))
+_CLOSE = (ord(']'), ord('}'))
+_QUOTE = ord('"')
+
+
+def _brackets(chars) -> np.ndarray:
+    """ The change of the depth at each byte, small types keep the windows cheap. """
+    return ((chars == _OPEN[0]) | (chars == _OPEN[1])).view(np.int8) \
+        - ((chars == _CLOSE[0]) | (chars == _CLOSE[1])).view(np.int8)
+
+
+def _decode(data, final):
+    """
+    Decodes UTF-8 bytes. A character that is cut off at the end of the bytes is dropped,
+    unless they are `final`. Invalid bytes raise a :class:`ValueError`.
+    """
+    try:
+        return data.decode("utf-8")
+    except UnicodeDecodeError as e:
+        if final or e.end != len(data) or e.reason != "unexpected end of data":
+            raise ValueError(f"Invalid UTF-8 in JSON file: {e}") from e
+        return data[:e.start].decode("utf-8")
+
+
+class _Reader:
+    """
+        Cursor over a binary file that keeps only the bytes that are not yet consumed.
+    """
+
+    def __init__(self, file, chunk_size, offset=0):
+        self.file = file
+        self.chunk_size = chunk_size
+        self.buffer = b""
+        self.pos = 0
+        self.mark = None
+        self.eof = False
+
+        # position of the buffer in the file
+        self.offset = offset
+        if offset:
+            file.seek(offset)
+
+    def tell(self):
+        """ The position of the cursor in the file. """
+        return self.offset + self.pos
+
+    def fill(self):
+        """
+            Reads the next chunk. Consumed bytes are dropped, unless they follow the mark.
+        """
+        if self.eof:
+            raise ValueError("Unexpected end of JSON file")
+
+        cut = self.pos if self.mark is None else self.mark
+        chunk = self.file.read(max(self.chunk_size, len(self.buffer) - cut))
+
+        self.buffer = self.buffer[cut:] + chunk
+        self.offset += cut
+        self.pos -= cut
+        if self.mark is not None:
+            self.mark -= cut
+
+        self.eof = len(chunk) == 0
+
+    def peek(self):
+        """ Skips whitespace and returns the next byte. """
+        while True:
+            self.pos = _WHITESPACE.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            self.fill()
+
+    def expect(self, char):
+        if self.peek() != ord(char):
+            raise ValueError(f"Expected '{char}' in JSON file")
+        self.pos += 1
+
+    def skip_match(self, pattern):
+        """ Moves behind a pattern that must not end at the end of the buffer. """
+        while True:
+            match = pattern.match(self.buffer, self.pos)
+            if match is not None and (match.end() < len(self.buffer) or self.eof):
+                self.pos = match.end()
+                return
+            self.fill()
+
+    def skip_container(self):
+        """
+            Moves behind the array or object at the cursor.
+
+            The brackets are counted on a NumPy view of the bytes in windows that double in
+            size, so that small containers (e.g. single nodes) are skipped without looking at
+            the rest of the chunk. Brackets within strings are masked by the number of quotes
+            before them. Windows with escaped characters are stripped of their strings instead,
+            and only the window in which the container ends is walked token by token.
+        """
+        depth = 0
+        window = _WINDOW
+        while True:
+            stop = min(len(self.buffer), self.pos + window)
+
+            if self.buffer.find(b"\\", self.pos, stop) < 0:
+                # a string that is still open at the end of the window is left for the next window
+                chars = np.frombuffer(self.buffer, dtype=np.uint8, count=stop - self.pos, offset=self.pos)
+                quotes = np.flatnonzero(chars == _QUOTE)
+                end = len(chars) if len(quotes) % 2 == 0 else int(quotes[-1])
+
+                # only the brackets are counted, those after an odd number of quotes are within strings
+                delta = _brackets(chars[:end])
+                brackets = np.flatnonzero(delta)
+                brackets = brackets[np.searchsorted(quotes, brackets) % 2 == 0]
+                levels = depth + np.cumsum(delta[brackets], dtype=np.int32)
+
+                if len(levels) > 0 and levels.min() <= 0:
+                    self.pos += int(brackets[np.argmax(levels <= 0)]) + 1
+                    return
+                end += self.pos
+            else:
+                # strip all complete strings, a string that is still open
+                # at the end of the window is left for the next window
+                stripped = _STRING.sub(b"", self.buffer[self.pos:stop])
+                end = stop
+                if (k := stripped.find(b'"')) >= 0:
+                    end -= len(stripped) - k
+                    stripped = stripped[:k]
+                levels = depth + np.cumsum(_brackets(np.frombuffer(stripped, dtype=np.uint8)), dtype=np.int32)
+
+                if len(levels) > 0 and levels.min() <= 0:
+                    # the container is closed within this window
+                    for match in _TOKEN.finditer(self.buffer, self.pos, end):
+                        char = self.buffer[match.start()]
+                        if char in _OPEN:
+                            depth += 1
+                        elif char in _CLOSE:
+                            depth -= 1
+                            if depth == 0:
+                                self.pos = match.end()
+                                return
+
+            depth = int(levels[-1]) if len(levels) > 0 else depth
+            self.pos = end
+            window = min(2 * window, _MAX_WINDOW)
+            if stop == len(self.buffer):
+                self.fill()
+
+    def skip_value(self):
+        """ Moves behind the value at the cursor. """
+        char = self.peek()
+        if char in _OPEN:
+            self.skip_container()
+        elif char == ord('"'):
+            self.skip_match(_STRING)
+        else:
+            self.skip_match(_SCALAR)
+
+    def read_value(self):
+        """
+            Decodes the value at the cursor.
+
+            The value is decoded from a window of the buffer that doubles in size until it
+            holds the whole value, so that small values (e.g. single nodes) are decoded in
+            one step without skipping them first.
+        """
+        self.peek()
+        self.mark = self.pos
+        try:
+            window = _WINDOW
+            while True:
+                stop = min(len(self.buffer), self.mark + window)
+                # a character that is cut off at the end of the window is dropped
+                text = _decode(self.buffer[self.mark:stop], self.eof and stop == len(self.buffer))
+                try:
+                    value, end = _DECODER.raw_decode(text)
+                    error = None
+                except json.JSONDecodeError as e:
+                    end, error = None, e
+
+                # a value that is not followed by a delimiter may be cut off at the end of
+                # the window (e.g. a number, of which only the digits before the point are read)
+                if end is not None and ((end < len(text) and text[end] in _DELIMITERS)
+                                        or (self.eof and stop == len(self.buffer))):
+                    self.pos = self.mark + (end if text.isascii() else len(text[:end].encode("utf-8")))
+                    return value
+
+                if stop == len(self.buffer):
+                    if self.eof:
+                        raise error
+                    self.fill()
+                window *= 2
+        finally:
+            self.mark = None
+
+    def iter_elements(self, size):
+        """
+            Decodes the elements of the array at the cursor and yields them in lists of at
+            most `size` elements. The cursor is moved behind the array.
+
+            The elements that end within a window of the buffer are decoded together, so
+            that arrays of many small elements (e.g. the rows of a matrix) are read without
+            handling each element on its own. Their ends are found by counting the brackets
+            as in :meth:`skip_container`, windows with escaped characters are decoded one
+            element after another.
+        """
+        self.expect('[')
+        batch = []
+        closed = self.peek() == ord(']')
+        if closed:
+            self.pos += 1
+
+        window = _ELEMENT_WINDOW
+        while not closed:
+            self.peek()
+            stop = min(len(self.buffer), self.pos + window)
+            last = self.eof and stop == len(self.buffer)
+
+            if self.buffer.find(b"\\", self.pos, stop) < 0:
+                values, index, closed = self._decode_elements(stop)
+            else:
+                values, index, closed = self._decode_each(stop, last)
+
+            batch.extend(values)
+            while len(batch) >= size:
+                yield batch[:size]
+                batch = batch[size:]
+
+            # the cursor is moved behind the decoded elements, the rest is read again,
+            # in a larger window when not even one element fits into the window
+            self.pos += index
+            window = _ELEMENT_WINDOW if index > 0 else 2 * window
+            if not closed and stop == len(self.buffer):
+                self.fill()
+
+        if batch:
+            yield batch
+
+    def _decode_elements(self, stop):
+        """
+            Decodes all elements of an array that end before `stop`, in a window without escaped
+            characters. Returns the elements, the number of bytes read and whether the array ended.
+        """
+        chars = np.frombuffer(self.buffer, dtype=np.uint8, count=stop - self.pos, offset=self.pos)
+        quotes = np.flatnonzero(chars == _QUOTE)
+        end = len(chars) if len(quotes) % 2 == 0 else int(quotes[-1])
+
+        # the depth within the array after each bracket that is not within a string
+        delta = _brackets(chars[:end])
+        brackets = np.flatnonzero(delta)
+        brackets = brackets[np.searchsorted(quotes, brackets) % 2 == 0]
+        levels = np.cumsum(delta[brackets], dtype=np.int32)
+
+        # the array ends at the first bracket that closes it
+        closes = np.flatnonzero(levels < 0)
+        if len(closes):
+            end = int(brackets[closes[0]])
+            values = json.loads(_decode(b"[" + self.buffer[self.pos:self.pos + end] + b"]", True))
+            return values, end + 1, True
+
+        # the elements are separated by the commas at depth zero
+        commas = np.flatnonzero(chars[:end] == ord(','))
+        commas = commas[np.searchsorted(quotes, commas) % 2 == 0]
+        depth = np.concatenate(([0], levels))[np.searchsorted(brackets, commas)]
+        commas = commas[depth == 0]
+        if not len(commas):
+            return [], 0, False
+
+        end = int(commas[-1])
+        return json.loads(_decode(b"[" + self.buffer[self.pos:self.pos + end] + b"]", True)), end + 1, False
+
+    def _decode_each(self, stop, last):
+        """
+            Decodes the elements of an array that end before `stop` one after another, see
+            :meth:`_decode_elements`. With `last`, the window reaches the end of the file.
+        """
+        text = _decode(self.buffer[self.pos:stop], last)
+        values = []
+        index = 0
+        closed = False
+        while index < len(text):
+            try:
+                value, end = _DECODER.raw_decode(text, index)
+            except json.JSONDecodeError:
+                if last:
+                    raise
+                break
+
+            # a value at the end of the window may be cut off (e.g. a number)
+            separator = _SEPARATOR.match(text, end)
+            if separator is None or (separator.end() == len(text) and not last):
+                if last and separator is None:
+                    raise ValueError("Expected ',' or ']' in JSON file")
+                break
+
+            values.append(value)
+            index = separator.end()
+            if separator.group(1) == ']':
+                closed = True
+                break
+
+        return values, index if text.isascii() else len(text[:index].encode("utf-8")), closed
+
+
+def _read_keys(reader, keys, stop=False, offsets=None, locate=()) -> dict:
+    """
+    Decodes the values of the given keys of the object at the cursor.
+
+    With `stop`, reading ends as soon as all keys are found and the keys to `locate`
+    were passed, and the cursor is left within the object. Otherwise, the cursor is moved
+    behind the object. The position of each key that is passed is stored in `offsets`.
+    """
+    values = {}
+    missing = set(locate)
+
+    reader.expect('{')
+    if reader.peek() == ord('}'):
+        reader.pos += 1
+        return values
+
+    while True:
+        reader.peek()
+        position = reader.tell()
+        key = reader.read_value()
+        reader.expect(':')
+        if offsets is not None:
+            offsets[key] = position
+        missing.discard(key)
+
+        if keys is None or key in keys:
+            values[key] = reader.read_value()
+            if stop and len(values) == len(keys) and not missing:
+                return values
+        else:
+            reader.skip_value()
+
+        if reader.peek() == ord('}'):
+            reader.pos += 1
+            return values
+        reader.expect(',')
+
+
+def load_keys(path, keys, chunk_size=1 << 20, offsets=None, locate=()) -> dict:
+    """
+    Loads selected keys from the top-level object of a JSON file.
+
+    Parameters
+    ----------
+    path: str
+        The path to the JSON file.
+    keys: iterable
+        The keys that should be decoded. All other values are skipped.
+    chunk_size: int
+        Number of bytes that are read at once (default 1 MiB).
+    offsets: dict
+        When given, the position in the file of each key that was passed is stored in it.
+    locate: iterable
+        Keys that are not decoded, but whose position is stored in `offsets`. Reading
+        only stops once they were passed, a key that is not in `offsets` is not in the file.
+
+    Returns
+    -------
+    dict:
+        The decoded values of all requested keys that exist in the file.
+        Reading stops as soon as all keys have been found.
+    """
+    with open(path, "rb") as file:
+        return _read_keys(_Reader(file, chunk_size), set(keys), stop=True, offsets=offsets, locate=locate)
+
+
+def iter_array(path, keys=None, chunk_size=1 << 20):
+    """
+    Iterates over the elements of the top-level array of a JSON file.
+
+    Only one element is decoded at a time, so that files with many large elements
+    (e.g. the trees of an ensemble) can be read with bounded memory.
+
+    Parameters
+    ----------
+    path: str
+        The path to the JSON file.
+    keys: iterable
+        When given, only these keys are decoded from elements that are objects.
+    chunk_size: int
+        Number of bytes that are read at once (default 1 MiB).
+
+    Yields
+    ------
+    The decoded elements of the array.
+    """
+    keys = set(keys) if keys is not None else None
+
+    with open(path, "rb") as file:
+        reader = _Reader(file, chunk_size)
+        reader.expect('[')
+
+        if reader.peek() == ord(']'):
+            return
+
+        while True:
+            if keys is not None and reader.peek() == ord('{'):
+                yield _read_keys(reader, keys)
+            else:
+                yield reader.read_value()
+
+            if reader.peek() == ord(']'):
+                return
+            reader.expect(',')
+
+
+def iter_key(path, key, size=4096, chunk_size=1 << 20, offset=None):
+    """
+    Iterates over the array stored under a key of the top-level object of a JSON file.
+
+    The elements are decoded one at a time and yielded in lists, so that large arrays
+    (e.g. the training data of a tree) are read with memory bounded by `size` elements.
+
+    Parameters
+    ----------
+    path: str
+        The path to the JSON file.
+    key: str
+        The key of the array. Other values are skipped.
+    size: int
+        Number of elements in each list (default 4096).
+    chunk_size: int
+        Number of bytes that are read at once (default 1 MiB).
+    offset: int
+        The position of the key in the file, e.g. from the `offsets` of :func:`load_keys`,
+        so that the file is not searched for it. By default, the whole object is searched.
+
+    Yields
+    ------
+    Lists of the decoded elements. A value under `key` that is not an array is yielded
+    as a list with the single value, unless it is ``null``.
+    """
+    with open(path, "rb") as file:
+        reader = _Reader(file, chunk_size, offset or 0)
+        if offset is None:
+            reader.expect('{')
+
+        while reader.peek() != ord('}'):
+            name = reader.read_value()
+            reader.expect(':')
+
+            if name != key:
+                reader.skip_value()
+                if reader.peek() != ord('}'):
+                    reader.expect(',')
+                continue
+
+            if reader.peek() != ord('['):
+                value = reader.read_value()
+                if value is not None:
+                    yield [value]
+                return
+
+            yield from reader.iter_elements(size)
+            return
@@ -0,0 +1,969 @@
+#  CC-0 2023.
+#  David Strahl, University of Potsdam
+#  Forester: Interactive human-in-the-loop web-based visualization of machine learning trees
+
+import os
+import json
+import unittest
+import unittest.mock
+import dataclasses
+import tracemalloc
+import numpy as np
+
+from src.parser.Matlab import _parse_fitctree, _parse_fitctree_mat
+from src.parser.mat import read_mat
+from src.parser.errors import MatFileException
+from src.parser.stream import load_keys, iter_key
+from src.parser.pool import WorkerPool
+from src.parser.errors import WorkerCrashedException
+from src.parser.registry import Parser
+from src.parser.batch import parse_many
+from src.parser.sniff import sniff
+from src.parser.rdata import read_rdata
+from src.parser.rpart import _parse_rpart_class
+from src.parser.errors import RDataException
+from src.parser.tree import TreeArrays, flatten, nest, iterencode, json_version
+from src.parser.binary import write_tree, open_tree, write_membership, open_membership
+from src.parser.membership import Membership
+from src.parser.Python import _parse_sklearn
+from src.parser.Matlab import _iter_fitctree
+from src.parser.XGBoost import _iter_xgboost_dump
+from src.parser.stream import iter_array
+from src.parser.binary import EnsembleWriter, open_ensemble
+from src.parser.timing import ParseTimings, stage
+from src.parser import parse, format_key, check
+from src.parser.errors import UnknownFormatException
+from src.parser.Forester import validate_export, _parse_export
+from src.parser.errors import InvalidExportException
+from src.parser.Matlab import _parse_fitrtree
+from src.parser.rpart import _rpart_columns, _rpart_tree, _rpart_rows, _iter_rpart
+from src.parser.sketch import add_histograms, bin_index
+from src.parser.pruning import add_pruning, prune, pruning_level, pruning_sequence
+
+EXAMPLES = os.path.join(os.path.dirname(__file__), "../../../examples")
+
+
+def load_example(name, file="tree.json"):
+    with open(os.path.join(EXAMPLES, name, file)) as file:
+        return json.load(file)
+
+
+class MatlabTest(unittest.TestCase):
+
+    def test_examples(self):
+        """
+            Checks that the parsed Matlab examples equal the stored trees.
+        """
+        for name in ["Matlab Iris", "Matlab Fanny"]:
+            tree = _parse_fitctree(os.path.join(EXAMPLES, name, "input.json"))
+            self.assertEqual(load_example(name), tree.to_json())
+
+    def test_single_node(self):
+        """
+            Checks that a tree without splits is parsed, for which ``jsonencode``
+            drops the brackets of the node fields.
+        """
+        fit = load_example("Matlab Iris", "input.json")
+        fit.update({
+            'NumNodes': 1, 'Parent': 0, 'Children': [0, 0], 'NodeSize': 150,
+            'ClassCount': [50, 50, 50], 'ClassProbability': [1 / 3, 1 / 3, 1 / 3],
+            'CutPoint': None, 'CutPredictorIndex': 0
+        })
+
+        path = os.path.join(os.path.dirname(__file__), "single_node.json")
+        try:
+            with open(path, "w") as file:
+                json.dump(fit, file)
+            tree = _parse_fitctree(path).to_json()['tree']
+        finally:
+            os.remove(path)
+
+        self.assertEqual('root', tree['type'])
+        self.assertEqual([], tree['children'])
+        self.assertEqual([50, 50, 50], tree['distribution'])
+        self.assertNotIn('split', tree)
+
+    def test_mat(self):
+        """
+            Checks that the trees read from MAT-files equal the trees read from the JSON files,
+            for fields saved as variables (compressed) and in a struct (not compressed).
+        """
+        for name in ["Matlab Iris", "Matlab Fanny"]:
+            tree = _parse_fitctree(os.path.join(EXAMPLES, name, "input.json"))
+            mat = _parse_fitctree_mat(os.path.join(EXAMPLES, name, "input.mat"))
+            self.assertEqual(tree.to_json(), mat.to_json())
+            self.assertEqual(None if tree.rows is None else tree.rows.tolist(),
+                             None if mat.rows is None else mat.rows.tolist())
+
+        # only the selected variables are read, the training data is not needed
+        variables = read_mat(os.path.join(EXAMPLES, "Matlab Iris", "input.mat"), ["NumNodes", "ClassNames"])
+        self.assertEqual({'NumNodes': 9, 'ClassNames': ["setosa", "versicolor", "virginica"]}, variables)
+
+        with self.assertRaises(MatFileException):
+            _parse_fitctree_mat(os.path.join(EXAMPLES, "Matlab Iris", "input.mat"), name="tree")
+
+
+class StreamTest(unittest.TestCase):
+
+    def test_load_keys(self):
+        """
+            Checks that selected keys are read correctly, also when values and strings
+            are split over many chunks.
+        """
+        path = os.path.join(EXAMPLES, "Matlab Iris", "input.json")
+        fit = load_keys(path, [])
+        self.assertEqual({}, fit)
+
+        full = load_example("Matlab Iris", "input.json")
+        for chunk_size in [1, 3, 64, 1 << 20]:
+            self.assertEqual(full, load_keys(path, full.keys(), chunk_size=chunk_size))
+
+            keys = ['NumNodes', 'CutPoint', 'ClassNames', 'Missing']
+            self.assertEqual({key: full[key] for key in keys[:3]}, load_keys(path, keys, chunk_size=chunk_size))
+
+    def test_escaped_strings(self):
+        """
+            Checks that brackets and quotes within skipped strings are ignored.
+        """
+        path = os.path.join(os.path.dirname(__file__), "escaped.json")
+        document = {'X': [{'a': 'x]}\\"[{'}, '\\', '"}'], 'Y': {'b': [1, 2.5, None]}, 'Z': True, 'N': -0.25}
+        try:
+            with open(path, "w") as file:
+                json.dump(document, file)
+            for chunk_size in [1, 2, 5]:
+                self.assertEqual({'Y': document['Y'], 'Z': True}, load_keys(path, ['Y', 'Z'], chunk_size=chunk_size))
+                self.assertEqual({'N': -0.25}, load_keys(path, ['N'], chunk_size=chunk_size))
+
+            # bytes that are not UTF-8 are rejected instead of being dropped
+            with open(path, "wb") as file:
+                file.write(b'{"A": "\xff", "B": 1}')
+            with self.assertRaises(ValueError):
+                load_keys(path, ['A'])
+        finally:
+            os.remove(path)
+
+    def test_offsets(self):
+        """
+            Checks that the positions of the keys are recorded and that a key is read from
+            its position without searching the file again.
+        """
+        path = os.path.join(os.path.dirname(__file__), "offsets.json")
+        document = {'A': ["[é]", 2], 'X': [[1.5, 2], [3, 4]], 'B': 3, 'C': {'d': 4}}
+        try:
+            with open(path, "w") as file:
+                json.dump(document, file, ensure_ascii=False)
+            with open(path, "rb") as file:
+                data = file.read()
+
+            for chunk_size in [1, 3, 1 << 20]:
+                offsets = {}
+                self.assertEqual({'A': document['A']}, load_keys(path, ['A'], chunk_size=chunk_size, offsets=offsets))
+                self.assertEqual({'A': data.index(b'"A"')}, offsets)
+
+                offsets = {}
+                self.assertEqual({'A': document['A']}, load_keys(path, ['A'], chunk_size=chunk_size,
+                                                                  offsets=offsets, locate=['C', 'Missing']))
+                self.assertEqual({key: data.index(f'"{key}"'.encode()) for key in document}, offsets)
+                self.assertEqual([document['X']], list(iter_key(path, 'X', chunk_size=chunk_size, offset=offsets['X'])))
+                self.assertEqual([[document['C']]], list(iter_key(path, 'C', chunk_size=chunk_size, offset=offsets['C'])))
+        finally:
+            os.remove(path)
+
+        # files without training data are read only once
+        with unittest.mock.patch("src.parser.Matlab.iter_key", side_effect=AssertionError("File was read again")):
+            tree = _parse_fitctree(os.path.join(EXAMPLES, "Matlab Fanny", "input.json"))
+        self.assertEqual(load_example("Matlab Fanny"), tree.to_json())
+
+    def test_iter_key(self):
+        """
+            Checks that the elements of an array are read in batches, also when elements
+            are split over many chunks.
+        """
+        path = os.path.join(os.path.dirname(__file__), "iter_key.json")
+        document = {'A': [1, 2], 'X': [[1.5, None], {'a': 'ä]"'}, "\u00fc", [], -2e-3, True], 'Y': None, 'Z': 7}
+        try:
+            with open(path, "w") as file:
+                json.dump(document, file, indent=1)
+            for chunk_size in [1, 3, 64, 1 << 20]:
+                batches = list(iter_key(path, 'X', size=4, chunk_size=chunk_size))
+                self.assertEqual([document['X'][:4], document['X'][4:]], batches)
+                self.assertEqual([[7]], list(iter_key(path, 'Z', chunk_size=chunk_size)))
+                self.assertEqual([], list(iter_key(path, 'Y', chunk_size=chunk_size)))
+                self.assertEqual([], list(iter_key(path, 'Missing', chunk_size=chunk_size)))
+        finally:
+            os.remove(path)
+
+    def test_memory(self):
+        """
+            Checks that the training data of a Matlab export is never held in memory as a whole,
+            the memory needed to find the rows of the nodes is bounded by the size of the batches.
+        """
+        fit = load_example("Matlab Iris", "input.json")
+        n_rows = 10000
+        fit['X'] = np.round(np.random.default_rng(0).uniform(0, 8, (n_rows, 50)), 1).tolist()
+        fit['RowsUsed'] = [True] * n_rows
+
+        path = os.path.join(os.path.dirname(__file__), "memory.json")
+        try:
+            with open(path, "w") as file:
+                json.dump(fit, file)
+            del fit
+
+            tracemalloc.start()
+            try:
+                with open(path) as file:
+                    json.load(file)
+                decoded = tracemalloc.get_traced_memory()[1]
+
+                tracemalloc.reset_peak()
+                tree = _parse_fitctree(path)
+                peak = tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+        finally:
+            os.remove(path)
+
+        self.assertEqual(n_rows, len(tree.rows))
+        self.assertLess(peak, decoded / 3)
+
+
+class PoolTest(unittest.TestCase):
+
+    def test_run(self):
+        """
+            Checks that jobs run in the workers and that a crashed worker
+            only fails its own job.
+        """
+        pool = WorkerPool(size=1, modules=("src.parser.Matlab",))
+        try:
+            path = os.path.join(EXAMPLES, "Matlab Iris", "input.json")
+            self.assertEqual(load_example("Matlab Iris"), pool.run("src.parser.Matlab", "_parse_fitctree", path).to_json())
+
+            self.assertRaises(WorkerCrashedException, pool.run, "os", "_exit", 1)
+            self.assertEqual(load_example("Matlab Iris"), pool.run("src.parser.Matlab", "_parse_fitctree", path).to_json())
+        finally:
+            pool.shutdown()
+
+    def test_shutdown(self):
+        """
+            Checks that the exit handler of a pool is only registered while its workers run
+            and that pools run jobs directly within a worker.
+        """
+        with unittest.mock.patch("src.parser.pool.atexit") as atexit:
+            pool = WorkerPool(size=1)
+            atexit.register.assert_not_called()
+            self.assertNotEqual(os.getpid(), pool.run("os", "getpid"))
+            atexit.register.assert_called_once_with(pool.shutdown)
+            pool.shutdown()
+            atexit.unregister.assert_called_once_with(pool.shutdown)
+
+        with unittest.mock.patch("src.parser.pool._WORKER", True):
+            self.assertEqual(os.getpid(), pool.run("os", "getpid"))
+            self.assertIsNone(pool._executor)
+
+
+class RegistryTest(unittest.TestCase):
+
+    def test_lazy(self):
+        """
+            Checks that the parsing function is only imported when it is called.
+        """
+        parser = Parser('json.matlab.fitctree', 'src.parser.Matlab', '_parse_fitctree')
+        self.assertTrue(parser.available())
+        self.assertIsNone(parser._function)
+
+        tree = parser(os.path.join(EXAMPLES, "Matlab Iris", "input.json"))
+        self.assertEqual(load_example("Matlab Iris"), tree.to_json())
+        self.assertIsNotNone(parser._function)
+
+    def test_unavailable(self):
+        """
+            Checks that missing requirements and modules are detected without importing.
+        """
+        parser = Parser('json.test.missing', 'src.parser.Matlab', '_parse_fitctree', requires=('forester_missing',))
+        self.assertFalse(parser.available())
+        self.assertIn('forester_missing', parser.error)
+
+        parser = Parser('json.test.missing', 'src.parser.Missing', '_parse')
+        self.assertFalse(parser.available())
+
+
+class BatchTest(unittest.TestCase):
+
+    def test_parse_many(self):
+        """
+            Checks that all files of a batch are parsed (including an export of Forester)
+            and that errors of single files are collected without stopping the batch.
+        """
+        matlab = {'vendor': 'Matlab', 'origin': 'fitctree'}
+        specs = [(os.path.join(EXAMPLES, name, "input.json"), matlab) for name in ["Matlab Iris", "Matlab Fanny"]]
+        specs += [{'path': os.path.join(EXAMPLES, "Missing", "input.json"), **matlab},
+                  os.path.join(EXAMPLES, "R Iris", "tree.json")]
+
+        batch = parse_many(specs, workers=2)
+        results = {os.path.basename(os.path.dirname(result.path)): result for result in batch}
+
+        self.assertEqual(4, len(results))
+        self.assertEqual(load_example("Matlab Iris"), results["Matlab Iris"].tree.to_json())
+        self.assertEqual(load_example("Matlab Fanny"), results["Matlab Fanny"].tree.to_json())
+        self.assertFalse(results["Missing"].ok)
+        self.assertEqual(load_example("R Iris"), results["R Iris"].tree.to_json())
+        self.assertEqual(1, len(batch.errors))
+        self.assertGreater(batch.throughput, 0)
+
+
+class SniffTest(unittest.TestCase):
+
+    def test_examples(self):
+        """
+            Checks that the formats of the examples are detected.
+        """
+        self.assertEqual('json.matlab.fitctree', sniff(os.path.join(EXAMPLES, "Matlab Iris", "input.json")))
+        self.assertEqual('json.matlab.fitctree', sniff(os.path.join(EXAMPLES, "Matlab Fanny", "input.json")))
+        self.assertEqual('mat.matlab.fitctree', sniff(os.path.join(EXAMPLES, "Matlab Fanny", "input.mat")))
+        self.assertEqual('rdata.r.rpart', sniff(os.path.join(EXAMPLES, "R Iris", "input.RData")))
+        self.assertEqual('json.forester.export', sniff(os.path.join(EXAMPLES, "R Diabetes", "tree.json")))
+
+    def test_declared(self):
+        """
+            Checks that the detected format only fills in values that were not given and that
+            a file which does not match its given format is rejected.
+        """
+        path = os.path.join(EXAMPLES, "Matlab Iris", "input.json")
+        self.assertEqual('json.matlab.fitctree', format_key(path, {}))
+        self.assertEqual('json.matlab.fitctree', format_key(path, {'type': 'JSON', 'vendor': 'Matlab'}))
+
+        kwargs = {'type': 'rdata', 'vendor': 'r', 'origin': 'rpart'}
+        self.assertEqual('rdata.r.rpart', format_key(path, kwargs))
+        self.assertEqual({'type': 'rdata', 'vendor': 'r', 'origin': 'rpart'}, kwargs)
+        with self.assertRaises(UnknownFormatException):
+            check(path, kwargs)
+
+    def test_compression(self):
+        """
+            Checks that RData files are detected with all compressions used by R.
+        """
+        import gzip, bz2, lzma
+
+        with gzip.open(os.path.join(EXAMPLES, "R Iris", "input.RData")) as file:
+            data = file.read()
+
+        path = os.path.join(os.path.dirname(__file__), "sniff.RData")
+        try:
+            for compress in [bz2.compress, lzma.compress, lambda data: data]:
+                with open(path, "wb") as file:
+                    file.write(compress(data))
+                self.assertEqual('rdata.r.rpart', sniff(path))
+
+            with open(path, "wb") as file:
+                file.write(b"\x1f\x8b" + os.urandom(1024))
+            self.assertIsNone(sniff(path))
+        finally:
+            os.remove(path)
+
+
+class RDataTest(unittest.TestCase):
+
+    def test_examples(self):
+        """
+            Checks that the R examples are parsed without R and equal the stored trees.
+        """
+        for name in ["R Iris", "R Diabetes"]:
+            tree = _parse_rpart_class(os.path.join(EXAMPLES, name, "input.RData"))
+            self.assertEqual(load_example(name), tree.to_json())
+
+    def test_read(self):
+        """
+            Checks the objects read from an RData file and that other files are rejected.
+        """
+        objects = read_rdata(os.path.join(EXAMPLES, "R Iris", "input.RData"))
+        fit = objects['fit']
+
+        self.assertEqual(['rpart'], fit.classes)
+        self.assertEqual(['setosa', 'versicolor', 'virginica'], fit.attr('ylevels').as_strings())
+        self.assertEqual(150, len(fit['where']))
+        self.assertEqual(fit['frame']['n'].as_array()[0], 150)
+        self.assertEqual((len(fit['frame']['n']), 8), fit['frame']['yval2'].as_array().shape)
+
+        with self.assertRaises(RDataException):
+            read_rdata(os.path.join(EXAMPLES, "Matlab Iris", "input.json"))
+
+    def test_unknown_feature(self):
+        """
+            Checks that a split on a variable which is not among the features is rejected.
+        """
+        fit = read_rdata(os.path.join(EXAMPLES, "R Iris", "input.RData"))['fit']
+        columns = fit['frame']
+        frame = _rpart_columns({
+            'var': columns['var'].as_strings(),
+            'n': columns['n'].as_array(),
+            'ncompete': columns['ncompete'].as_array(),
+            'nsurrogate': columns['nsurrogate'].as_array(),
+            'yval2': columns['yval2'].as_array()
+        }, len(columns['n']))
+        features = [name for name in fit['ordered'].names if name != 'Petal.Length']
+
+        with self.assertRaisesRegex(KeyError, 'Petal.Length'):
+            _rpart_tree(frame, fit['splits'].as_array(), features, fit.attr('ylevels').as_strings())
+
+
+class TreeArraysTest(unittest.TestCase):
+
+    def test_round_trip(self):
+        """
+            Checks that all example trees are converted to arrays and back without loss.
+        """
+        for name in ["Matlab Iris", "Matlab Fanny", "R Iris", "R Diabetes"]:
+            tree = load_example(name)
+            arrays = TreeArrays.from_json(tree)
+            self.assertEqual(tree, arrays.to_json())
+            self.assertEqual(-1, arrays.parent[0])
+            self.assertEqual(arrays.n_classes, len(tree['meta']['classes']))
+
+    def test_extra_keys(self):
+        """
+            Checks that keys which are not held by the arrays are kept.
+        """
+        leaf = {'children': [], 'type': 'leaf', 'samples': 1, 'distribution': [1, 0], 'vote': 0}
+        tree = {'meta': {}, 'tree': {
+            'children': [dict(leaf, note="left"), {'children': [], 'type': 'leaf', 'samples': 1}],
+            'type': 'root', 'samples': 2, 'distribution': [1, 1], 'vote': 0,
+            'split': {'feature': 0, 'operator': '<=', 'location': 0.5}
+        }}
+
+        arrays = TreeArrays.from_json(tree)
+        self.assertEqual([1, 2], [arrays.left[0], arrays.right[0]])
+        self.assertEqual(tree, arrays.to_json())
+
+        # the conversion does not change the arrays
+        self.assertEqual(tree, arrays.to_json())
+
+    def test_flat(self):
+        """
+            Checks that the examples are converted between the nested and the flat shape.
+        """
+        for name in ["Matlab Iris", "R Diabetes"]:
+            tree = load_example(name)
+            flat = flatten(tree)
+            self.assertEqual(2, json_version(json.dumps(flat).encode()))
+            self.assertEqual(1, json_version(json.dumps(tree).encode()))
+            self.assertEqual(tree, nest(flat))
+            self.assertEqual(tree, json.loads("".join(iterencode(flat))))
+            self.assertEqual(flat, TreeArrays.from_json(flat).to_flat())
+
+            # the streamed encoding equals the encoding of the whole tree
+            arrays = TreeArrays.from_json(tree)
+            self.assertEqual(json.dumps(arrays.to_flat()), "".join(iterencode(arrays, "flat")))
+            self.assertEqual(json.dumps(tree), "".join(iterencode(arrays, "nested")))
+
+    def test_deep(self):
+        """
+            Checks that a chain of splits deeper than the recursion limit is stored
+            in the flat shape and encoded in the nested shape.
+        """
+        import sys
+        depth = sys.getrecursionlimit() * 2
+
+        leaf = {'children': [], 'type': 'leaf', 'samples': 1, 'distribution': [1, 0], 'vote': 0}
+        nodes = []
+        for i in range(depth):
+            nodes.append(dict(leaf, type='root' if i == 0 else 'node', parent=2 * i - 2 if i > 0 else -1,
+                              children=[2 * i + 1, 2 * i + 2], split={'feature': 0, 'operator': '<', 'location': i}))
+            nodes.append(dict(leaf, parent=2 * i))
+        nodes.append(dict(leaf, parent=2 * depth - 2))
+        flat = {'version': 2, 'meta': {}, 'nodes': nodes}
+
+        flat = json.loads(json.dumps(flat))
+        arrays = TreeArrays.from_json(flat)
+        self.assertEqual(depth, arrays.stats()['depth'])
+        self.assertEqual(flat, arrays.to_flat())
+
+        encoded = "".join(iterencode(flat))
+        self.assertTrue(encoded.startswith('{"meta": {}, "tree": {"children": [{"children": [], "type": "leaf"'))
+        self.assertEqual(flat, flatten(nest(flat)))
+
+
+class BinaryTest(unittest.TestCase):
+
+    def test_round_trip(self):
+        """
+            Checks that trees are written and opened without loss, with the nodes in pre-order.
+        """
+        path = os.path.join(os.path.dirname(__file__), "tree.bin")
+        try:
+            for name in ["Matlab Fanny", "R Diabetes"]:
+                tree = load_example(name)
+                write_tree(TreeArrays.from_json(tree), path)
+
+                arrays = open_tree(path)
+                self.assertEqual(tree, arrays.to_json())
+                self.assertFalse(arrays.samples.flags.writeable)
+                self.assertTrue(all(arrays.end[i] > i for i in range(len(arrays))))
+        finally:
+            os.remove(path)
+
+    def test_subtree(self):
+        """
+            Checks that the subtrees of both children of the root equal the nested JSON.
+        """
+        tree = _parse_fitctree(os.path.join(EXAMPLES, "Matlab Fanny", "input.json"))
+        children = tree.to_json()['tree']['children']
+
+        for i, child in zip([tree.left[0], tree.right[0]], children):
+            subtree = tree.subtree(int(i)).to_json()['tree']
+            self.assertEqual('root', subtree.pop('type'))
+            self.assertEqual({key: value for key, value in child.items() if key != 'type'}, subtree)
+            self.assertEqual(tree.subtree(int(i)).stats()['samples'], child['samples'])
+
+
+class MembershipTest(unittest.TestCase):
+
+    def test_examples(self):
+        """
+            Checks that the training rows of each node add up to its number of samples,
+            for the rows passed through a Matlab tree and the rows given by rpart.
+        """
+        path = os.path.join(os.path.dirname(__file__), "rows.bin")
+        try:
+            for tree in [_parse_fitctree(os.path.join(EXAMPLES, "Matlab Iris", "input.json")),
+                         _parse_rpart_class(os.path.join(EXAMPLES, "R Iris", "input.RData"))]:
+                tree = tree.preorder()
+                write_membership(Membership.from_tree(tree), path)
+
+                membership = open_membership(path)
+                self.assertEqual(tree.samples.tolist(), membership.counts().tolist())
+                self.assertEqual(list(range(150)), sorted(membership[0].tolist()))
+
+                # the rows of a node are the rows of its children
+                left, right = int(tree.left[0]), int(tree.right[0])
+                self.assertEqual(sorted(membership[0].tolist()),
+                                 sorted(membership[left].tolist() + membership[right].tolist()))
+                self.assertEqual(0, len(membership.node_rows(0)))
+        finally:
+            os.remove(path)
+
+    def test_unused_rows(self):
+        """
+            Checks that unused rows are left out and that the ids of the rows are kept.
+        """
+        tree = TreeArrays.from_json(load_example("R Iris"))
+        tree.rows = np.array([1, -1, 2, 1, 4])
+        tree.row_ids = np.array([10, 11, 12, 13, 14])
+
+        membership = Membership.from_tree(tree)
+        self.assertEqual([10, 13], membership[1].tolist())
+        self.assertEqual([10, 13, 12, 14], membership[0].tolist())
+        self.assertIsNone(Membership.from_tree(TreeArrays.from_json(load_example("R Iris"))))
+
+
+class ExportTest(unittest.TestCase):
+
+    def test_examples(self):
+        """
+            Checks that the stored trees are valid exports in both shapes.
+        """
+        path = os.path.join(os.path.dirname(__file__), "export.json")
+        try:
+            for name in ["Matlab Fanny", "R Diabetes"]:
+                tree = load_example(name)
+                result = validate_export(os.path.join(EXAMPLES, name, "tree.json"))
+                self.assertEqual(('nested', tree['meta']), (result['shape'], result['meta']))
+                self.assertEqual(tree, _parse_export(os.path.join(EXAMPLES, name, "tree.json")).to_json())
+
+                with open(path, "w") as file:
+                    json.dump(flatten(tree), file)
+                self.assertEqual(('flat', result['nodes']), (validate_export(path, chunk_size=64)['shape'],
+                                                              validate_export(path)['nodes']))
+        finally:
+            os.remove(path)
+
+    def test_invalid(self):
+        """
+            Checks that invalid trees are rejected.
+        """
+        def leaf(node):
+            while node['children']:
+                node = node['children'][0]
+            return node
+
+        def flat_links(tree):
+            tree['nodes'][1]['parent'] = 2
+
+        tree = load_example("R Iris")
+        changes = [
+            lambda tree: leaf(tree['tree']).update(type='node'),
+            lambda tree: leaf(tree['tree'])['children'].append({'children': [], 'type': 'leaf'}),
+            lambda tree: leaf(tree['tree'])['distribution'].append(0),
+            lambda tree: tree['tree']['split'].update(feature=4),
+            lambda tree: tree['tree'].update(vote=3),
+            lambda tree: tree.pop('tree')
+        ]
+
+        path = os.path.join(os.path.dirname(__file__), "export.json")
+        try:
+            for change in changes:
+                invalid = json.loads(json.dumps(tree))
+                change(invalid)
+                with open(path, "w") as file:
+                    json.dump(invalid, file)
+                self.assertRaises(InvalidExportException, validate_export, path)
+
+            invalid = flatten(tree)
+            flat_links(invalid)
+            with open(path, "w") as file:
+                json.dump(invalid, file)
+            self.assertRaises(InvalidExportException, validate_export, path)
+
+            # truncated files and files with trailing data
+            for content in [json.dumps(tree)[:-10], json.dumps(tree) + "{}"]:
+                with open(path, "w") as file:
+                    file.write(content)
+                self.assertRaises(InvalidExportException, validate_export, path)
+        finally:
+            os.remove(path)
+
+
+class RegressionTest(unittest.TestCase):
+
+    @staticmethod
+    def subtree_means(parent, rows, y):
+        """ The mean of the targets of the rows in the subtree of each node. """
+        sums, counts = np.zeros(len(parent)), np.zeros(len(parent))
+        for node, target in zip(rows, y):
+            while node >= 0:
+                sums[node] += target
+                counts[node] += 1
+                node = parent[node]
+        return sums / counts
+
+    def test_fitrtree(self):
+        """
+            Checks a regression tree of Matlab's fitrtree, created from the Iris example with the
+            petal width as target, and that the histograms of the nodes add up to their samples.
+        """
+        fit = load_example("Matlab Iris", "input.json")
+        rows = _parse_fitctree(os.path.join(EXAMPLES, "Matlab Iris", "input.json")).rows
+        y = [row['Petal_Width'] for row in fit['X']]
+
+        for key in ['ClassNames', 'ClassCount', 'ClassProbability', 'NodeClass', 'ScoreTransform']:
+            del fit[key]
+        fit['Y'] = y
+        fit['NodeMean'] = self.subtree_means(np.asarray(fit['Parent']) - 1, rows, y).tolist()
+        fit['ResponseTransform'] = 'none'
+
+        path = os.path.join(os.path.dirname(__file__), "fitrtree.json")
+        try:
+            with open(path, "w") as file:
+                json.dump(fit, file)
+            self.assertEqual('json.matlab.fitrtree', sniff(path))
+            tree = _parse_fitrtree(path)
+        finally:
+            os.remove(path)
+
+        self.assertEqual('regression', tree.meta['type'])
+        self.assertTrue(np.allclose(fit['NodeMean'], tree.value))
+        self.assertEqual(fit['NodeSize'], tree.distribution.sum(axis=1).tolist())
+        self.assertEqual(len(tree.meta['bins']), tree.n_classes + 1)
+        self.assertEqual(len(tree.meta['classes']), tree.n_classes)
+        self.assertEqual(bin_index(np.asarray(tree.meta['bins']), tree.value).tolist(), tree.vote.tolist())
+
+        branch = np.flatnonzero(~tree.is_leaf)
+        self.assertEqual(tree.distribution[branch].tolist(),
+                         (tree.distribution[tree.left[branch]] + tree.distribution[tree.right[branch]]).tolist())
+
+        # the values are kept in the JSON and binary formats
+        self.assertEqual(tree.to_json(), TreeArrays.from_json(tree.to_json()).to_json())
+        path = os.path.join(os.path.dirname(__file__), "regression.bin")
+        try:
+            write_tree(tree, path)
+            self.assertEqual(tree.preorder().value.tolist(), open_tree(path).value.tolist())
+        finally:
+            os.remove(path)
+
+    def test_rpart(self):
+        """
+            Checks a regression tree of rpart (method anova), without and with the targets.
+        """
+        fit = read_rdata(os.path.join(EXAMPLES, "R Iris", "input.RData"))['fit']
+        columns = fit['frame']
+        rows, _ = _rpart_rows(fit['where'].as_array())
+        y = np.linspace(0, 1, len(rows))
+
+        parent = _parse_rpart_class(os.path.join(EXAMPLES, "R Iris", "input.RData")).parent
+        means = self.subtree_means(parent, rows, y)
+
+        frame = _rpart_columns({
+            'var': columns['var'].as_strings(),
+            'n': columns['n'].as_array(),
+            'ncompete': columns['ncompete'].as_array(),
+            'nsurrogate': columns['nsurrogate'].as_array(),
+            'yval': means
+        }, len(means))
+        tree = _rpart_tree(frame, fit['splits'].as_array(), fit['ordered'].names)
+
+        self.assertEqual('regression', tree.meta['type'])
+        self.assertEqual(['Samples'], tree.meta['classes'])
+        self.assertEqual(tree.samples.tolist(), tree.distribution[:, 0].tolist())
+        self.assertEqual(means.tolist(), [node['value'] for node in tree.to_flat()['nodes']])
+
+        tree.rows = rows
+        add_histograms(tree, y, n_bins=4)
+        self.assertEqual([[38, 37, 37, 38]], tree.distribution[:1].tolist())
+        self.assertEqual(tree.samples.tolist(), tree.distribution.sum(axis=1).tolist())
+        self.assertEqual(4, len(tree.meta['classes']))
+        validate = os.path.join(os.path.dirname(__file__), "regression.json")
+        try:
+            with open(validate, "w") as file:
+                json.dump(tree.to_json(), file)
+            self.assertEqual(len(tree), validate_export(validate)['nodes'])
+        finally:
+            os.remove(validate)
+
+
+class PruningTest(unittest.TestCase):
+
+    def test_sequence(self):
+        """
+            Checks that the pruning sequences of Matlab and rpart yield the subtrees of the
+            sequence, with one split less per level in Matlab and the splits of the cp table in rpart.
+        """
+        tree = _parse_fitctree(os.path.join(EXAMPLES, "Matlab Iris", "input.json"))
+        self.assertEqual('alpha', tree.meta['pruning']['parameter'])
+        self.assertEqual([9, 7, 5, 3, 1], pruning_sequence(tree)['nodes'])
+        self.assertEqual([9, 7, 5, 3, 1], [len(prune(tree, level)) for level in range(5)])
+        self.assertEqual(0, pruning_level(tree, 0.005))
+        self.assertEqual(2, pruning_level(tree, 0.2))
+        self.assertEqual(4, pruning_level(tree, 10))
+
+        fit = read_rdata(os.path.join(EXAMPLES, "R Diabetes", "input.RData"))['fit']
+        tree = _parse_rpart_class(os.path.join(EXAMPLES, "R Diabetes", "input.RData"))
+        nsplit = fit['cptable'].as_array()[::-1, 1]
+        self.assertEqual((2 * nsplit + 1).tolist(), pruning_sequence(tree)['nodes'])
+
+    def test_prune(self):
+        """
+            Checks the pruned tree: nodes that become leaves lose their split, the rows of
+            removed nodes move into their leaf and pruning keeps the pre-order.
+        """
+        tree = _parse_rpart_class(os.path.join(EXAMPLES, "R Diabetes", "input.RData")).preorder()
+        pruned = prune(tree, 4)
+
+        self.assertEqual(5, len(pruned))
+        self.assertEqual(pruned.to_json(), TreeArrays.from_json(pruned.to_json()).to_json())
+        self.assertEqual(pruned.end.tolist(), pruned.preorder().end.tolist())
+        self.assertTrue(np.all(pruned.feature[pruned.is_leaf] < 0))
+        self.assertEqual(pruned.samples.tolist(), Membership.from_tree(pruned).counts().tolist())
+
+        # the pruned tree keeps the levels above
+        self.assertEqual(prune(tree, 5).to_json(), prune(pruned, 5).to_json())
+
+        pruned.prune = None
+        with self.assertRaises(ValueError):
+            prune(pruned, 0)
+
+    def test_monotone(self):
+        """
+            Checks that no node becomes a leaf after its parent.
+        """
+        tree = TreeArrays.from_json(load_example("R Iris"))
+        add_pruning(tree, [1, 0, 2, 0, 0], 'cp', [0.1, 0.2, 0.3])
+        self.assertEqual([1, 0, 1, 0, 0], tree.prune.tolist())
+        self.assertEqual(1, len(prune(tree, 1)))
+
+
+class SklearnTest(unittest.TestCase):
+
+    def test_npz(self):
+        """
+            Checks that the arrays of a scikit-learn tree are parsed from stored and
+            compressed .npz files and that the files are detected.
+        """
+        import numpy as np
+
+        arrays = {
+            'children_left': np.array([1, -1, 3, -1, -1]),
+            'children_right': np.array([2, -1, 4, -1, -1]),
+            'feature': np.array([1, -2, 0, -2, -2]),
+            'threshold': np.array([0.5, -2, 1.5, -2, -2]),
+            'n_node_samples': np.array([10, 4, 6, 5, 1]),
+            # fractions as stored by newer versions of scikit-learn
+            'value': np.array([[[0.5, 0.5]], [[1, 0]], [[1 / 6, 5 / 6]], [[0, 1]], [[1, 0]]]),
+            'feature_names': np.array(['width', 'height'])
+        }
+
+        path = os.path.join(os.path.dirname(__file__), "sklearn.npz")
+        try:
+            for save in [np.savez, np.savez_compressed]:
+                save(path, **arrays)
+                self.assertEqual('npz.python.sklearn', sniff(path))
+
+                tree = _parse_sklearn(path).to_json()
+                self.assertEqual(['Width', 'Height'], tree['meta']['features'])
+                self.assertEqual(['Class 1', 'Class 2'], tree['meta']['classes'])
+                self.assertEqual({'feature': 1, 'operator': '<=', 'location': 0.5}, tree['tree']['split'])
+
+                right = tree['tree']['children'][1]
+                self.assertEqual([1, 5], right['distribution'])
+                self.assertEqual(1, right['vote'])
+                self.assertEqual([5, 1], [child['samples'] for child in right['children']])
+        finally:
+            os.remove(path)
+
+
+class EnsembleTest(unittest.TestCase):
+
+    DUMP = [
+        {"nodeid": 0, "depth": 0, "split": "petal_length", "split_condition": 2.5, "yes": 1, "no": 2,
+         "missing": 1, "gain": 10.0, "cover": 100.0, "children": [
+            {"nodeid": 1, "leaf": 0.5, "cover": 30.0},
+            {"nodeid": 2, "leaf": -0.25, "cover": 70.0}]},
+        {"nodeid": 0, "depth": 0, "split": "sepal_width", "split_condition": 3.0, "yes": 2, "no": 1,
+         "missing": 2, "gain": 5.0, "cover": 100.0, "children": [
+            {"nodeid": 1, "leaf": 0.1, "cover": 60.0},
+            {"nodeid": 2, "depth": 1, "split": "petal_length", "split_condition": 4.5, "yes": 3, "no": 4,
+             "missing": 3, "gain": 1.0, "cover": 40.0, "children": [
+                {"nodeid": 3, "leaf": -0.2, "cover": 10.0},
+                {"nodeid": 4, "leaf": 0.3, "cover": 30.0}]}]}
+    ]
+
+    def test_xgboost(self):
+        """
+            Checks that the trees of an XGBoost dump are read one after another and
+            stored in an ensemble file with a shared table of features.
+        """
+        path = os.path.join(os.path.dirname(__file__), "dump.json")
+        binary = os.path.join(os.path.dirname(__file__), "ensemble.bin")
+        try:
+            with open(path, "w") as file:
+                json.dump(self.DUMP, file, indent=2)
+            self.assertEqual('json.xgboost.dump', sniff(path))
+            self.assertEqual([0, 0], [tree['nodeid'] for tree in iter_array(path, ['nodeid'], chunk_size=16)])
+
+            trees = list(_iter_xgboost_dump(path))
+            self.assertEqual([3, 5], [len(tree) for tree in trees])
+
+            # the 'yes' branch is the first child, inner nodes hold the weighted mean
+            second = trees[1].to_json()['tree']
+            self.assertEqual({'feature': 1, 'operator': '<', 'location': 3.0}, second['split'])
+            self.assertEqual([40, 60], [child['samples'] for child in second['children']])
+            self.assertAlmostEqual(0.6 * 0.1 + 0.1 * -0.2 + 0.3 * 0.3, second['distribution'][0])
+
+            with EnsembleWriter(binary) as writer:
+                for tree in trees:
+                    writer.add(tree)
+
+            ensemble = open_ensemble(binary)
+            self.assertEqual(2, len(ensemble))
+            self.assertEqual(['Petal_length', 'Sepal_width'], ensemble.meta['features'])
+            self.assertEqual([3, 5], ensemble.stats()['sizes'])
+            for tree, stored in zip(trees, ensemble):
+                self.assertEqual(tree.to_json()['tree'], stored.to_json()['tree'])
+        finally:
+            for temp in [path, binary]:
+                if os.path.exists(temp):
+                    os.remove(temp)
+
+    def test_fitctree(self):
+        """
+            Checks that an array of Matlab trees is parsed into the trees of the examples.
+        """
+        names = ["Matlab Iris", "Matlab Fanny"]
+        path = os.path.join(os.path.dirname(__file__), "fitctree.json")
+        try:
+            with open(path, "w") as file:
+                json.dump([load_example(name, "input.json") for name in names], file)
+            self.assertEqual('json.matlab.fitctree', sniff(path))
+
+            trees = [tree.to_json() for tree in _iter_fitctree(path)]
+            self.assertEqual([load_example(name) for name in names], trees)
+        finally:
+            os.remove(path)
+
+
+    def test_regression(self):
+        """
+            Checks that regression trees of rpart with their own bins of the targets are
+            stored in one ensemble, and that only the object with the given name is read.
+        """
+        path = os.path.join(EXAMPLES, "R Iris", "input.RData")
+        fit = read_rdata(path)['fit']
+        rows, _ = _rpart_rows(fit['where'].as_array())
+        parent = _parse_rpart_class(path).parent
+
+        trees = []
+        for y in [np.linspace(0, 1, len(rows)), np.linspace(0, 1, len(rows)) ** 3]:
+            frame = _rpart_columns({
+                'var': fit['frame']['var'].as_strings(),
+                'n': fit['frame']['n'].as_array(),
+                'ncompete': fit['frame']['ncompete'].as_array(),
+                'nsurrogate': fit['frame']['nsurrogate'].as_array(),
+                'yval': RegressionTest.subtree_means(parent, rows, y)
+            }, len(parent))
+            tree = _rpart_tree(frame, fit['splits'].as_array(), fit['ordered'].names)
+            tree.rows = rows
+            add_histograms(tree, y, n_bins=4)
+            trees.append(tree)
+        self.assertNotEqual(trees[0].meta['classes'], trees[1].meta['classes'])
+
+        binary = os.path.join(os.path.dirname(__file__), "regression.bin")
+        try:
+            with EnsembleWriter(binary) as writer:
+                for tree in trees:
+                    writer.add(tree)
+
+            for tree, stored in zip(trees, open_ensemble(binary)):
+                self.assertEqual(tree.meta['classes'], stored.meta['classes'])
+                self.assertEqual(tree.meta['bins'], stored.meta['bins'])
+                self.assertEqual(tree.distribution.tolist(), stored.distribution.tolist())
+        finally:
+            if os.path.exists(binary):
+                os.remove(binary)
+
+        # classification trees of an ensemble share their classes
+        classification = _parse_rpart_class(path)
+        with self.assertRaises(ValueError):
+            with EnsembleWriter(binary) as writer:
+                writer.add(classification)
+                writer.add(dataclasses.replace(classification, meta={**classification.meta, 'classes': ['a']}))
+        os.remove(binary)
+
+        self.assertEqual(1, len(list(_iter_rpart(path, name='fit'))))
+        with self.assertRaises(KeyError):
+            next(_iter_rpart(path, name='other'))
+
+
+class TimingTest(unittest.TestCase):
+
+    def test_parse(self):
+        """
+            Checks that the stages of parsing the examples are recorded with their sizes.
+        """
+        # the training rows are passed through the Matlab tree in a stage of its own
+        for name, file, rows in [("Matlab Iris", "input.json", {'rows'}), ("R Diabetes", "input.RData", set())]:
+            path = os.path.join(EXAMPLES, name, file)
+            timings = ParseTimings()
+            tree = parse(path, timings=timings)
+
+            self.assertEqual({'sniff', 'load', 'extract', 'assemble', 'humanize', 'serialize'} | rows,
+                             {entry['name'] for entry in timings.stages})
+            self.assertEqual(os.path.getsize(path), timings.get('load')['bytes'])
+            self.assertEqual(len(TreeArrays.from_json(tree)), timings.get('serialize')['nodes'])
+            self.assertGreaterEqual(timings.seconds, sum(entry['seconds'] for entry in timings.stages))
+
+    def test_inactive(self):
+        """
+            Checks that stages outside of a parse are not recorded.
+        """
+        timings = ParseTimings()
+        with stage("load", bytes=1) as entry:
+            entry['nodes'] = 1
+        self.assertEqual([], timings.stages)
+
+        with timings.activate():
+            with stage("load", bytes=1):
+                pass
+        self.assertEqual(['load'], [entry['name'] for entry in timings.stages])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,114 @@
+#  CC-0 2023.
+#  David Strahl, University of Potsdam
+#  Forester: Interactive human-in-the-loop web-based visualization of machine learning trees
+
+"""
+    Timings of the stages of parsing a file.
+
+    The parsers mark their stages with :func:`stage`, for example
+
+    .. code-block:: python
+
+        with stage("load", bytes=os.path.getsize(path)):
+            fit = load_keys(path, FITCTREE_KEYS)
+
+    The stages are recorded into the :class:`ParseTimings` that is active while
+    :func:`parser.parse` runs. Without an active record, :func:`stage` does nothing,
+    so that the parsers can be called directly without any overhead.
+
+    The common stages are ``sniff`` (format detection), ``validate`` (checks of files that
+    are stored as they are), ``load`` (reading the file, e.g. the JSON decoding or R's
+    ``load``), ``extract`` (conversion of the fields into arrays), ``humanize`` (names of
+    the features and classes), ``assemble`` (creation of the tree), ``rows`` (the node of
+    each training row), ``sketch`` (the histograms of the targets of regression trees) and
+    ``serialize`` (conversion into the output format).
+"""
+
+import time
+import contextvars
+
+from contextlib import contextmanager
+
+# the record of the parse that is currently running
+_ACTIVE = contextvars.ContextVar("timings", default=None)
+
+
+class ParseTimings:
+    """
+        Record of the stages of parsing one file.
+
+        Attributes
+        ----------
+        path: str
+            The parsed file.
+        format: str
+            The format key of the file, once it is known.
+        stages: list
+            One entry per stage with its ``name``, its duration in ``seconds`` and
+            sizes such as the number of ``nodes`` or ``bytes``.
+        seconds: float
+            The wall time of the whole parse, which includes time outside the stages
+            (e.g. parsers that run in another process).
+    """
+
+    def __init__(self, path=None, format=None):
+        self.path = path
+        self.format = format
+        self.stages = []
+        self.seconds = 0.0
+
+    @contextmanager
+    def stage(self, name, **info):
+        """
+            Measures a stage. The yielded dictionary is stored with the stage, sizes
+            that are only known at the end of the stage can be added to it.
+        """
+        entry = {'name': name, 'seconds': 0.0, **info}
+        start = time.perf_counter()
+        try:
+            yield entry
+        finally:
+            entry['seconds'] = time.perf_counter() - start
+            self.stages.append(entry)
+
+    @contextmanager
+    def activate(self):
+        """ Records the stages of all parsers called within the context. """
+        token = _ACTIVE.set(self)
+        start = time.perf_counter()
+        try:
+            yield self
+        finally:
+            self.seconds += time.perf_counter() - start
+            _ACTIVE.reset(token)
+
+    def get(self, name):
+        """ Returns the first stage with the given name or `None`. """
+        return next((entry for entry in self.stages if entry['name'] == name), None)
+
+    def to_dict(self):
+        return {
+            'path': self.path,
+            'format': self.format,
+            'seconds': self.seconds,
+            'stages': self.stages
+        }
+
+    def __str__(self):
+        stages = ", ".join(f"{entry['name']} {entry['seconds']:.3f}s" for entry in self.stages)
+        return f"{self.format} in {self.seconds:.3f}s ({stages})"
+
+
+@contextmanager
+def stage(name, **info):
+    """
+        Measures a stage of the active :class:`ParseTimings`. Without an active record
+        the stage is not measured, the yielded dictionary is discarded.
+    """
+    timings = _ACTIVE.get()
+    if timings is None:
+        yield dict(info)
+        return
+
+    with timings.stage(name, **info) as entry:
+        yield entry
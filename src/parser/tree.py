@@ -0,0 +1,675 @@
+#  CC-0 2023.
+#  David Strahl, University of Potsdam
+#  Forester: Interactive human-in-the-loop web-based visualization of machine learning trees
+
+"""
+    Columnar representation of a binary tree.
+
+    Instead of one dictionary per node, the tree is stored as a set of arrays with
+    one entry per node. The root is always the first node. In the Forester JSON
+    format, the ``left`` child is the first and the ``right`` child the second
+    element of ``children``.
+
+    Trees are stored in JSON in one of two shapes. The nested shape (version 1) holds
+    the children of each node in the node itself. The flat shape (version 2) is a list
+    of nodes, in which ``children`` and ``parent`` are indices into the list:
+
+    .. code-block:: json
+
+        {"version": 2, "meta": {...}, "nodes": [
+            {"parent": -1, "children": [1, 2], "type": "root", ...},
+            {"parent": 0, "children": [], "type": "leaf", ...},
+            {"parent": 0, "children": [], "type": "leaf", ...}
+        ]}
+
+    The depth of the flat shape does not grow with the tree, so that it can be written
+    and read by the ``json`` module at any depth. The functions in this file convert
+    between both shapes without recursion.
+"""
+
+import re
+import json
+import numpy as np
+
+from dataclasses import dataclass, field
+
+# operators of a split, the operator array holds the index into this tuple
+OPERATORS = ('<', '>', '<=', '>=', '==', '!=')
+
+# keys of a node in the Forester JSON format that are held by the arrays
+NODE_KEYS = ('children', 'type', 'samples', 'distribution', 'vote', 'split', 'value', 'prune')
+
+# version of the flat shape, the nested shape has no version
+FLAT_VERSION = 2
+
+# the version is the first key of flat files
+_VERSION = re.compile(rb'\s*\{\s*"version"\s*:\s*(\d+)')
+
+# number of characters that are collected before they are yielded by iterencode
+_CHUNK_SIZE = 1 << 16
+
+
+@dataclass
+class TreeArrays:
+    """
+        A binary tree as a struct of arrays.
+
+        Missing values are ``-1`` for the integer arrays and ``NaN`` for thresholds.
+
+        Attributes
+        ----------
+        parent: np.ndarray
+            Index of the parent of each node, ``-1`` for the root.
+        left: np.ndarray
+            Index of the first child of each node.
+        right: np.ndarray
+            Index of the second child of each node.
+        feature: np.ndarray
+            Index of the feature of the split of each node.
+        operator: np.ndarray
+            Index of the operator of the split in :data:`OPERATORS`.
+        threshold: np.ndarray
+            Location of the split of each node.
+        samples: np.ndarray
+            Number of samples in each node.
+        vote: np.ndarray
+            Index of the predicted class of each node.
+        distribution: np.ndarray
+            Matrix of shape ``(n_nodes, n_classes)`` with the class distribution of each node.
+            For regression trees, the columns are the bins of the targets, see :mod:`parser.sketch`.
+        meta: dict
+            The meta information of the tree (type, features, classes and samples).
+        extra: dict
+            Keys of single nodes that are not held by the arrays, by node index.
+        end: np.ndarray
+            For trees in pre-order, the end (exclusive) of the subtree of each node, the
+            subtree of node ``i`` are the nodes ``i`` to ``end[i]``. `None` when not known.
+        rows: np.ndarray
+            The node in which each training row ended up, ``-1`` for rows that were not
+            used. `None` when not known, see :class:`parser.membership.Membership`.
+        row_ids: np.ndarray
+            The id of each training row, by default its position in `rows`.
+        value: np.ndarray
+            The predicted value of each node of a regression tree (the mean of its targets),
+            `None` for classification trees.
+        prune: np.ndarray
+            The level of pruning at which each node becomes a leaf, `None` when the pruning
+            sequence is not known, see :mod:`parser.pruning`.
+    """
+    parent: np.ndarray
+    left: np.ndarray
+    right: np.ndarray
+    feature: np.ndarray
+    operator: np.ndarray
+    threshold: np.ndarray
+    samples: np.ndarray
+    vote: np.ndarray
+    distribution: np.ndarray
+    meta: dict = field(default_factory=dict)
+    extra: dict = field(default_factory=dict)
+    end: np.ndarray = field(default=None, repr=False)
+    rows: np.ndarray = field(default=None, repr=False)
+    row_ids: np.ndarray = field(default=None, repr=False)
+    value: np.ndarray = field(default=None, repr=False)
+    prune: np.ndarray = field(default=None, repr=False)
+
+    def __len__(self):
+        return len(self.parent)
+
+    @property
+    def n_classes(self):
+        return self.distribution.shape[1]
+
+    @property
+    def is_leaf(self):
+        return (self.left < 0) & (self.right < 0)
+
+    @property
+    def types(self):
+        """ The type of each node (``root``, ``node`` or ``leaf``). """
+        types = np.where(self.is_leaf, 'leaf', 'node').astype(object)
+        types[0] = 'root'
+        return types
+
+    def levels(self):
+        """ Returns the indices of the nodes on each level of the tree, starting with the root. """
+        levels = []
+        frontier = np.zeros(1 if len(self) > 0 else 0, dtype=np.int64)
+        while len(frontier) > 0:
+            levels.append(frontier)
+            children = np.concatenate([self.left[frontier], self.right[frontier]])
+            frontier = children[children >= 0].astype(np.int64)
+        return levels
+
+    def subtree_sizes(self, levels=None):
+        """ Returns the number of nodes in the subtree of each node, including the node itself. """
+        size = np.ones(len(self), dtype=np.int64)
+        is_branch = ~self.is_leaf
+
+        # the sizes are summed up from the deepest level to the root
+        for level in reversed(levels if levels is not None else self.levels()):
+            branch = level[is_branch[level]]
+            size[branch] += size[self.left[branch]] + size[self.right[branch]]
+        return size
+
+    def preorder_positions(self):
+        """ Returns the position of each node in pre-order and the size of its subtree. """
+        levels = self.levels()
+        size = self.subtree_sizes(levels)
+        is_branch = ~self.is_leaf
+
+        # the position of the children follows from the position of the parent
+        # and the size of the left subtree
+        position = np.zeros(len(self), dtype=np.int64)
+        for level in levels:
+            branch = level[is_branch[level]]
+            position[self.left[branch]] = position[branch] + 1
+            position[self.right[branch]] = position[branch] + 1 + size[self.left[branch]]
+
+        return position, size
+
+    def preorder(self):
+        """
+        Returns the tree with its nodes in pre-order, where every subtree is a contiguous
+        range of nodes. The order of the children (``left`` before ``right``) is kept.
+        """
+        position, size = self.preorder_positions()
+
+        end = (position + size).astype(np.int32)
+        order = np.empty(len(self), dtype=np.int64)
+        order[position] = np.arange(len(self))
+
+        def relink(links):
+            links = links[order]
+            return np.where(links >= 0, position[links.clip(0)], -1).astype(np.int32)
+
+        return TreeArrays(
+            parent=relink(self.parent),
+            left=relink(self.left),
+            right=relink(self.right),
+            feature=self.feature[order],
+            operator=self.operator[order],
+            threshold=self.threshold[order],
+            samples=self.samples[order],
+            vote=self.vote[order],
+            distribution=self.distribution[order],
+            meta=self.meta,
+            extra={int(position[i]): extra for i, extra in self.extra.items()},
+            end=end[order],
+            rows=None if self.rows is None else np.where(self.rows >= 0, position[self.rows.clip(0)], -1),
+            row_ids=self.row_ids,
+            value=None if self.value is None else self.value[order],
+            prune=None if self.prune is None else self.prune[order]
+        )
+
+    def subtree(self, node):
+        """
+        Returns the subtree below a node as a new tree.
+
+        For trees in pre-order with a known ``end``, all arrays of the subtree are
+        views on the arrays of this tree, only the links are shifted.
+
+        Parameters
+        ----------
+        node: int
+            Index of the root of the subtree.
+        """
+        if not 0 <= node < len(self):
+            raise IndexError(f"Node {node} is not in the tree")
+
+        if self.end is None:
+            return self.preorder().subtree(int(self.preorder_positions()[0][node]))
+
+        start, stop = node, int(self.end[node])
+
+        def shift(links):
+            links = links[start:stop]
+            return np.where((links >= start) & (links < stop), links - start, -1).astype(np.int32)
+
+        meta = dict(self.meta)
+        meta['samples'] = int(self.samples[start])
+
+        return TreeArrays(
+            parent=shift(self.parent),
+            left=shift(self.left),
+            right=shift(self.right),
+            feature=self.feature[start:stop],
+            operator=self.operator[start:stop],
+            threshold=self.threshold[start:stop],
+            samples=self.samples[start:stop],
+            vote=self.vote[start:stop],
+            distribution=self.distribution[start:stop],
+            meta=meta,
+            extra={i - start: extra for i, extra in self.extra.items() if start <= i < stop},
+            end=self.end[start:stop] - start,
+            value=None if self.value is None else self.value[start:stop],
+            prune=None if self.prune is None else self.prune[start:stop]
+        )
+
+    def stats(self):
+        """
+        Returns summary statistics of the tree, computed on the arrays.
+
+        Returns
+        -------
+        dict:
+            Number of nodes and leaves, depth, number of samples and the class
+            distribution of the root.
+        """
+        return {
+            'nodes': len(self),
+            'leaves': int(self.is_leaf.sum()),
+            'depth': len(self.levels()) - 1,
+            'samples': int(self.samples[0]) if len(self) > 0 else 0,
+            'features': int(len(np.unique(self.feature[self.feature >= 0]))),
+            'distribution': self.distribution[0].tolist() if len(self) > 0 else []
+        }
+
+    @staticmethod
+    def links_from_preorder(is_branch):
+        """
+        Computes parent and child indices of a tree whose nodes are in pre-order.
+
+        Parameters
+        ----------
+        is_branch: array_like
+            Whether each node has two children, the first node is the root.
+
+        Returns
+        -------
+        tuple:
+            The ``parent``, ``left`` and ``right`` arrays.
+        """
+        n_nodes = len(is_branch)
+        parent = np.full(n_nodes, -1, dtype=np.int32)
+        children = np.full((n_nodes, 2), -1, dtype=np.int32)
+        filled = np.zeros(n_nodes, dtype=np.int8)
+
+        # the open branches, the top of the stack receives the next node
+        stack = [0] if n_nodes > 0 and is_branch[0] else []
+        for i, branch in enumerate(np.asarray(is_branch, dtype=bool).tolist()[1:], start=1):
+            if not stack:
+                raise ValueError("Nodes are not in pre-order, the tree is already complete")
+            j = stack[-1]
+            parent[i] = j
+            children[j, filled[j]] = i
+            filled[j] += 1
+            if filled[j] == 2:
+                stack.pop()
+            if branch:
+                stack.append(i)
+
+        if stack:
+            raise ValueError("Nodes are not in pre-order, some branches have less than two children")
+
+        return parent, children[:, 0], children[:, 1]
+
+    @classmethod
+    def from_json(cls, tree: dict):
+        """
+        Creates the arrays from a tree in the Forester JSON format.
+
+        Parameters
+        ----------
+        tree: dict
+            The tree with the keys ``meta`` and ``tree``, or a tree in the flat shape.
+
+        Returns
+        -------
+        TreeArrays:
+            The tree with the nodes in pre-order, trees in the flat shape keep their order.
+        """
+        if is_flat(tree):
+            return cls.from_flat(tree)
+
+        # walk the tree in pre-order without recursion
+        nodes, parents = [], []
+        stack = [(tree['tree'], -1)]
+        while stack:
+            node, parent = stack.pop()
+            children = node.get('children', [])
+            if len(children) not in (0, 2):
+                raise ValueError(f"Only binary trees are supported, found node with {len(children)} children")
+            parents.append(parent)
+            index = len(nodes)
+            nodes.append(node)
+            stack.extend((child, index) for child in reversed(children))
+
+        n_nodes = len(nodes)
+        parent = np.asarray(parents, dtype=np.int32)
+        left = np.full(n_nodes, -1, dtype=np.int32)
+        right = np.full(n_nodes, -1, dtype=np.int32)
+
+        # the first child directly follows its parent, the second child follows
+        # the last child of the parent in pre-order
+        for i in range(1, n_nodes):
+            j = parent[i]
+            if left[j] < 0:
+                left[j] = i
+            else:
+                right[j] = i
+
+        return cls._from_nodes(nodes, parent, left, right, tree.get('meta', {}))
+
+    @classmethod
+    def from_flat(cls, tree: dict):
+        """
+        Creates the arrays from a tree in the flat shape.
+
+        Parameters
+        ----------
+        tree: dict
+            The tree with the keys ``version``, ``meta`` and ``nodes``.
+
+        Returns
+        -------
+        TreeArrays:
+            The tree with the nodes in the order of the list.
+        """
+        nodes = tree['nodes']
+        n_nodes = len(nodes)
+
+        children = [node.get('children', []) for node in nodes]
+        if any(len(c) not in (0, 2) for c in children):
+            raise ValueError("Only binary trees are supported")
+
+        links = np.asarray([c or [-1, -1] for c in children], dtype=np.int32).reshape(n_nodes, 2)
+        parent = np.full(n_nodes, -1, dtype=np.int32)
+        is_branch = links[:, 0] >= 0
+        parent[links[is_branch, 0]] = np.flatnonzero(is_branch)
+        parent[links[is_branch, 1]] = np.flatnonzero(is_branch)
+
+        if n_nodes > 0 and parent[0] != -1:
+            raise ValueError("The root must be the first node of a flat tree")
+
+        return cls._from_nodes(nodes, parent, links[:, 0].copy(), links[:, 1].copy(), tree.get('meta', {}))
+
+    @classmethod
+    def _from_nodes(cls, nodes, parent, left, right, meta):
+        """ Creates the arrays from the node dictionaries and the links between them. """
+        n_nodes = len(nodes)
+        n_classes = max((len(node.get('distribution', ())) for node in nodes), default=0)
+        distribution = np.asarray([node.get('distribution', [0] * n_classes) for node in nodes]).reshape(n_nodes, n_classes)
+
+        splits = [node.get('split') for node in nodes]
+        has_value = any('value' in node for node in nodes)
+        has_prune = any('prune' in node for node in nodes)
+        arrays = cls(
+            parent=parent,
+            left=left,
+            right=right,
+            feature=np.asarray([s['feature'] if s else -1 for s in splits], dtype=np.int32),
+            operator=np.asarray([OPERATORS.index(s['operator']) if s else -1 for s in splits], dtype=np.int8),
+            threshold=np.asarray([s['location'] if s else np.nan for s in splits], dtype=float),
+            samples=np.asarray([node.get('samples', -1) for node in nodes], dtype=np.int64),
+            vote=np.asarray([node.get('vote', -1) for node in nodes], dtype=np.int32),
+            distribution=distribution,
+            meta=meta,
+            value=np.asarray([node.get('value', np.nan) for node in nodes], dtype=float) if has_value else None,
+            prune=np.asarray([node.get('prune', 0) for node in nodes], dtype=np.int32) if has_prune else None
+        )
+
+        # keep all values that can not be restored from the arrays
+        types = arrays.types
+        for i, node in enumerate(nodes):
+            extra = {key: value for key, value in node.items() if key not in NODE_KEYS and key != 'parent'}
+            if node.get('type') != types[i]:
+                extra['type'] = node.get('type')
+            if splits[i] and set(splits[i]) != {'feature', 'operator', 'location'}:
+                extra['split'] = splits[i]
+            missing = [key for key in ('samples', 'distribution', 'vote') if key not in node]
+            if missing:
+                extra['_missing'] = missing
+            if extra:
+                arrays.extra[i] = extra
+
+        return arrays
+
+    def _node_dicts(self, start=0, stop=None):
+        """ Creates the dictionary of each node in a range of nodes, without its children. """
+        stop = len(self) if stop is None else stop
+        nodes = slice(start, stop)
+
+        feature = self.feature[nodes]
+        has_split = feature >= 0
+        operators = np.asarray(OPERATORS, dtype=object)[self.operator[nodes].clip(0)]
+
+        types = np.where(self.is_leaf[nodes], 'leaf', 'node').astype(object)
+        if start == 0 and stop > 0:
+            types[0] = 'root'
+
+        dicts = [{
+            'children': [],
+            'type': t,
+            'samples': s,
+            'distribution': d,
+            'vote': v
+        } for t, s, d, v in zip(types.tolist(), self.samples[nodes].tolist(),
+                                self.distribution[nodes].tolist(), self.vote[nodes].tolist())]
+
+        # nodes of regression trees hold their predicted value
+        if self.value is not None:
+            value = self.value[nodes]
+            has_value = ~np.isnan(value)
+            for i, v in zip(np.flatnonzero(has_value).tolist(), value[has_value].tolist()):
+                dicts[i]['value'] = v
+
+        # the level at which each node is pruned, see parser.pruning
+        if self.prune is not None:
+            for node, p in zip(dicts, self.prune[nodes].tolist()):
+                node['prune'] = p
+
+        for i, f, o, l in zip(np.flatnonzero(has_split).tolist(), feature[has_split].tolist(),
+                              operators[has_split].tolist(), self.threshold[nodes][has_split].tolist()):
+            dicts[i]['split'] = {
+                'feature': f,
+                'operator': o,
+                'location': l
+            }
+
+        for i, extra in self.extra.items():
+            if start <= i < stop:
+                for key in extra.get('_missing', ()):
+                    dicts[i - start].pop(key)
+                dicts[i - start].update({key: value for key, value in extra.items() if key != '_missing'})
+
+        return dicts
+
+    def _flat_nodes(self, start=0, stop=None):
+        """ Creates the dictionaries of a range of nodes in the flat shape. """
+        stop = len(self) if stop is None else stop
+        dicts = self._node_dicts(start, stop)
+
+        left, right = self.left[start:stop].tolist(), self.right[start:stop].tolist()
+        for node, p, j, k in zip(dicts, self.parent[start:stop].tolist(), left, right):
+            node['parent'] = p
+            if j >= 0:
+                node['children'] = [j, k]
+
+        return dicts
+
+    def to_json(self) -> dict:
+        """
+        Converts the arrays into the Forester JSON format.
+
+        Returns
+        -------
+        dict:
+            The tree with the keys ``meta`` and ``tree``.
+        """
+        nodes = self._node_dicts()
+
+        # link the children to their parents
+        is_branch = ~self.is_leaf
+        for i, j, k in zip(np.flatnonzero(is_branch).tolist(), self.left[is_branch].tolist(),
+                           self.right[is_branch].tolist()):
+            nodes[i]['children'] = [nodes[j], nodes[k]]
+
+        return {'meta': self.meta, 'tree': nodes[0]}
+
+    def to_flat(self) -> dict:
+        """
+        Converts the arrays into the flat shape of the Forester JSON format.
+
+        Returns
+        -------
+        dict:
+            The tree with the keys ``version``, ``meta`` and ``nodes``.
+        """
+        return {'version': FLAT_VERSION, 'meta': self.meta, 'nodes': self._flat_nodes()}
+
+
+def as_json(tree, shape="nested"):
+    """
+    Converts the result of a parser into the Forester JSON format with the given shape
+    (`nested` or `flat`). With `arrays`, the result is converted into :class:`TreeArrays`.
+    """
+    if shape == "arrays":
+        return tree if isinstance(tree, TreeArrays) else TreeArrays.from_json(tree)
+    if shape == "flat":
+        return tree.to_flat() if isinstance(tree, TreeArrays) else flatten(tree)
+    if shape == "nested":
+        return tree.to_json() if isinstance(tree, TreeArrays) else nest(tree)
+    raise ValueError(f"Unknown shape {shape} of a tree")
+
+
+def is_flat(tree: dict) -> bool:
+    """ Whether a tree in the Forester JSON format has the flat shape. """
+    return tree.get('version', 1) >= FLAT_VERSION and 'nodes' in tree
+
+
+def json_version(data: bytes) -> int:
+    """ Returns the version of a tree file from its first bytes, without decoding the file. """
+    match = _VERSION.match(data[:256])
+    return int(match.group(1)) if match is not None else 1
+
+
+def flatten(tree: dict) -> dict:
+    """
+    Converts a tree from the nested into the flat shape. The nodes are numbered in
+    pre-order, all keys of the nodes are kept.
+    """
+    if is_flat(tree):
+        return tree
+
+    nodes = []
+    stack = [(tree['tree'], -1)] if tree.get('tree') is not None else []
+    while stack:
+        node, parent = stack.pop()
+        index = len(nodes)
+        children = node.get('children', [])
+
+        flat = {key: value for key, value in node.items() if key != 'children'}
+        flat['parent'] = parent
+        flat['children'] = []
+        if parent >= 0:
+            nodes[parent]['children'].append(index)
+        nodes.append(flat)
+
+        stack.extend((child, index) for child in reversed(children))
+
+    return {'version': FLAT_VERSION, 'meta': tree.get('meta', {}), 'nodes': nodes}
+
+
+def nest(tree: dict) -> dict:
+    """
+    Converts a tree from the flat into the nested shape.
+
+    The nested dictionaries are created without recursion, but they can only be
+    encoded by the ``json`` module up to the recursion limit. Use :func:`iterencode`
+    to encode deep trees.
+    """
+    if not is_flat(tree):
+        return tree
+
+    nodes = [{key: value for key, value in node.items() if key != 'parent'} for node in tree['nodes']]
+    for node in nodes:
+        node['children'] = [nodes[child] for child in node.get('children', [])]
+
+    return {'meta': tree.get('meta', {}), 'tree': nodes[0] if nodes else None}
+
+
+def iterencode(tree, shape="nested"):
+    """
+    Encodes a tree in the Forester JSON format without recursion and without creating
+    the whole document in memory.
+
+    Parameters
+    ----------
+    tree: dict or TreeArrays
+        The tree in the flat or the nested shape or as arrays.
+    shape: str
+        The shape of the encoded tree, either ``nested`` or ``flat``. The flat shape
+        is encoded in batches of nodes, directly from the arrays.
+
+    Yields
+    ------
+    str:
+        Parts of the JSON document, which can be joined or written to a file.
+    """
+    if shape == "flat":
+        yield from _iterencode_flat(tree)
+    elif shape == "nested":
+        yield from _iterencode_nested(tree.to_flat() if isinstance(tree, TreeArrays) else tree)
+    else:
+        raise ValueError(f"Unknown shape {shape} of a tree")
+
+
+def dump(tree, file, shape="flat"):
+    """ Writes a tree into an open text file, see :func:`iterencode`. """
+    for part in iterencode(tree, shape):
+        file.write(part)
+
+
+def _iterencode_flat(tree):
+    if isinstance(tree, TreeArrays):
+        meta, n_nodes, batch = tree.meta, len(tree), tree._flat_nodes
+    else:
+        tree = flatten(tree)
+        meta, n_nodes = tree.get('meta', {}), len(tree['nodes'])
+        batch = lambda start, stop: tree['nodes'][start:stop]
+
+    # the number of nodes per batch is chosen to give parts of about the chunk size
+    step = max(1, _CHUNK_SIZE // 128)
+
+    yield f'{{"version": {FLAT_VERSION}, "meta": {json.dumps(meta)}, "nodes": ['
+    for start in range(0, n_nodes, step):
+        part = json.dumps(batch(start, min(start + step, n_nodes)))[1:-1]
+        yield part if start == 0 else ', ' + part
+    yield ']}'
+
+
+def _iterencode_nested(tree: dict):
+    flat = flatten(tree)
+    nodes = flat['nodes']
+
+    parts = ['{"meta": ', json.dumps(flat.get('meta', {})), ', "tree": ']
+    size = 0
+
+    # the stack holds nodes that are still to be encoded and closing parts of encoded nodes
+    stack = [0] if nodes else ['null']
+    while stack:
+        item = stack.pop()
+        if isinstance(item, str):
+            parts.append(item)
+            size += len(item)
+        else:
+            node = nodes[item]
+            rest = json.dumps({key: value for key, value in node.items() if key not in ('children', 'parent')})
+            children = node.get('children', [])
+
+            parts.append('{"children": [')
+            stack.append(']' + (', ' + rest[1:] if rest != '{}' else '}'))
+            for k, child in enumerate(reversed(children)):
+                stack.append(child)
+                if k < len(children) - 1:
+                    stack.append(', ')
+
+            size += len(rest)
+
+        if size >= _CHUNK_SIZE:
+            yield ''.join(parts)
+            parts, size = [], 0
+
+    parts.append('}')
+    yield ''.join(parts)
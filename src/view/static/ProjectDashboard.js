@@ -317,7 +317,8 @@ ProjectCreationDialog = {
           .data(formats)
           .enter()
           .append("option")
-          .text(format => format.vendor + " - " + format.origin)
+          .text(format => format.vendor + " - " + format.origin + (format.type === "mat" ? " (MAT-file)" : "")
+                          + (format.ensemble ? " (ensemble)" : ""))
 
         // call format change listener once to add note for the default selection
         onFormatChange()